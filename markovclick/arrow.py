@@ -0,0 +1,226 @@
+"""
+Functions for sessionising and counting transitions in clickstream data
+held in Arrow tables or Parquet datasets, without converting to ``pandas``.
+
+Requires the optional ``pyarrow`` dependency.
+"""
+
+import numpy as np
+from markovclick.models import MarkovClickstream
+from markovclick.profiling import profile_stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError as err:
+    raise ImportError(
+        'markovclick.arrow requires pyarrow, which can be installed with '
+        '`pip install pyarrow`.'
+    ) from err
+
+
+_UNITS_PER_SECOND = {'s': 1, 'ms': 10 ** 3, 'us': 10 ** 6, 'ns': 10 ** 9}
+
+
+def read_clicks(source, unique_id_col: str, datetime_col: str,
+                page_col: str, start=None, end=None, filter_expr=None,
+                partitioning='hive') -> pa.Table:
+    """
+    Reads only the unique identifier, timestamp and page columns from a
+    Parquet file, directory of partitioned Parquet files or Arrow dataset.
+    The ``start`` and ``end`` bounds are pushed down to the scan, so that row
+    groups and partitions outside of the time window are skipped.
+
+    Args:
+        source: Path, list of paths or ``pyarrow.dataset.Dataset`` to read.
+        unique_id_col (str): Column name of unique identifier, e.g.
+            ``cookie_id``
+        datetime_col (str): Column name of timestamp column.
+        page_col (str): Column name of page column.
+        start (datetime, optional): Defaults to None. Earliest timestamp
+            (inclusive) to read.
+        end (datetime, optional): Defaults to None. Latest timestamp
+            (exclusive) to read.
+        filter_expr (pyarrow.dataset.Expression, optional): Defaults to None.
+            Additional filter to push down to the scan, e.g. on a
+            partitioning column.
+        partitioning (str, optional): Defaults to 'hive'. Partitioning scheme
+            of the dataset, passed to ``pyarrow.dataset.dataset()``.
+
+    Returns:
+        pa.Table: Arrow table containing the three columns.
+    """
+    if isinstance(source, ds.Dataset):
+        dataset = source
+    else:
+        dataset = ds.dataset(source, format='parquet',
+                             partitioning=partitioning)
+
+    expression = filter_expr
+    for bound, compare in [(start, pc.greater_equal), (end, pc.less)]:
+        if bound is None:
+            continue
+        field_type = dataset.schema.field(datetime_col).type
+        bound_expr = compare(ds.field(datetime_col),
+                             pa.scalar(bound, type=field_type))
+        expression = bound_expr if expression is None else (
+            expression & bound_expr
+        )
+
+    return dataset.to_table(
+        columns=[unique_id_col, datetime_col, page_col], filter=expression
+    )
+
+
+def _validate_columns(table: pa.Table, unique_id_col: str,
+                      datetime_col: str):
+    """
+    Checks the unique identifier and timestamp columns are present in the
+    table, and that the timestamp column is of a timestamp type.
+    """
+    if unique_id_col not in table.column_names:
+        raise ValueError("Unique ID column name not in table.")
+    if datetime_col not in table.column_names or not pa.types.is_timestamp(
+            table.schema.field(datetime_col).type
+    ):
+        raise TypeError("Datetime column name should be string referring "
+                        "to a timestamp column.")
+
+
+def sessionise_table(table: pa.Table, unique_id_col: str, datetime_col: str,
+                     session_timeout: int = 30,
+                     session_col: str = 'session_id',
+                     profiler=None) -> pa.Table:
+    """
+    Sessionises clickstream data held in an Arrow table. Clicks are sorted
+    by unique identifier and timestamp, and a new session begins whenever the
+    unique identifier changes or the time since the previous click exceeds
+    ``session_timeout``. Clicks with a null unique identifier or timestamp
+    cannot be placed in a session, and are dropped.
+
+    Args:
+        table (pa.Table): Arrow table of clickstream data.
+        unique_id_col (str): Column name of unique identifier, e.g.
+            ``cookie_id``
+        datetime_col (str): Column name of timestamp column.
+        session_timeout (int, optional): Defaults to 30. Maximum time in
+            minutes after which a session is broken.
+        session_col (str, optional): Defaults to 'session_id'. Name of the
+            column to store the session IDs in.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record each stage.
+
+    Returns:
+        pa.Table: Table sorted by unique identifier and timestamp, with an
+        ``int64`` column of session IDs numbered from 0.
+    """
+    _validate_columns(table, unique_id_col, datetime_col)
+    table = table.filter(pc.and_(pc.is_valid(table[unique_id_col]),
+                                 pc.is_valid(table[datetime_col])))
+    n_rows = table.num_rows
+
+    with profile_stage(profiler, 'sort_clicks', n_items=n_rows):
+        order = pc.sort_indices(table, sort_keys=[
+            (unique_id_col, 'ascending'), (datetime_col, 'ascending')
+        ])
+        table = table.take(order)
+
+    with profile_stage(profiler, '_add_session_boundaries', n_items=n_rows):
+        new_session = np.ones(n_rows, dtype=bool)
+        if n_rows > 1:
+            uniq_ids = table[unique_id_col]
+            new_session[1:] = pc.not_equal(
+                uniq_ids[1:], uniq_ids[:-1]
+            ).to_numpy()
+            unit = table.schema.field(datetime_col).type.unit
+            timestamps = pc.cast(table[datetime_col], pa.int64()).to_numpy()
+            timeout = session_timeout * 60 * _UNITS_PER_SECOND[unit]
+            new_session[1:] |= np.diff(timestamps) > timeout
+
+    with profile_stage(profiler, 'assign_session_ids', n_items=n_rows):
+        session_ids = np.cumsum(new_session, dtype=np.int64) - 1
+
+    return table.append_column(session_col, pa.array(session_ids))
+
+
+def count_transitions(table: pa.Table, page_col: str,
+                      session_col: str = 'session_id',
+                      profiler=None) -> tuple:
+    """
+    Counts the transitions between pages in a sessionised Arrow table, such
+    as that returned by ``sessionise_table()``. Pages are dictionary encoded,
+    so that counting operates on integer codes rather than strings. Rows
+    with a null page or session are ignored.
+
+    Args:
+        table (pa.Table): Arrow table, sorted by session and time.
+        page_col (str): Column name of page column.
+        session_col (str, optional): Defaults to 'session_id'. Column name of
+            session ID column.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record each stage.
+
+    Returns:
+        tuple: Matrix of transition counts, and sorted list of pages
+        corresponding to its rows and columns.
+    """
+    # Clicks without a page or session are dropped, as if they had not been
+    # logged
+    table = table.filter(pc.and_(pc.is_valid(table[page_col]),
+                                 pc.is_valid(table[session_col])))
+    with profile_stage(profiler, 'get_unique_pages',
+                       n_items=table.num_rows):
+        encoded = table[page_col].combine_chunks().dictionary_encode()
+        dictionary = encoded.dictionary
+        sort_order = pc.sort_indices(dictionary).to_numpy()
+        ranks = np.empty(len(dictionary), dtype=np.int64)
+        ranks[sort_order] = np.arange(len(dictionary))
+        pages = dictionary.take(pa.array(sort_order)).to_pylist()
+        codes = ranks[encoded.indices.to_numpy()]
+
+    with profile_stage(profiler, 'populate_count_matrix',
+                       n_items=table.num_rows):
+        n_pages = len(pages)
+        sessions = table[session_col].to_numpy()
+        same_session = sessions[1:] == sessions[:-1]
+        flat = codes[:-1][same_session] * n_pages + codes[1:][same_session]
+        count_matrix = np.bincount(
+            flat, minlength=n_pages * n_pages
+        ).reshape(n_pages, n_pages).astype(float)
+
+    return count_matrix, pages
+
+
+def fit_markov_clickstream(table: pa.Table, unique_id_col: str,
+                           datetime_col: str, page_col: str,
+                           session_timeout: int = 30,
+                           profiler=None) -> MarkovClickstream:
+    """
+    Sessionises an Arrow table of clicks and fits a ``MarkovClickstream``
+    to the transitions within the sessions.
+
+    Args:
+        table (pa.Table): Arrow table of clickstream data, such as that
+            returned by ``read_clicks()``.
+        unique_id_col (str): Column name of unique identifier, e.g.
+            ``cookie_id``
+        datetime_col (str): Column name of timestamp column.
+        page_col (str): Column name of page column.
+        session_timeout (int, optional): Defaults to 30. Maximum time in
+            minutes after which a session is broken.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record each stage.
+
+    Returns:
+        MarkovClickstream: Markov chain fitted to the sessionised clicks.
+    """
+    sessionised = sessionise_table(
+        table, unique_id_col, datetime_col, session_timeout,
+        profiler=profiler
+    )
+    count_matrix, pages = count_transitions(
+        sessionised, page_col, profiler=profiler
+    )
+    return MarkovClickstream.from_counts(count_matrix, pages,
+                                         profiler=profiler)
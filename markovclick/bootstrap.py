@@ -0,0 +1,275 @@
+"""
+Session-level bootstrap confidence intervals for the transition
+probabilities, PageRank scores and route probabilities of a Markov chain.
+"""
+
+import numpy as np
+import pandas as pd
+from markovclick.models import MarkovClickstream
+from markovclick.profiling import profile_stage
+from markovclick.utils.helpers import (
+    WORKER_DATA, encode_clickstreams, encode_session_transitions,
+    encode_transitions, map_tasks, unique_pages
+)
+
+
+def _replicate_probs(replicates) -> np.ndarray:
+    """
+    Computes the transition probabilities of a chunk of bootstrap replicates
+    from the session transition counts of a worker process.
+
+    Each replicate draws ``n`` sessions with replacement, i.e. weights each
+    session by a draw from a multinomial distribution with ``n`` trials and
+    equal probabilities, and sums the weighted session counts.
+
+    Returns:
+        np.ndarray: Matrix of shape ``(replicates, transitions)``.
+        Probabilities of transitions from pages which were not drawn in a
+        replicate are NaN.
+    """
+    data = WORKER_DATA
+    n_sessions = data['n_sessions']
+    n_transitions = len(data['from_pages'])
+    probs = np.empty((len(replicates), n_transitions), dtype=np.float32)
+    for i, replicate in enumerate(replicates):
+        random_state = np.random.default_rng([data['entropy'], replicate])
+        weights = np.bincount(
+            random_state.integers(0, n_sessions, n_sessions),
+            minlength=n_sessions
+        )
+        counts = np.bincount(
+            data['columns'],
+            weights=weights[data['sessions']] * data['counts'],
+            minlength=n_transitions
+        )
+        totals = np.bincount(data['from_pages'], weights=counts,
+                             minlength=data['n_pages'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            probs[i] = counts / totals[data['from_pages']]
+    return probs
+
+
+def _replicate_pageranks(args) -> np.ndarray:
+    """
+    Computes the PageRank scores of a chunk of bootstrap replicates from
+    their transition probabilities.
+    """
+    probs, pages, from_pages, to_pages, max_nodes, pr_kwargs = args
+    n_pages = len(pages)
+    pageranks = np.empty((len(probs), n_pages))
+    for i, replicate_probs in enumerate(probs):
+        prob_matrix = np.zeros((n_pages, n_pages))
+        prob_matrix[from_pages, to_pages] = np.nan_to_num(replicate_probs)
+        model = MarkovClickstream.from_counts(prob_matrix, pages)
+        scores = model.calculate_pagerank(max_nodes=max_nodes,
+                                          pr_kwargs=pr_kwargs)[1]
+        pageranks[i] = [scores[page] for page in pages]
+    return pageranks
+
+
+class SessionBootstrap:
+    """
+    Estimates confidence intervals for a Markov chain by resampling whole
+    sessions (clickstreams) with replacement.
+
+    Rather than refitting a ``MarkovClickstream`` to each resampled list of
+    clickstreams, each session's transition counts are held as a sparse
+    vector, and each replicate re-weights the sessions with multinomial
+    weights and sums their counts. Replicates are computed in parallel
+    across processes, and the same ``random_state`` gives the same
+    replicates whatever the value of ``n_jobs``.
+
+    The transition probabilities of every replicate are held as a float32
+    matrix of shape ``(n_replicates, transitions)``, over the transitions
+    observed in the clickstreams.
+
+    Args:
+        clickstream_list (list): List of clickstreams, one per session.
+        n_replicates (int, optional): Defaults to 1000. Number of bootstrap
+            replicates.
+        n_jobs (int, optional): Defaults to 1. If 2 or higher, replicates
+            are computed in parallel across this many processes.
+        random_state (int, optional): Defaults to None. Seed for the
+            resampling.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record each stage.
+    """
+
+    def __init__(self, clickstream_list: list, n_replicates: int = 1000,
+                 n_jobs: int = 1, random_state: int = None,
+                 profiler=None) -> None:
+        self.n_replicates = n_replicates
+        self.n_jobs = n_jobs
+        self.profiler = profiler
+        self._entropy = np.random.SeedSequence(random_state).entropy
+        self._replicate_probs = None
+
+        with profile_stage(self.profiler, 'get_unique_pages',
+                           n_items=len(clickstream_list)):
+            self.pages = unique_pages(clickstream_list)
+        with profile_stage(self.profiler, 'populate_count_matrix',
+                           n_items=len(clickstream_list)):
+            self._encode(clickstream_list)
+
+    def _encode(self, clickstream_list: list):
+        """
+        Encodes the clickstreams as sparse vectors of transition counts over
+        the transitions observed.
+        """
+        n_pages = len(self.pages)
+        page_index = {page: i for i, page in enumerate(self.pages)}
+        sessions, flat, counts = encode_session_transitions(
+            *encode_clickstreams(clickstream_list, page_index), n_pages
+        )
+        transitions, columns = np.unique(flat, return_inverse=True)
+        self._data = {
+            'n_sessions': len(clickstream_list),
+            'n_pages': n_pages,
+            'sessions': sessions,
+            'columns': columns,
+            'counts': counts.astype(float),
+            'from_pages': transitions // max(n_pages, 1),
+            'entropy': self._entropy,
+        }
+        self._to_pages = transitions % max(n_pages, 1)
+        transition_counts = np.bincount(columns, weights=counts,
+                                        minlength=len(transitions))
+        totals = np.bincount(self._data['from_pages'],
+                             weights=transition_counts, minlength=n_pages)
+        self._probs = transition_counts / totals[self._data['from_pages']]
+
+    def _chunks(self, n_items: int) -> list:
+        """
+        Splits a range of items into one chunk per process.
+        """
+        return [chunk for chunk in np.array_split(
+            np.arange(n_items), max(self.n_jobs, 1)
+        ) if len(chunk)]
+
+    @property
+    def replicate_probs(self) -> np.ndarray:
+        """
+        Transition probabilities of every replicate, of shape
+        ``(n_replicates, transitions)``, computed on first access
+        """
+        if self._replicate_probs is None:
+            with profile_stage(self.profiler, 'bootstrap_replicates',
+                               n_items=self.n_replicates):
+                self._replicate_probs = np.concatenate(map_tasks(
+                    _replicate_probs, self._chunks(self.n_replicates),
+                    self.n_jobs, self._data
+                ))
+        return self._replicate_probs
+
+    @staticmethod
+    def _bounds(values: np.ndarray, confidence: float) -> tuple:
+        """
+        Returns the lower and upper percentile bounds of replicate values,
+        ignoring NaN replicates.
+        """
+        if not 0 < confidence < 1:
+            raise ValueError('Argument `confidence` must be between 0 and 1.')
+        tail = (1 - confidence) / 2
+        lower, upper = np.nanquantile(values, [tail, 1 - tail], axis=0)
+        return lower, upper
+
+    def transition_intervals(self, confidence: float = 0.95) -> pd.DataFrame:
+        """
+        Calculates percentile confidence intervals for the probability of
+        every observed transition.
+
+        Args:
+            confidence (float, optional): Defaults to 0.95. Confidence level
+                of the intervals.
+
+        Returns:
+            pd.DataFrame: DataFrame with columns ``from_page``, ``to_page``,
+            ``prob``, ``lower`` and ``upper``.
+        """
+        lower, upper = self._bounds(self.replicate_probs, confidence)
+        pages = np.asarray(self.pages, dtype=object)
+        return pd.DataFrame({
+            'from_page': pages[self._data['from_pages']],
+            'to_page': pages[self._to_pages],
+            'prob': self._probs,
+            'lower': lower,
+            'upper': upper,
+        })
+
+    def route_intervals(self, routes: list,
+                        confidence: float = 0.95) -> pd.DataFrame:
+        """
+        Calculates percentile confidence intervals for the probability of
+        each of a list of routes, i.e. the product of the probabilities of
+        its transitions, as given by ``MarkovClickstream.calc_prob_to_page``.
+
+        Args:
+            routes (list): List of routes, each a list of pages.
+            confidence (float, optional): Defaults to 0.95. Confidence level
+                of the intervals.
+
+        Returns:
+            pd.DataFrame: DataFrame with a row for each route, and columns
+            ``prob``, ``lower`` and ``upper``.
+        """
+        n_pages = len(self.pages)
+        page_index = {page: i for i, page in enumerate(self.pages)}
+        from_pages, to_pages, route_index = encode_transitions(routes,
+                                                               page_index)
+        transitions = self._data['from_pages'] * n_pages + self._to_pages
+        flat = from_pages * n_pages + to_pages
+        columns = np.searchsorted(transitions, flat)
+        columns[columns == len(transitions)] = 0
+        observed = transitions[columns] == flat if len(transitions) else \
+            np.zeros(len(flat), dtype=bool)
+
+        def route_probs(probs):
+            transition_probs = np.where(observed, probs[..., columns], 0)
+            log_probs = np.log(transition_probs.astype(float))
+            totals = np.zeros(probs.shape[:-1] + (len(routes),))
+            np.add.at(totals, (..., route_index), log_probs)
+            return np.exp(totals)
+
+        with np.errstate(divide='ignore'):
+            probs = route_probs(self._probs)
+            lower, upper = self._bounds(route_probs(self.replicate_probs),
+                                        confidence)
+        return pd.DataFrame({'prob': probs, 'lower': lower, 'upper': upper})
+
+    def pagerank_intervals(self, confidence: float = 0.95,
+                           max_nodes: int = 2,
+                           pr_kwargs: dict = None) -> pd.DataFrame:
+        """
+        Calculates percentile confidence intervals for the PageRank score of
+        each page, as given by ``MarkovClickstream.calculate_pagerank``.
+
+        Args:
+            confidence (float, optional): Defaults to 0.95. Confidence level
+                of the intervals.
+            max_nodes (int, optional): Defaults to 2. See
+                ``MarkovClickstream.calculate_pagerank``.
+            pr_kwargs (dict, optional): Defaults to None. See
+                ``MarkovClickstream.calculate_pagerank``.
+
+        Returns:
+            pd.DataFrame: DataFrame indexed by page, with columns
+            ``pagerank``, ``lower`` and ``upper``.
+        """
+        model_args = (self.pages, self._data['from_pages'], self._to_pages,
+                      max_nodes, pr_kwargs or {})
+        replicate_probs = self.replicate_probs
+        with profile_stage(self.profiler, 'bootstrap_pagerank',
+                           n_items=self.n_replicates):
+            pagerank = _replicate_pageranks(
+                (self._probs[None, :],) + model_args
+            )[0]
+            replicates = np.concatenate(map_tasks(
+                _replicate_pageranks,
+                [(replicate_probs[chunk],) + model_args
+                 for chunk in self._chunks(self.n_replicates)],
+                self.n_jobs
+            ))
+        lower, upper = self._bounds(replicates, confidence)
+        return pd.DataFrame({
+            'pagerank': pagerank, 'lower': lower, 'upper': upper,
+        }, index=self.pages)
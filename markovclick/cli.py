@@ -0,0 +1,424 @@
+"""
+Command line interface, which runs the batch pipeline from click logs to a
+saved model: reading CSV or Parquet files, sessionising, counting
+transitions and fitting a ``MarkovClickstream``.
+
+Each input file is treated as a partition, which is sessionised and counted
+independently, so sessions spanning two files are split. The counts of each
+partition are checkpointed, so that a failed run can be resumed without
+recounting the partitions already completed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from markovclick.models import MarkovClickstream, OTHER_PAGE
+from markovclick.preprocessing import Sessionise
+from markovclick.profiling import Profiler, StageStats, profile_stage
+from markovclick.utils.sketch import select_pages
+
+
+_PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+
+def _read_chunks(path: str, columns: list, datetime_col: str,
+                 chunk_size: int, file_format: str = None):
+    """
+    Reads the given columns of a CSV or Parquet file in chunks of rows.
+    """
+    if file_format is None:
+        file_format = 'parquet' if path.endswith(_PARQUET_EXTENSIONS) \
+            else 'csv'
+    if file_format == 'csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size,
+                               parse_dates=[datetime_col])
+        return
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as err:
+        raise ImportError(
+            'Reading Parquet files requires pyarrow, which can be installed '
+            'with `pip install pyarrow`.'
+        ) from err
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size,
+                                                   columns=columns):
+        yield batch.to_pandas()
+
+
+def _to_datetime(values: pd.Series) -> pd.Series:
+    """
+    Parses timestamps, converting them to UTC if they have differing UTC
+    offsets, which cannot be held in a single timezone aware column.
+    """
+    parsed = pd.to_datetime(values)
+    if not pd.api.types.is_datetime64_any_dtype(parsed):
+        parsed = pd.to_datetime(values, utc=True)
+    return parsed
+
+
+def _localize(timestamp, timezone) -> pd.Timestamp:
+    """
+    Localizes a timestamp without a timezone to the timezone of the
+    timestamps it is compared with.
+    """
+    timestamp = pd.Timestamp(timestamp)
+    if timezone is not None and timestamp.tzinfo is None:
+        return timestamp.tz_localize(timezone)
+    return timestamp
+
+
+def read_partition(path: str, unique_id_col: str, datetime_col: str,
+                   page_col: str, start=None, end=None,
+                   chunk_size: int = 1_000_000,
+                   file_format: str = None) -> pd.DataFrame:
+    """
+    Reads the clicks within a time window from a CSV or Parquet file. The
+    file is read in chunks, and only the unique identifier, timestamp and
+    page columns of clicks within the window are kept from each chunk.
+
+    Args:
+        path (str): Path of the file.
+        unique_id_col (str): Column name of unique identifier.
+        datetime_col (str): Column name of timestamp column.
+        page_col (str): Column name of page column.
+        start (optional): Defaults to None. Earliest timestamp (inclusive)
+            to keep. If the timestamps are timezone aware and ``start`` is
+            not, it is taken to be in their timezone.
+        end (optional): Defaults to None. Latest timestamp (exclusive) to
+            keep.
+        chunk_size (int, optional): Defaults to 1,000,000. Number of rows
+            read at a time.
+        file_format (str, optional): Defaults to None. Either ``csv`` or
+            ``parquet``. If None, inferred from the file extension.
+
+    Returns:
+        pd.DataFrame: DataFrame of the three columns.
+    """
+    columns = [unique_id_col, datetime_col, page_col]
+    frames = []
+    for chunk in _read_chunks(path, columns, datetime_col, chunk_size,
+                              file_format):
+        chunk = chunk[columns]
+        if not pd.api.types.is_datetime64_any_dtype(chunk[datetime_col]):
+            chunk = chunk.assign(**{
+                datetime_col: _to_datetime(chunk[datetime_col])
+            })
+        timezone = getattr(chunk[datetime_col].dtype, 'tz', None)
+        in_window = np.ones(len(chunk), dtype=bool)
+        if start is not None:
+            in_window &= (chunk[datetime_col] >=
+                          _localize(start, timezone)).to_numpy()
+        if end is not None:
+            in_window &= (chunk[datetime_col] <
+                          _localize(end, timezone)).to_numpy()
+        frames.append(chunk[in_window])
+    if not frames:
+        return pd.DataFrame({
+            unique_id_col: [], page_col: [],
+            datetime_col: pd.Series([], dtype='datetime64[ns]'),
+        })[columns]
+    return pd.concat(frames, ignore_index=True)
+
+
+def count_partition(df, unique_id_col: str, datetime_col: str,
+                    page_col: str, session_timeout: int = 30,
+                    profiler=None) -> dict:
+    """
+    Sessionises a partition of clicks and counts the clicks on each page and
+    the transitions between pages.
+
+    Args:
+        df (pd.DataFrame): DataFrame of clicks.
+        unique_id_col (str): Column name of unique identifier.
+        datetime_col (str): Column name of timestamp column.
+        page_col (str): Column name of page column.
+        session_timeout (int, optional): Defaults to 30. Maximum time in
+            minutes after which a session is broken.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record each stage.
+
+    Returns:
+        dict: Dictionary of arrays: ``pages``, ``page_counts`` with the
+        number of clicks on each page, and ``rows``, ``cols`` and ``counts``
+        with the number of transitions between each pair of pages, as
+        indices into ``pages``.
+    """
+    # Clicks without a page are dropped before sessionising, as if they had
+    # not been logged
+    df = df[df[page_col].notna()]
+    # Sessionising sorts the clicks by session and time, so its order is
+    # reused to find the transitions
+    order, session_ids = Sessionise(
+        df, unique_id_col, datetime_col, session_timeout, profiler=profiler
+    ).sorted_sessions()
+    with profile_stage(profiler, 'count_transitions', n_items=len(df)):
+        codes, pages = pd.factorize(df[page_col].to_numpy()[order])
+        same_session = session_ids[1:] == session_ids[:-1]
+        n_pages = len(pages)
+        keys, counts = np.unique(
+            codes[:-1][same_session] * n_pages + codes[1:][same_session],
+            return_counts=True
+        )
+    return {
+        'pages': np.asarray(pages).astype(str),
+        'page_counts': np.bincount(codes, minlength=n_pages),
+        'rows': keys // max(n_pages, 1),
+        'cols': keys % max(n_pages, 1),
+        'counts': counts,
+    }
+
+
+def _checkpoint_path(path: str, args) -> str:
+    """
+    Returns the checkpoint file of a partition, named by a hash of the file
+    and of the options which affect its counts, so that checkpoints of
+    modified files or different options are not reused.
+    """
+    stat = os.stat(path)
+    key = json.dumps([
+        os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+        args.unique_id_col, args.datetime_col, args.page_col,
+        args.session_timeout, str(args.start), str(args.end),
+    ])
+    name = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(args.checkpoint_dir, f'{name}.npz')
+
+
+def _process_partition(task) -> list:
+    """
+    Reads, sessionises and counts a partition, and saves its counts to a
+    checkpoint file. Returns the profiled stages as dictionaries.
+    """
+    path, checkpoint, args = task
+    profiler = Profiler() if args.profile else None
+    with profile_stage(profiler, 'read_partition') as stage:
+        df = read_partition(
+            path, args.unique_id_col, args.datetime_col, args.page_col,
+            start=args.start, end=args.end, chunk_size=args.chunk_size,
+            file_format=args.format
+        )
+        stage.n_items = len(df)
+    counts = count_partition(df, args.unique_id_col, args.datetime_col,
+                             args.page_col, args.session_timeout,
+                             profiler=profiler)
+    # Written under a temporary name and renamed, so that an interrupted
+    # run never leaves a partial checkpoint behind
+    temporary = f'{checkpoint}.{os.getpid()}.tmp.npz'
+    np.savez(temporary, **counts)
+    os.replace(temporary, checkpoint)
+    return [] if profiler is None else [
+        stats.as_dict() for stats in profiler.stages
+    ]
+
+
+def merge_partitions(checkpoints: list, max_pages: int = None,
+                     min_count: int = 1) -> tuple:
+    """
+    Sums the counts of partitions over a shared list of pages, mapping the
+    pages outside of the vocabulary caps to ``OTHER_PAGE``.
+
+    Args:
+        checkpoints (list): Paths of the checkpoint files of the partitions.
+        max_pages (int, optional): Defaults to None. Maximum number of pages
+            to keep, in order of most clicks.
+        min_count (int, optional): Defaults to 1. Minimum number of clicks
+            for a page to be kept.
+
+    Returns:
+        tuple: Matrix of transition counts, and list of pages corresponding
+        to its rows and columns.
+    """
+    page_counts = []
+    for checkpoint in checkpoints:
+        with np.load(checkpoint) as data:
+            page_counts.append(pd.Series(data['page_counts'],
+                                         index=data['pages']))
+    page_counts = pd.concat(page_counts).groupby(level=0).sum() \
+        if page_counts else pd.Series([], dtype=np.int64)
+
+    capped = max_pages is not None or min_count > 1
+    pages = select_pages(page_counts, max_pages, min_count)
+    if capped:
+        pages.append(OTHER_PAGE)
+    page_index = pd.Index(pages)
+    n_pages = len(pages)
+
+    count_matrix = np.zeros(n_pages * n_pages)
+    for checkpoint in checkpoints:
+        with np.load(checkpoint) as data:
+            positions = page_index.get_indexer(data['pages'])
+            if capped:
+                positions[positions < 0] = n_pages - 1
+            count_matrix += np.bincount(
+                positions[data['rows']] * n_pages + positions[data['cols']],
+                weights=data['counts'], minlength=n_pages * n_pages
+            )
+    return count_matrix.reshape(n_pages, n_pages), pages
+
+
+def fit(args) -> MarkovClickstream:
+    """
+    Runs the pipeline of the ``fit`` command.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        MarkovClickstream: The fitted and saved model.
+    """
+    profiler = Profiler(track_memory=True) if args.profile else None
+    temporary_dir = None
+    if args.checkpoint_dir is None:
+        temporary_dir = tempfile.TemporaryDirectory()
+        args.checkpoint_dir = temporary_dir.name
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+
+    try:
+        checkpoints = [_checkpoint_path(path, args) for path in args.inputs]
+        tasks = [
+            (path, checkpoint, args)
+            for path, checkpoint in zip(args.inputs, checkpoints)
+            if not os.path.exists(checkpoint)
+        ]
+        if len(tasks) < len(args.inputs):
+            print(f'Resuming: {len(args.inputs) - len(tasks)} of '
+                  f'{len(args.inputs)} partitions already counted.',
+                  file=sys.stderr)
+
+        if args.n_jobs > 1 and len(tasks) > 1:
+            with Pool(min(args.n_jobs, len(tasks))) as pool:
+                results = pool.map(_process_partition, tasks, chunksize=1)
+        else:
+            results = [_process_partition(task) for task in tasks]
+        if profiler is not None:
+            for stages in results:
+                for stats in stages:
+                    profiler.record(StageStats(**stats))
+
+        with profile_stage(profiler, 'merge_partitions',
+                           n_items=len(checkpoints)):
+            count_matrix, pages = merge_partitions(
+                checkpoints, args.max_pages, args.min_count
+            )
+        model = MarkovClickstream.from_counts(
+            count_matrix, pages, count_dtype=args.count_dtype,
+            prob_dtype=args.prob_dtype, profiler=profiler
+        )
+        with profile_stage(profiler, 'save_model', n_items=len(pages)):
+            model.save(args.output)
+    finally:
+        if temporary_dir is not None:
+            temporary_dir.cleanup()
+
+    print(f'Saved model of {len(pages)} pages to {args.output}.',
+          file=sys.stderr)
+    if profiler is not None:
+        _print_profile(profiler)
+    return model
+
+
+def _print_profile(profiler: Profiler):
+    """
+    Prints the time, number of items and peak memory of each stage.
+    """
+    print(f'{"stage":<28}{"time (s)":>12}{"items":>14}{"peak MB":>12}',
+          file=sys.stderr)
+    for name, stats in profiler.as_dict().items():
+        n_items = '' if stats['n_items'] is None else stats['n_items']
+        peak = '' if stats['peak_memory'] is None else \
+            f'{stats["peak_memory"] / 2 ** 20:.1f}'
+        print(f'{name:<28}{stats["wall_time"]:>12.3f}{n_items:>14}'
+              f'{peak:>12}', file=sys.stderr)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the parser of command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog='markovclick',
+        description='Model clickstream data using Markov chains.'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    fit_parser = subparsers.add_parser(
+        'fit', help='Fit a model to click logs and save it.',
+        description='Sessionise click logs in CSV or Parquet files, fit a '
+                    'Markov chain to the sessions and save it as a .npz '
+                    'file. Each file is sessionised independently.'
+    )
+    fit_parser.add_argument('inputs', nargs='+',
+                            help='CSV or Parquet files of clicks, one per '
+                                 'partition.')
+    fit_parser.add_argument('-o', '--output', required=True,
+                            help='Path to save the model to.')
+    fit_parser.add_argument('--format', choices=['csv', 'parquet'],
+                            help='Format of the input files. Inferred from '
+                                 'the file extension by default.')
+    fit_parser.add_argument('--unique-id-col', default='cookie_id',
+                            help='Column of unique identifiers. '
+                                 'Default: %(default)s.')
+    fit_parser.add_argument('--datetime-col', default='timestamp',
+                            help='Column of timestamps. '
+                                 'Default: %(default)s.')
+    fit_parser.add_argument('--page-col', default='page',
+                            help='Column of pages. Default: %(default)s.')
+    fit_parser.add_argument('--session-timeout', type=int, default=30,
+                            help='Minutes of inactivity after which a '
+                                 'session is broken. Default: %(default)s.')
+    fit_parser.add_argument('--start', type=pd.Timestamp,
+                            help='Earliest timestamp (inclusive) of clicks '
+                                 'to use.')
+    fit_parser.add_argument('--end', type=pd.Timestamp,
+                            help='Latest timestamp (exclusive) of clicks to '
+                                 'use.')
+    fit_parser.add_argument('--chunk-size', type=int, default=1_000_000,
+                            help='Number of rows read at a time. '
+                                 'Default: %(default)s.')
+    fit_parser.add_argument('--n-jobs', type=int, default=1,
+                            help='Number of partitions processed in '
+                                 'parallel. Default: %(default)s.')
+    fit_parser.add_argument('--max-pages', type=int,
+                            help='Maximum number of pages to keep. Other '
+                                 f'pages are mapped to {OTHER_PAGE}.')
+    fit_parser.add_argument('--min-count', type=int, default=1,
+                            help='Minimum number of clicks for a page to be '
+                                 'kept. Default: %(default)s.')
+    fit_parser.add_argument('--count-dtype', default='float64',
+                            help='dtype of the count matrix. '
+                                 'Default: %(default)s.')
+    fit_parser.add_argument('--prob-dtype', default='float64',
+                            help='dtype of the probability matrix. '
+                                 'Default: %(default)s.')
+    fit_parser.add_argument('--checkpoint-dir',
+                            help='Directory to save the counts of each '
+                                 'partition to. Partitions already counted '
+                                 'there are skipped when rerun.')
+    fit_parser.add_argument('--profile', action='store_true',
+                            help='Report the time, number of items and peak '
+                                 'memory of each stage.')
+    fit_parser.set_defaults(func=fit)
+    return parser
+
+
+def main(argv: list = None):
+    """
+    Entry point of the ``markovclick`` command.
+
+    Args:
+        argv (list, optional): Defaults to None. Command line arguments. If
+            None, ``sys.argv`` is used.
+    """
+    args = _build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
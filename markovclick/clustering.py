@@ -0,0 +1,371 @@
+"""
+Clustering of clickstreams into behavioural groups, using a mixture of
+first-order Markov chains.
+"""
+
+import numpy as np
+from markovclick.models import MarkovClickstream
+from markovclick.profiling import profile_stage
+from markovclick.utils.helpers import (
+    WORKER_DATA, encode_clickstreams, encode_session_transitions,
+    unique_pages, worker_pool
+)
+
+
+def _transition_log_likelihoods(sessions, columns, counts, log_probs,
+                                n_sessions, offset=0) -> np.ndarray:
+    """
+    Sums the log-probabilities of the transitions of each session under each
+    component.
+
+    Args:
+        sessions (np.ndarray): Session index of each non-zero count.
+        columns (np.ndarray): Index into the observed transitions of each
+            non-zero count.
+        counts (np.ndarray): Number of times each transition occurs in the
+            session.
+        log_probs (np.ndarray): Log-probability of each observed transition
+            under each component, of shape ``(components, transitions)``.
+        n_sessions (int): Number of sessions.
+        offset (int, optional): Defaults to 0. Index of the first session.
+
+    Returns:
+        np.ndarray: Matrix of log-likelihoods of shape
+        ``(n_sessions, components)``.
+    """
+    log_likelihoods = np.empty((n_sessions, len(log_probs)))
+    for k, component_log_probs in enumerate(log_probs):
+        log_likelihoods[:, k] = np.bincount(
+            sessions - offset, weights=counts * component_log_probs[columns],
+            minlength=n_sessions
+        )
+    return log_likelihoods
+
+
+def _worker_log_likelihoods(args) -> np.ndarray:
+    """
+    Computes the transition log-likelihoods of a contiguous chunk of sessions
+    in a worker process.
+    """
+    start, end, first_session, n_sessions, log_probs = args
+    return _transition_log_likelihoods(
+        WORKER_DATA['sessions'][start:end],
+        WORKER_DATA['columns'][start:end],
+        WORKER_DATA['counts'][start:end],
+        log_probs, n_sessions, offset=first_session
+    )
+
+
+def _logsumexp(values: np.ndarray) -> np.ndarray:
+    """
+    Computes the log of the sum of exponentials along the last axis.
+    """
+    maximum = values.max(axis=1, keepdims=True)
+    maximum[~np.isfinite(maximum)] = 0
+    return np.log(np.exp(values - maximum).sum(axis=1)) + maximum[:, 0]
+
+
+class MarkovMixture:
+    """
+    Clusters clickstreams with a mixture of first-order Markov chains,
+    fitted by expectation maximisation (EM).
+
+    Each component has its own probabilities of starting on each page and of
+    transitioning between pages. Each clickstream is held as a sparse vector
+    of transition counts, and only transitions which are observed are stored
+    for each component, so that memory scales with the number of distinct
+    transitions rather than the square of the number of pages.
+
+    Args:
+        n_components (int, optional): Defaults to 2. Number of clusters.
+        max_iter (int, optional): Defaults to 100. Maximum number of EM
+            iterations.
+        tol (float, optional): Defaults to 1e-4. EM stops when the increase
+            in mean log-likelihood per session falls below this value.
+        alpha (float, optional): Defaults to 0.01. Pseudo-count added to
+            every start and transition count when estimating probabilities.
+        n_jobs (int, optional): Defaults to 1. If 2 or higher, the E-step is
+            run in parallel across this many processes.
+        random_state (int, optional): Defaults to None. Seed for the random
+            initialisation.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record each stage.
+    """
+
+    def __init__(self, n_components: int = 2, max_iter: int = 100,
+                 tol: float = 1e-4, alpha: float = 0.01, n_jobs: int = 1,
+                 random_state: int = None, profiler=None) -> None:
+        self.n_components = n_components
+        self.max_iter = max_iter
+        self.tol = tol
+        self.alpha = alpha
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.profiler = profiler
+        self.pages = []
+        self.weights = None
+        self.log_likelihood = None
+        self.n_iter = 0
+        self._transitions = None
+        self._start_counts = None
+        self._transition_counts = None
+        self._log_start_probs = None
+        self._log_transition_probs = None
+        self._log_row_norms = None
+
+    def _encode(self, clickstream_list: list) -> tuple:
+        """
+        Encodes clickstreams as their first pages, and sparse vectors of
+        transition counts over ``self._transitions``. Transitions not in
+        ``self._transitions`` are given the index -1, and pages not in the
+        model the code -1.
+
+        Returns:
+            tuple: Array of the first page of each clickstream (-1 if
+            empty), and arrays of the session, transition index, page
+            transitioned from and count of each non-zero count.
+        """
+        page_index = {page: i for i, page in enumerate(self.pages)}
+        codes, lengths = encode_clickstreams(clickstream_list, page_index,
+                                             default=-1)
+        starts = np.cumsum(lengths) - lengths
+        first_pages = np.full(len(lengths), -1, dtype=np.int64)
+        first_pages[lengths > 0] = codes[starts[lengths > 0]]
+
+        n_pages = len(self.pages)
+        sessions, flat, counts = encode_session_transitions(codes, lengths,
+                                                            n_pages)
+        if self._transitions is None:
+            self._transitions = np.unique(flat)
+        columns = np.searchsorted(self._transitions, flat)
+        columns[columns == len(self._transitions)] = -1
+        matched = columns >= 0
+        matched[matched] = self._transitions[columns[matched]] == \
+            flat[matched]
+        columns[~matched] = -1
+        return (first_pages, sessions, columns, flat // n_pages,
+                counts.astype(float))
+
+    def _m_step(self, responsibilities: np.ndarray, first_pages: np.ndarray,
+                sessions: np.ndarray, columns: np.ndarray,
+                counts: np.ndarray):
+        """
+        Re-estimates the mixture weights, start probabilities and transition
+        probabilities from the responsibilities of each component for each
+        session.
+        """
+        n_pages = len(self.pages)
+        from_pages = self._transitions // n_pages
+        has_start = first_pages >= 0
+        n_components = responsibilities.shape[1]
+        self.weights = responsibilities.mean(axis=0)
+        start_counts = np.empty((n_components, n_pages))
+        transition_counts = np.empty((n_components, len(self._transitions)))
+        log_row_norms = np.empty((n_components, n_pages))
+        for k in range(n_components):
+            start_counts[k] = np.bincount(
+                first_pages[has_start],
+                weights=responsibilities[has_start, k], minlength=n_pages
+            )
+            transition_counts[k] = np.bincount(
+                columns, weights=counts * responsibilities[sessions, k],
+                minlength=len(self._transitions)
+            )
+            log_row_norms[k] = np.log(np.bincount(
+                from_pages, weights=transition_counts[k], minlength=n_pages
+            ) + self.alpha * n_pages)
+        self._start_counts = start_counts
+        self._transition_counts = transition_counts
+        self._log_start_probs = np.log(start_counts + self.alpha) - np.log(
+            start_counts.sum(axis=1, keepdims=True) + self.alpha * n_pages
+        )
+        self._log_transition_probs = np.log(
+            transition_counts + self.alpha
+        ) - log_row_norms[:, from_pages]
+        self._log_row_norms = log_row_norms
+
+    def _log_likelihoods(self, first_pages, sessions, columns, from_pages,
+                         counts, pool=None) -> np.ndarray:
+        """
+        Computes the log-likelihood of each session under each component, in
+        a single batch, excluding the mixture weights. The worker processes
+        of ``pool`` hold the transition counts being fitted, all of which are
+        observed transitions.
+        """
+        n_sessions = len(first_pages)
+        if pool is None:
+            observed = columns >= 0
+            log_likelihoods = _transition_log_likelihoods(
+                sessions[observed], columns[observed], counts[observed],
+                self._log_transition_probs, n_sessions
+            )
+            # Transitions not seen when fitting only have the pseudo-count
+            unobserved = ~observed
+            for k in range(len(self._log_row_norms)):
+                log_likelihoods[:, k] += np.bincount(
+                    sessions[unobserved],
+                    weights=counts[unobserved] * (
+                        np.log(self.alpha) -
+                        self._log_row_norms[k, from_pages[unobserved]]
+                    ),
+                    minlength=n_sessions
+                )
+        else:
+            bounds = np.linspace(0, n_sessions, self.n_jobs + 1).astype(int)
+            positions = np.searchsorted(sessions, bounds)
+            chunks = [
+                (positions[i], positions[i + 1], bounds[i],
+                 bounds[i + 1] - bounds[i], self._log_transition_probs)
+                for i in range(self.n_jobs)
+            ]
+            log_likelihoods = np.concatenate(
+                pool.map(_worker_log_likelihoods, chunks), axis=0
+            )
+        has_start = first_pages >= 0
+        log_likelihoods[has_start] += \
+            self._log_start_probs[:, first_pages[has_start]].T
+        return log_likelihoods
+
+    def _initialise(self, first_pages, sessions, columns, from_pages,
+                    counts):
+        """
+        Initialises each component from a different seed session. As in
+        k-means++, each further seed is sampled with probability proportional
+        to the square of how poorly the session is explained by the
+        components of the seeds chosen so far, per click. Random soft
+        responsibilities are avoided, as they leave the components nearly
+        identical.
+        """
+        random_state = np.random.RandomState(self.random_state)
+        n_sessions = len(first_pages)
+        n_clicks = np.bincount(sessions, weights=counts,
+                               minlength=n_sessions) + (first_pages >= 0)
+        seeds = [random_state.randint(n_sessions)]
+        while True:
+            responsibilities = np.zeros((n_sessions, len(seeds)))
+            responsibilities[seeds, np.arange(len(seeds))] = 1
+            self._m_step(responsibilities, first_pages, sessions, columns,
+                         counts)
+            if len(seeds) == self.n_components:
+                break
+            log_likelihoods = self._log_likelihoods(
+                first_pages, sessions, columns, from_pages, counts
+            )
+            distances = -log_likelihoods.max(axis=1) / np.maximum(n_clicks, 1)
+            distances[seeds] = 0
+            if distances.sum() > 0:
+                seed_probs = distances ** 2 / (distances ** 2).sum()
+            else:
+                seed_probs = np.ones(n_sessions)
+                seed_probs[seeds] = 0
+                seed_probs /= seed_probs.sum()
+            seeds.append(random_state.choice(n_sessions, p=seed_probs))
+        self.weights = np.full(self.n_components, 1 / self.n_components)
+
+    def fit(self, clickstream_list: list):
+        """
+        Fits the mixture of Markov chains to a list of clickstreams.
+
+        Args:
+            clickstream_list (list): List of clickstreams.
+
+        Returns:
+            MarkovMixture: The fitted mixture.
+        """
+        with profile_stage(self.profiler, 'get_unique_pages',
+                           n_items=len(clickstream_list)):
+            self.pages = unique_pages(clickstream_list)
+        with profile_stage(self.profiler, 'populate_count_matrix',
+                           n_items=len(clickstream_list)):
+            self._transitions = None
+            first_pages, sessions, columns, from_pages, counts = \
+                self._encode(clickstream_list)
+
+        with profile_stage(self.profiler, 'initialise',
+                           n_items=len(clickstream_list)):
+            self._initialise(first_pages, sessions, columns, from_pages,
+                             counts)
+
+        pool = None
+        if self.n_jobs > 1:
+            pool = worker_pool(self.n_jobs, {
+                'sessions': sessions, 'columns': columns, 'counts': counts,
+            })
+        try:
+            previous = -np.inf
+            for self.n_iter in range(1, self.max_iter + 1):
+                with profile_stage(self.profiler, 'e_step',
+                                   n_items=len(clickstream_list)):
+                    weighted = self._log_likelihoods(
+                        first_pages, sessions, columns, from_pages, counts,
+                        pool=pool
+                    ) + np.log(self.weights)
+                    totals = _logsumexp(weighted)
+                    responsibilities = np.exp(weighted - totals[:, None])
+                with profile_stage(self.profiler, 'm_step',
+                                   n_items=len(clickstream_list)):
+                    self._m_step(responsibilities, first_pages, sessions,
+                                 columns, counts)
+                self.log_likelihood = totals.sum()
+                mean = self.log_likelihood / max(len(clickstream_list), 1)
+                if mean - previous < self.tol:
+                    break
+                previous = mean
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self
+
+    def _check_fitted(self):
+        if self.weights is None:
+            raise ValueError('MarkovMixture must be fitted before use.')
+
+    def predict_proba(self, clickstream_list: list) -> np.ndarray:
+        """
+        Calculates the probability of each clickstream belonging to each
+        component. Pages not seen when fitting are ignored.
+
+        Args:
+            clickstream_list (list): List of clickstreams.
+
+        Returns:
+            np.ndarray: Matrix of probabilities, with a row for each
+            clickstream and a column for each component.
+        """
+        self._check_fitted()
+        weighted = self._log_likelihoods(
+            *self._encode(clickstream_list)
+        ) + np.log(self.weights)
+        return np.exp(weighted - _logsumexp(weighted)[:, None])
+
+    def predict(self, clickstream_list: list) -> np.ndarray:
+        """
+        Assigns each clickstream to its most probable component.
+
+        Args:
+            clickstream_list (list): List of clickstreams.
+
+        Returns:
+            np.ndarray: Array of the component of each clickstream.
+        """
+        return self.predict_proba(clickstream_list).argmax(axis=1)
+
+    def component_model(self, component: int) -> MarkovClickstream:
+        """
+        Returns a ``MarkovClickstream`` built from the expected transition
+        counts of a component.
+
+        Args:
+            component (int): Index of the component.
+
+        Returns:
+            MarkovClickstream: Markov chain of the component.
+        """
+        self._check_fitted()
+        n_pages = len(self.pages)
+        count_matrix = np.zeros(n_pages * n_pages)
+        count_matrix[self._transitions] = self._transition_counts[component]
+        return MarkovClickstream.from_counts(
+            count_matrix.reshape(n_pages, n_pages), self.pages
+        )
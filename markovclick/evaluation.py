@@ -0,0 +1,455 @@
+"""
+Held-out evaluation of Markov chains: splitting sessions into train and test
+sets, perplexity, top-k next-page hit rate, and k-fold cross-validation over
+model order and smoothing.
+"""
+
+import numpy as np
+import pandas as pd
+from markovclick.models import MarkovClickstream
+from markovclick.utils.helpers import (
+    WORKER_DATA, encode_clickstreams, map_tasks, unique_pages
+)
+
+
+def clickstreams_from_df(df, session_col: str = 'session_uuid',
+                         page_col: str = 'page',
+                         datetime_col: str = None) -> list:
+    """
+    Converts a sessionised DataFrame into a list of clickstreams, with one
+    clickstream for each session.
+
+    Args:
+        df (pd.DataFrame): Sessionised DataFrame with a row for each click,
+            such as that returned by ``Sessionise.assign_sessions()``.
+        session_col (str, optional): Defaults to 'session_uuid'. Column name
+            of session ID column.
+        page_col (str, optional): Defaults to 'page'. Column name of page
+            column.
+        datetime_col (str, optional): Defaults to None. Column name of
+            timestamp column, used to order the clicks within each session.
+            If None, clicks are taken to be in order within each session.
+
+    Returns:
+        list: List of clickstreams, in order of first appearance of each
+        session.
+    """
+    session_codes = pd.factorize(df[session_col])[0]
+    if datetime_col is None:
+        order = np.argsort(session_codes, kind='stable')
+    else:
+        order = np.lexsort((
+            df[datetime_col].to_numpy().view(np.int64), session_codes
+        ))
+    pages = df[page_col].to_numpy()[order]
+    boundaries = np.flatnonzero(np.diff(session_codes[order])) + 1
+    return [list(stream) for stream in np.split(pages, boundaries)
+            if len(stream)]
+
+
+def train_test_split(data, test_size: float = 0.2,
+                     session_col: str = 'session_uuid',
+                     random_state: int = None) -> tuple:
+    """
+    Randomly splits sessions into a training set and a test set, so that
+    every session is wholly in one set.
+
+    Args:
+        data: List of clickstreams, or sessionised DataFrame with a row for
+            each click.
+        test_size (float, optional): Defaults to 0.2. Proportion of sessions
+            to place in the test set.
+        session_col (str, optional): Defaults to 'session_uuid'. Column name
+            of session ID column, if ``data`` is a DataFrame.
+        random_state (int, optional): Defaults to None. Seed for the random
+            split.
+
+    Returns:
+        tuple: Training and test sets, of the same type as ``data``.
+    """
+    if not 0 < test_size < 1:
+        raise ValueError('Argument `test_size` must be between 0 and 1.')
+    random_state = np.random.RandomState(random_state)
+
+    if isinstance(data, pd.DataFrame):
+        session_codes, sessions = pd.factorize(data[session_col])
+        in_test = random_state.permutation(len(sessions)) < \
+            round(test_size * len(sessions))
+        test_rows = in_test[session_codes]
+        return data[~test_rows], data[test_rows]
+
+    in_test = random_state.permutation(len(data)) < \
+        round(test_size * len(data))
+    return (
+        [stream for stream, test in zip(data, in_test) if not test],
+        [stream for stream, test in zip(data, in_test) if test],
+    )
+
+
+class NGramClickstream:
+    """
+    Markov chain of any order with additive smoothing, used to tune the
+    order and smoothing of models.
+
+    The state of an order ``k`` chain is the last ``k`` pages clicked. Only
+    the (state, next page) pairs which are observed are stored, as sorted
+    integer keys, so that memory scales with the number of distinct
+    transitions rather than the number of possible states. With additive
+    smoothing, each probability is estimated as
+    ``(count + alpha) / (total + alpha * (pages + 1))``, where the extra
+    category is reserved for pages not seen in training.
+
+    The first ``order`` clicks of each clickstream only serve as the state
+    for later clicks, and are not scored. To compare models of different
+    orders on the same transitions, ``score_from`` can be set to the
+    highest order, so that every model skips as many clicks.
+
+    Args:
+        order (int, optional): Defaults to 1. Number of previous pages the
+            next page depends on.
+        alpha (float, optional): Defaults to 0. Pseudo-count added to every
+            transition count. If 0, transitions not seen in training have
+            zero probability.
+        score_from (int, optional): Defaults to None. Position of the first
+            click of each clickstream to score, which is at least ``order``.
+            If None, clicks are scored from position ``order``. Training
+            always uses every transition.
+    """
+
+    def __init__(self, order: int = 1, alpha: float = 0.0,
+                 score_from: int = None) -> None:
+        if order < 1:
+            raise ValueError('Argument `order` must be at least 1.')
+        if alpha < 0:
+            raise ValueError('Argument `alpha` must not be negative.')
+        self.order = order
+        self.alpha = alpha
+        self.score_from = score_from
+        self.pages = []
+        self._page_index = {}
+        self._keys = None
+        self._counts = None
+        self._states = None
+        self._totals = None
+        self._rank_keys = None
+        self._rank_starts = None
+
+    @property
+    def first_scored(self) -> int:
+        """
+        Position of the first click of each clickstream which is scored
+        """
+        return max(self.order, self.score_from or self.order)
+
+    def _encode(self, clickstream_list: list, start: int = None) -> tuple:
+        """
+        Encodes the transitions of a list of clickstreams to the clicks from
+        position ``start`` onwards, which defaults to ``order``, as integer
+        states and next pages. The state of a transition is -1 if it
+        contains a page not in the model.
+
+        Returns:
+            tuple: Arrays of the state, the next page (-1 if not in the
+            model) and the index of the clickstream, for each transition.
+        """
+        n_pages = len(self.pages)
+        codes, lengths = encode_clickstreams(clickstream_list,
+                                             self._page_index, default=-1)
+        stream_index = np.repeat(np.arange(len(lengths)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        position = np.arange(len(codes)) - starts[stream_index]
+        targets = np.flatnonzero(position >= (start or self.order))
+
+        states = np.zeros(len(targets), dtype=np.int64)
+        known = np.ones(len(targets), dtype=bool)
+        for lag in range(self.order, 0, -1):
+            previous = codes[targets - lag]
+            known &= previous >= 0
+            states = states * n_pages + previous
+        states[~known] = -1
+        return states, codes[targets], stream_index[targets]
+
+    def fit(self, clickstream_list: list):
+        """
+        Counts the transitions from each state to each next page in a list
+        of clickstreams.
+
+        Args:
+            clickstream_list (list): List of clickstreams.
+
+        Returns:
+            NGramClickstream: The fitted model.
+        """
+        self.pages = unique_pages(clickstream_list)
+        self._page_index = {page: i for i, page in enumerate(self.pages)}
+        n_pages = len(self.pages)
+        if n_pages > 1 and \
+                (self.order + 1) * np.log2(n_pages) >= 63:
+            raise ValueError(
+                f'Order {self.order} is too high to encode the states of '
+                f'{n_pages} pages.'
+            )
+
+        states, next_pages, _ = self._encode(clickstream_list)
+        keys, counts = np.unique(states * n_pages + next_pages,
+                                 return_counts=True)
+        self._index_counts(keys, counts)
+        return self
+
+    @classmethod
+    def from_markov_clickstream(cls, model: MarkovClickstream):
+        """
+        Builds a first-order, unsmoothed model from the counts of a
+        ``MarkovClickstream``.
+
+        Args:
+            model (MarkovClickstream): Fitted Markov chain.
+
+        Returns:
+            NGramClickstream: Model with the same transition probabilities.
+        """
+        ngram = cls(order=1)
+        ngram.pages = list(model.pages)
+        ngram._page_index = {page: i for i, page in enumerate(ngram.pages)}
+        rows, cols = np.nonzero(model.count_matrix)
+        ngram._index_counts(rows * len(ngram.pages) + cols,
+                            model.count_matrix[rows, cols])
+        return ngram
+
+    def _index_counts(self, keys: np.ndarray, counts: np.ndarray):
+        """
+        Stores the sorted (state, next page) keys and their counts, along
+        with the total count of each state and the order of the next pages
+        of each state by count.
+        """
+        n_pages = len(self.pages)
+        self._keys = keys
+        self._counts = counts
+        self._states, state_codes = np.unique(keys // max(n_pages, 1),
+                                              return_inverse=True)
+        self._totals = np.bincount(state_codes, weights=counts,
+                                   minlength=len(self._states))
+
+        # Keys sorted by state, then by descending count, to find the rank
+        # of a next page amongst those seen after each state
+        offset = counts.max(initial=0) + 1
+        self._rank_keys = np.sort(
+            state_codes * offset + (offset - 1 - counts)
+        )
+        self._rank_starts = np.searchsorted(
+            self._rank_keys, np.arange(len(self._states)) * offset
+        )
+
+    def _lookup(self, clickstream_list: list) -> tuple:
+        """
+        Finds the training counts of the scored transitions of a list of
+        clickstreams.
+
+        Returns:
+            tuple: Arrays of the position of the state in the model (-1 if
+            not seen in training), the count of the transition, the total
+            count of the state, and the index of the clickstream, for each
+            transition.
+        """
+        if self._keys is None:
+            raise ValueError('NGramClickstream must be fitted before use.')
+        n_pages = len(self.pages)
+        states, next_pages, stream_index = self._encode(clickstream_list,
+                                                        self.first_scored)
+
+        state_pos = np.searchsorted(self._states, states)
+        state_pos[state_pos == len(self._states)] = 0
+        seen = (states >= 0) & (len(self._states) > 0)
+        seen[seen] = self._states[state_pos[seen]] == states[seen]
+        state_pos[~seen] = -1
+
+        keys = states * n_pages + next_pages
+        key_pos = np.searchsorted(self._keys, keys)
+        key_pos[key_pos == len(self._keys)] = 0
+        found = seen & (next_pages >= 0)
+        found[found] = self._keys[key_pos[found]] == keys[found]
+
+        counts = np.zeros(len(keys))
+        counts[found] = self._counts[key_pos[found]]
+        totals = np.zeros(len(keys))
+        totals[seen] = self._totals[state_pos[seen]]
+        return state_pos, counts, totals, stream_index
+
+    def calc_log_likelihoods(self, clickstream_list: list) -> np.ndarray:
+        """
+        Calculates the log-likelihood of each of a list of clickstreams, in a
+        single batch.
+
+        Args:
+            clickstream_list (list): List of clickstreams to score.
+
+        Returns:
+            np.ndarray: Array of the log-likelihood of each clickstream.
+            Without smoothing, clickstreams containing a transition not seen
+            in training have a log-likelihood of ``-inf``.
+        """
+        _, counts, totals, stream_index = self._lookup(clickstream_list)
+        denominator = totals + self.alpha * (len(self.pages) + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_probs = np.log(counts + self.alpha) - np.log(denominator)
+        log_probs[denominator == 0] = -np.inf
+        return np.bincount(stream_index, weights=log_probs,
+                           minlength=len(clickstream_list))
+
+    def next_page_ranks(self, clickstream_list: list) -> np.ndarray:
+        """
+        Finds the rank of the page actually clicked next amongst the model's
+        predictions, for each scored transition of a list of clickstreams.
+
+        Args:
+            clickstream_list (list): List of clickstreams.
+
+        Returns:
+            np.ndarray: Number of pages predicted to be more likely than the
+            next page, for each transition. ``inf`` if the transition was not
+            seen in training.
+        """
+        state_pos, counts, _, _ = self._lookup(clickstream_list)
+        offset = self._counts.max(initial=0) + 1
+        ranks = np.full(len(counts), np.inf)
+        seen = counts > 0
+        ranks[seen] = np.searchsorted(
+            self._rank_keys,
+            state_pos[seen] * offset + (offset - 1 - counts[seen])
+        ) - self._rank_starts[state_pos[seen]]
+        return ranks
+
+
+def _n_scored(clickstream_list: list, first_scored: int = 1) -> int:
+    """
+    Counts the transitions of a list of clickstreams scored by a model which
+    scores clicks from position ``first_scored`` onwards.
+    """
+    lengths = np.fromiter((len(stream) for stream in clickstream_list),
+                          dtype=np.int64, count=len(clickstream_list))
+    return int(np.maximum(lengths - first_scored, 0).sum())
+
+
+def perplexity(model, clickstream_list: list) -> float:
+    """
+    Calculates the perplexity of a model on held-out clickstreams, i.e. the
+    exponential of the mean negative log-likelihood per transition. Lower is
+    better; a model which guesses uniformly amongst ``n`` pages has a
+    perplexity of ``n``.
+
+    Args:
+        model: Fitted ``MarkovClickstream`` or ``NGramClickstream``.
+        clickstream_list (list): List of held-out clickstreams.
+
+    Returns:
+        float: Perplexity. ``inf`` if any transition has zero probability
+        under the model.
+    """
+    n_transitions = _n_scored(clickstream_list,
+                              getattr(model, 'first_scored', 1))
+    if n_transitions == 0:
+        raise ValueError('Clickstreams do not contain any transitions.')
+    log_likelihood = model.calc_log_likelihoods(clickstream_list).sum()
+    return float(np.exp(-log_likelihood / n_transitions))
+
+
+def top_k_hit_rate(model, clickstream_list: list, k: int = 3) -> float:
+    """
+    Calculates the proportion of held-out transitions where the page clicked
+    next is amongst the ``k`` pages the model predicts to be most likely.
+    Pages tied with the ``k``-th most likely page are counted as predicted.
+
+    Args:
+        model: Fitted ``MarkovClickstream`` or ``NGramClickstream``.
+        clickstream_list (list): List of held-out clickstreams.
+        k (int, optional): Defaults to 3. Number of pages predicted.
+
+    Returns:
+        float: Hit rate, between 0 and 1.
+    """
+    if isinstance(model, MarkovClickstream):
+        model = NGramClickstream.from_markov_clickstream(model)
+    ranks = model.next_page_ranks(clickstream_list)
+    if len(ranks) == 0:
+        raise ValueError('Clickstreams do not contain any transitions.')
+    return float(np.mean(ranks < k))
+
+
+def _evaluate_fold(args) -> list:
+    """
+    Fits a model of one order on all but one fold, and evaluates it on the
+    held-out fold for every smoothing setting.
+    """
+    order, fold, alphas, k, score_from = args
+    clickstream_list = WORKER_DATA['clickstream_list']
+    folds = WORKER_DATA['folds']
+    train = [stream for stream, f in zip(clickstream_list, folds)
+             if f != fold]
+    test = [stream for stream, f in zip(clickstream_list, folds)
+            if f == fold]
+
+    model = NGramClickstream(order=order, score_from=score_from).fit(train)
+    # The ranking of next pages does not depend on the smoothing
+    hit_rate = top_k_hit_rate(model, test, k=k)
+    results = []
+    for alpha in alphas:
+        model.alpha = alpha
+        results.append({
+            'order': order, 'alpha': alpha, 'fold': fold,
+            'perplexity': perplexity(model, test),
+            'top_k_hit_rate': hit_rate,
+        })
+    return results
+
+
+def cross_validate(clickstream_list: list, orders: list = (1,),
+                   alphas: list = (0.0,), n_folds: int = 5, k: int = 3,
+                   n_jobs: int = 1, random_state: int = None) -> pd.DataFrame:
+    """
+    Runs k-fold cross-validation of ``NGramClickstream`` models over a grid
+    of orders and smoothing settings. Sessions are randomly assigned to
+    folds, and each model is fitted once per order and fold, then scored
+    for every smoothing setting.
+
+    So that the scores of every order are comparable, every model is scored
+    on the same held-out transitions: those to clicks from position
+    ``max(orders)`` onwards, which the highest order model can score.
+
+    Args:
+        clickstream_list (list): List of clickstreams.
+        orders (list, optional): Defaults to (1,). Orders of model to
+            evaluate.
+        alphas (list, optional): Defaults to (0.0,). Additive smoothing
+            pseudo-counts to evaluate.
+        n_folds (int, optional): Defaults to 5. Number of folds.
+        k (int, optional): Defaults to 3. Number of pages predicted when
+            calculating the top-k next-page hit rate.
+        n_jobs (int, optional): Defaults to 1. If 2 or higher, the orders and
+            folds are evaluated in parallel across this many processes.
+        random_state (int, optional): Defaults to None. Seed for the random
+            assignment of sessions to folds.
+
+    Returns:
+        pd.DataFrame: DataFrame indexed by order and alpha, with the mean
+        ``perplexity`` and ``top_k_hit_rate`` across folds.
+    """
+    if not 2 <= n_folds <= len(clickstream_list):
+        raise ValueError(
+            'Argument `n_folds` must be at least 2, and no more than the '
+            'number of clickstreams.'
+        )
+    random_state = np.random.RandomState(random_state)
+    folds = random_state.permutation(len(clickstream_list)) % n_folds
+    tasks = [(order, fold, list(alphas), k, max(orders))
+             for order in orders for fold in range(n_folds)]
+
+    results = map_tasks(_evaluate_fold, tasks, n_jobs, {
+        'clickstream_list': clickstream_list, 'folds': folds
+    })
+
+    results = pd.DataFrame([row for rows in results for row in rows])
+    # Averaged with numpy, as the grouped mean of pandas turns infinite
+    # perplexities into NaN
+    return results.groupby(['order', 'alpha'])[
+        ['perplexity', 'top_k_hit_rate']
+    ].agg(lambda values: values.to_numpy().mean())
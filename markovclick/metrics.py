@@ -0,0 +1,242 @@
+"""
+Functions for measuring drift and divergence between two Markov chains.
+
+Models are compared over the union of their pages, using only the
+transitions with a non-zero probability in either model. Each model can be a
+``MarkovClickstream``, or any object with ``pages`` and ``prob_matrix``
+attributes, where ``prob_matrix`` is a ``numpy`` array or a ``scipy.sparse``
+matrix.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _nonzero_transitions(prob_matrix) -> tuple:
+    """
+    Returns the rows, columns and values of the non-zero entries of a dense
+    or sparse probability matrix.
+    """
+    if hasattr(prob_matrix, 'tocoo'):
+        coo = prob_matrix.tocoo()
+        nonzero = coo.data != 0
+        return coo.row[nonzero], coo.col[nonzero], coo.data[nonzero]
+    prob_matrix = np.asarray(prob_matrix)
+    rows, cols = np.nonzero(prob_matrix)
+    return rows, cols, prob_matrix[rows, cols]
+
+
+def align_models(model_a, model_b) -> tuple:
+    """
+    Aligns the transition probabilities of two models over the union of
+    their pages. The pages of ``model_a`` come first, in their order,
+    followed by the pages only in ``model_b``.
+
+    Args:
+        model_a: First model.
+        model_b: Second model.
+
+    Returns:
+        tuple: List of the union of pages, and arrays of the page
+        transitioned from, the page transitioned to, the probability in
+        ``model_a`` and the probability in ``model_b``, for each transition
+        with a non-zero probability in either model.
+    """
+    pages_a = list(model_a.pages)
+    in_a = set(pages_a)
+    pages = pages_a + [page for page in model_b.pages if page not in in_a]
+    positions_b = pd.Index(pages).get_indexer(list(model_b.pages))
+    return (pages,) + _align_matrices(
+        model_a.prob_matrix, model_b.prob_matrix, len(pages),
+        positions_b=positions_b
+    )
+
+
+def _align_matrices(prob_a, prob_b, n_pages: int,
+                    positions_b: np.ndarray = None) -> tuple:
+    """
+    Aligns two dense or sparse probability matrices over the union of their
+    non-zero transitions. The pages of ``prob_b`` are mapped to those of
+    ``prob_a`` by ``positions_b``, if provided.
+    """
+    keys = []
+    values = []
+    for prob_matrix, positions in [(prob_a, None), (prob_b, positions_b)]:
+        rows, cols, vals = _nonzero_transitions(prob_matrix)
+        if positions is not None:
+            rows = positions[rows]
+            cols = positions[cols]
+        keys.append(rows.astype(np.int64) * n_pages + cols)
+        values.append(vals)
+
+    support = np.unique(np.concatenate(keys))
+    probs = []
+    for model_keys, model_values in zip(keys, values):
+        model_probs = np.zeros(len(support))
+        model_probs[np.searchsorted(support, model_keys)] = model_values
+        probs.append(model_probs)
+    return support // n_pages, support % n_pages, probs[0], probs[1]
+
+
+def _row_sums(rows: np.ndarray, values: np.ndarray,
+              n_rows: int) -> np.ndarray:
+    return np.bincount(rows, weights=values, minlength=n_rows)
+
+
+def _row_metric(metric: str, rows: np.ndarray, prob_a: np.ndarray,
+                prob_b: np.ndarray, n_rows: int,
+                epsilon: float = 0.0) -> np.ndarray:
+    """
+    Computes a per-row metric from aligned transition probabilities. Rows
+    without any transitions in either model are NaN.
+    """
+    has_both = (_row_sums(rows, prob_a, n_rows) > 0) & \
+        (_row_sums(rows, prob_b, n_rows) > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'total_variation':
+            values = 0.5 * _row_sums(rows, np.abs(prob_a - prob_b), n_rows)
+        elif metric == 'kl':
+            if epsilon > 0:
+                # Transitions with zero probability in both models contribute
+                # nothing, as they are smoothed to the same value
+                normaliser = 1 + n_rows * epsilon
+                prob_a = (prob_a + epsilon) / normaliser
+                prob_b = (prob_b + epsilon) / normaliser
+            terms = np.where(prob_a > 0, prob_a * np.log(prob_a / prob_b), 0)
+            values = _row_sums(rows, terms, n_rows)
+        elif metric == 'js':
+            mixture = 0.5 * (prob_a + prob_b)
+            terms = np.where(
+                prob_a > 0, prob_a * np.log(prob_a / mixture), 0
+            ) + np.where(
+                prob_b > 0, prob_b * np.log(prob_b / mixture), 0
+            )
+            values = 0.5 * _row_sums(rows, terms, n_rows)
+        else:
+            raise ValueError(
+                "Argument `metric` must be one of 'total_variation', 'kl' "
+                "or 'js'."
+            )
+    values[~has_both] = np.nan
+    return values
+
+
+def total_variation(model_a, model_b) -> pd.Series:
+    """
+    Calculates the total variation distance between the transition
+    probabilities out of each page in two models.
+
+    Args:
+        model_a: First model.
+        model_b: Second model.
+
+    Returns:
+        pd.Series: Distance for each page in the union of pages, between 0
+        and 1. NaN for pages without any transitions in either model.
+    """
+    pages, rows, _, prob_a, prob_b = align_models(model_a, model_b)
+    return pd.Series(
+        _row_metric('total_variation', rows, prob_a, prob_b, len(pages)),
+        index=pages
+    )
+
+
+def kl_divergence(model_a, model_b, epsilon: float = 0.0) -> pd.Series:
+    """
+    Calculates the Kullback-Leibler divergence of the transition
+    probabilities out of each page in ``model_a`` from those in ``model_b``,
+    in nats.
+
+    Args:
+        model_a: First model.
+        model_b: Second model.
+        epsilon (float, optional): Defaults to 0. Probability added to every
+            transition in both models before renormalising, so that the
+            divergence is finite when ``model_b`` has zero probability for a
+            transition in ``model_a``.
+
+    Returns:
+        pd.Series: Divergence for each page in the union of pages. NaN for
+        pages without any transitions in either model.
+    """
+    pages, rows, _, prob_a, prob_b = align_models(model_a, model_b)
+    return pd.Series(
+        _row_metric('kl', rows, prob_a, prob_b, len(pages), epsilon),
+        index=pages
+    )
+
+
+def js_divergence(model_a, model_b) -> pd.Series:
+    """
+    Calculates the Jensen-Shannon divergence between the transition
+    probabilities out of each page in two models, in nats.
+
+    Args:
+        model_a: First model.
+        model_b: Second model.
+
+    Returns:
+        pd.Series: Divergence for each page in the union of pages, between 0
+        and log(2). NaN for pages without any transitions in either model.
+    """
+    pages, rows, _, prob_a, prob_b = align_models(model_a, model_b)
+    return pd.Series(
+        _row_metric('js', rows, prob_a, prob_b, len(pages)), index=pages
+    )
+
+
+def largest_changes(model_a, model_b, n: int = 10) -> pd.DataFrame:
+    """
+    Finds the transitions whose probability changed the most between two
+    models.
+
+    Args:
+        model_a: First model.
+        model_b: Second model.
+        n (int, optional): Defaults to 10. Number of transitions to return.
+
+    Returns:
+        pd.DataFrame: DataFrame with columns ``from_page``, ``to_page``,
+        ``prob_a``, ``prob_b`` and ``change``, sorted by the absolute change
+        in probability, largest first.
+    """
+    pages, rows, cols, prob_a, prob_b = align_models(model_a, model_b)
+    change = prob_b - prob_a
+    n = min(n, len(change))
+    if n > 0:
+        largest = np.argpartition(-np.abs(change), n - 1)[:n]
+    else:
+        largest = np.array([], dtype=np.int64)
+    largest = largest[np.argsort(-np.abs(change[largest]), kind='stable')]
+    pages = np.asarray(pages, dtype=object)
+    return pd.DataFrame({
+        'from_page': pages[rows[largest]],
+        'to_page': pages[cols[largest]],
+        'prob_a': prob_a[largest],
+        'prob_b': prob_b[largest],
+        'change': change[largest],
+    })
+
+
+def drift_report(model_a, model_b, epsilon: float = 1e-6) -> pd.DataFrame:
+    """
+    Summarises the drift between two models for each page, aligning the
+    models only once.
+
+    Args:
+        model_a: First model, e.g. last week's.
+        model_b: Second model, e.g. this week's.
+        epsilon (float, optional): Defaults to 1e-6. Smoothing applied when
+            calculating the Kullback-Leibler divergence. See
+            ``kl_divergence()``.
+
+    Returns:
+        pd.DataFrame: DataFrame indexed by page, with columns
+        ``total_variation``, ``kl`` and ``js``.
+    """
+    pages, rows, _, prob_a, prob_b = align_models(model_a, model_b)
+    return pd.DataFrame({
+        metric: _row_metric(metric, rows, prob_a, prob_b, len(pages),
+                            epsilon)
+        for metric in ['total_variation', 'kl', 'js']
+    }, index=pages)
@@ -2,11 +2,60 @@
 Models module which holds MarkovClickstream model.
 """
 
+import os
 from typing import Tuple
+from collections import OrderedDict
 from itertools import product, chain
 from tqdm import tqdm
 import numpy as np
 import networkx as nx
+from markovclick.profiling import profile_stage
+from markovclick.utils.helpers import (
+    encode_clickstreams, encode_transitions
+)
+from markovclick.utils.sketch import (
+    heavy_hitters, page_counts, select_pages
+)
+
+
+START_PAGE = '(start)'
+EXIT_PAGE = '(exit)'
+OTHER_PAGE = '(other)'
+
+
+def _as_count_dtype(counts, dtype) -> np.ndarray:
+    """
+    Casts counts to a dtype, raising an ``OverflowError`` if any count
+    cannot be represented exactly in that dtype.
+    """
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        lowest, highest = np.iinfo(dtype).min, np.iinfo(dtype).max
+    elif np.issubdtype(dtype, np.floating):
+        # Integers beyond the precision of the mantissa are rounded
+        highest = 2 ** (np.finfo(dtype).nmant + 1)
+        lowest = -highest
+    else:
+        raise TypeError(f'Count dtype must be numeric, not {dtype}.')
+    counts = np.asarray(counts)
+    if counts.size and (counts.max() > highest or counts.min() < lowest):
+        raise OverflowError(
+            f'Counts between {counts.min()} and {counts.max()} cannot be '
+            f'represented exactly as {dtype}.'
+        )
+    return counts.astype(dtype, copy=False)
+
+
+def _check_prob_dtype(dtype) -> np.dtype:
+    """
+    Checks the dtype of probabilities is floating point.
+    """
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.floating):
+        raise TypeError(
+            f'Probability dtype must be floating point, not {dtype}.'
+        )
+    return dtype
 
 
 class MarkovClickstream:
@@ -16,10 +65,58 @@ class MarkovClickstream:
     Args:
         clickstream_list (list): List of clickstream data. Each page should be
             encoded as a string, prefixed by a letter e.g. 'P1'
+        start_exit (bool, optional): Defaults to False. If True, adds the
+            pseudo-states ``START_PAGE`` and ``EXIT_PAGE`` after the pages,
+            and counts a transition from ``START_PAGE`` to the first page of
+            each clickstream, and from the last page to ``EXIT_PAGE``.
+        max_pages (int, optional): Defaults to None. Maximum number of pages
+            to keep, in order of most clicks. Pages which are not kept are
+            mapped to the reserved page ``OTHER_PAGE``, which is added after
+            the pages kept, so that the size of the model is bounded by
+            ``max_pages`` rather than by the number of distinct pages.
+        min_count (int, optional): Defaults to 1. Minimum number of clicks
+            for a page to be kept. Pages with fewer clicks are mapped to
+            ``OTHER_PAGE``.
+        approximate (bool, optional): Defaults to False. If True, the clicks
+            on each page are counted approximately with a count-min sketch,
+            in a single streaming pass whose memory is bounded by the sketch
+            and ``max_pages``, rather than by the number of distinct pages.
+            Only used if ``max_pages`` or ``min_count`` is set.
+        count_dtype (optional): Defaults to ``np.float64``. dtype of the
+            count matrix, e.g. ``np.uint32`` to halve its memory. An
+            ``OverflowError`` is raised if any count cannot be represented
+            exactly, i.e. above 2 ** 32 - 1 for ``np.uint32`` or 2 ** 24 for
+            ``np.float32``.
+        prob_dtype (optional): Defaults to ``np.float64``. Floating point
+            dtype of the probability matrix, e.g. ``np.float32`` to halve its
+            memory and speed up matrix operations. Probabilities are always
+            computed in float64 before being cast, and log-likelihoods and
+            conversion probabilities are accumulated in float64.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record the time,
+            number of clicks and peak memory of each fitting stage.
     """
 
-    def __init__(self, clickstream_list: list = None, prefixed=True):
+    #: Number of matrix powers, or of pages' propagated distributions, kept
+    #: in the least recently used cache of ``calc_k_step_probs()``.
+    k_step_cache_size = 16
+    #: Largest number of pages for which ``calc_k_step_probs()`` caches
+    #: whole matrix powers, rather than the distributions of single pages.
+    k_step_max_dense_pages = 2048
+
+    def __init__(self, clickstream_list: list = None, prefixed=True,
+                 start_exit: bool = False, max_pages: int = None,
+                 min_count: int = 1, approximate: bool = False,
+                 count_dtype=np.float64, prob_dtype=np.float64,
+                 profiler=None):
         self.clickstream_list = clickstream_list
+        self.start_exit = start_exit
+        self.max_pages = max_pages
+        self.min_count = min_count
+        self.approximate = approximate
+        self.count_dtype = np.dtype(count_dtype)
+        self.prob_dtype = _check_prob_dtype(prob_dtype)
+        self.profiler = profiler
         self.pages = []
         self.get_unique_pages(prefixed=prefixed)
 
@@ -30,6 +127,109 @@ class MarkovClickstream:
         self.populate_count_matrix()
         self.compute_prob_matrix()
 
+    @classmethod
+    def from_counts(cls, count_matrix, pages: list, count_dtype=np.float64,
+                    prob_dtype=np.float64, profiler=None):
+        """
+        Builds a Markov chain directly from a matrix of transition counts,
+        rather than from a list of clickstreams.
+
+        Args:
+            count_matrix: Square matrix of transition counts, where rows and
+                columns are in the order of ``pages``.
+            pages (list): List of pages corresponding to the rows and columns
+                of ``count_matrix``. If these include ``START_PAGE`` and
+                ``EXIT_PAGE``, the model is treated as having start and exit
+                pseudo-states.
+            count_dtype (optional): Defaults to ``np.float64``. dtype of the
+                count matrix.
+            prob_dtype (optional): Defaults to ``np.float64``. dtype of the
+                probability matrix.
+            profiler (Profiler, optional): Defaults to None.
+                ``markovclick.profiling.Profiler`` on which to record the
+                fitting stages.
+
+        Returns:
+            MarkovClickstream: Markov chain with probabilities computed.
+        """
+        model = cls._from_matrices(count_matrix, None, pages, count_dtype,
+                                   prob_dtype, profiler)
+        model.compute_prob_matrix()
+        return model
+
+    @classmethod
+    def _from_matrices(cls, count_matrix, prob_matrix, pages: list,
+                       count_dtype, prob_dtype, profiler=None):
+        """
+        Builds a Markov chain from a count matrix and, optionally, its
+        probability matrix, without any clickstreams.
+        """
+        count_matrix = _as_count_dtype(count_matrix, count_dtype)
+        if count_matrix.shape != (len(pages), len(pages)):
+            raise ValueError(
+                f'Count matrix of shape {count_matrix.shape} does not match '
+                f'the {len(pages)} pages provided.'
+            )
+        model = cls.__new__(cls)
+        model.clickstream_list = None
+        model.start_exit = START_PAGE in pages and EXIT_PAGE in pages
+        model.max_pages = None
+        model.min_count = 1
+        model.approximate = False
+        model.count_dtype = count_matrix.dtype
+        model.prob_dtype = _check_prob_dtype(prob_dtype)
+        model.profiler = profiler
+        model.pages = list(pages)
+        model._count_matrix = count_matrix
+        model._prob_matrix = prob_matrix
+        model._k_step_cache = OrderedDict()
+        return model
+
+    def save(self, path):
+        """
+        Saves the pages, count matrix and probability matrix to a ``.npz``
+        file, keeping the dtypes of the matrices. The file is written to
+        ``path`` as given, without ``.npz`` being appended.
+
+        Args:
+            path: File name or file object to save to.
+        """
+        if isinstance(path, (str, os.PathLike)):
+            with open(path, 'wb') as file:
+                self.save(file)
+            return
+        np.savez(path, pages=np.array(self.pages, dtype=str),
+                 count_matrix=self.count_matrix,
+                 prob_matrix=self.prob_matrix)
+
+    @classmethod
+    def load(cls, path, profiler=None):
+        """
+        Loads a Markov chain saved with ``save()``.
+
+        Args:
+            path: File name or file object to load from.
+            profiler (Profiler, optional): Defaults to None.
+                ``markovclick.profiling.Profiler`` for the loaded model.
+
+        Returns:
+            MarkovClickstream: Markov chain with the saved pages and
+            matrices.
+        """
+        with np.load(path) as data:
+            return cls._from_matrices(
+                data['count_matrix'], data['prob_matrix'],
+                data['pages'].tolist(), data['count_matrix'].dtype,
+                data['prob_matrix'].dtype, profiler
+            )
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Number of bytes used by the count and probability matrices
+        """
+        return self.count_matrix.nbytes + self.prob_matrix.nbytes
+
     @property
     def count_matrix(self):
         """
@@ -47,11 +247,37 @@ class MarkovClickstream:
     def get_unique_pages(self, prefixed=True):
         """
         Retrieves all the unique pages within the provided list of
-        clickstreams.
+        clickstreams, followed by the start and exit pseudo-states if
+        ``start_exit`` is set.
+
+        If ``max_pages`` or ``min_count`` is set, only the most clicked pages
+        are kept, followed by ``OTHER_PAGE``.
         """
 
-        flattened_clickstream = list(chain.from_iterable(self.clickstream_list))
-        self.pages = sorted(list(set(flattened_clickstream)))
+        with profile_stage(self.profiler, 'get_unique_pages') as stage:
+            if self.max_pages is None and self.min_count <= 1:
+                flattened_clickstream = list(
+                    chain.from_iterable(self.clickstream_list)
+                )
+                self.pages = sorted(list(set(flattened_clickstream)))
+            else:
+                if self.approximate:
+                    counts = heavy_hitters(
+                        chain.from_iterable(self.clickstream_list),
+                        max_items=self.max_pages, min_count=self.min_count
+                    )
+                else:
+                    counts = page_counts(self.clickstream_list)
+                self.pages = select_pages(
+                    counts, self.max_pages, self.min_count
+                ) + [OTHER_PAGE]
+            if self.start_exit:
+                self.pages.extend([START_PAGE, EXIT_PAGE])
+            # Counting the clicks takes a pass over every session, so is
+            # only done when profiling
+            if self.profiler is not None:
+                stage.n_items = sum(len(stream)
+                                    for stream in self.clickstream_list)
         return self.pages
 
     def initialise_count_matrix(self):
@@ -61,7 +287,7 @@ class MarkovClickstream:
         self._count_matrix = np.zeros([
             len(self.pages),
             len(self.pages)
-        ])
+        ], dtype=self.count_dtype)
 
     def populate_count_matrix(self):
         """
@@ -70,13 +296,34 @@ class MarkovClickstream:
         """
 
         self.initialise_count_matrix()
-        # For each session in list of sessions
-        for session in self.clickstream_list:
-            for j in range(0, len(session) - 1):
-                next_state = self.pages.index(session[j+1])
-                current_state = self.pages.index(session[j])
-
-                self._count_matrix[current_state, next_state] += 1
+        with profile_stage(self.profiler, 'populate_count_matrix') as stage:
+            n_pages = len(self.pages)
+            page_index = {page: i for i, page in enumerate(self.pages)}
+            # Pages not kept are mapped to OTHER_PAGE, if it is present
+            codes, lengths = encode_clickstreams(
+                self.clickstream_list, page_index,
+                default=page_index.get(OTHER_PAGE)
+            )
+            # Transitions between consecutive clicks of the same session
+            ends = np.cumsum(lengths)[lengths > 0]
+            same_session = np.ones(max(len(codes) - 1, 0), dtype=bool)
+            same_session[ends[:-1] - 1] = False
+            flat = codes[:-1][same_session] * n_pages + \
+                codes[1:][same_session]
+            if self.start_exit:
+                starts = ends - lengths[lengths > 0]
+                flat = np.concatenate([
+                    flat,
+                    page_index[START_PAGE] * n_pages + codes[starts],
+                    codes[ends - 1] * n_pages + page_index[EXIT_PAGE],
+                ])
+            self._count_matrix = _as_count_dtype(
+                self._count_matrix + np.bincount(
+                    flat, minlength=n_pages * n_pages
+                ).reshape(n_pages, n_pages),
+                self.count_dtype
+            )
+            stage.n_items = len(codes)
 
         return self._count_matrix
 
@@ -100,10 +347,19 @@ class MarkovClickstream:
 
     def compute_prob_matrix(self):
         """
-        Computes the probability matrix for the input clickstream.
+        Computes the probability matrix for the input clickstream, and
+        clears the cache of multi-step probabilities.
         """
-        self._prob_matrix = np.apply_along_axis(self.normalise_row, 1,
-                                                self.count_matrix)
+        with profile_stage(self.profiler, 'compute_prob_matrix',
+                           n_items=len(self.pages)):
+            row_sums = self.count_matrix.sum(axis=1, dtype=np.float64,
+                                             keepdims=True)
+            self._prob_matrix = np.divide(
+                self.count_matrix, row_sums,
+                out=np.zeros(self.count_matrix.shape, dtype=self.prob_dtype),
+                where=row_sums > 0
+            )
+        self._k_step_cache = OrderedDict()
 
     def calc_prob_to_page(self, clickstream: list, verbose=True) -> float:
         """
@@ -133,6 +389,129 @@ class MarkovClickstream:
 
         return total_prob
 
+    def calc_log_likelihoods(self, clickstream_list: list) -> np.ndarray:
+        """
+        Calculates the log-likelihood of each of a list of clickstreams, in a
+        single batch. Working in log space avoids the underflow of multiplying
+        many small probabilities together for long clickstreams.
+
+        Args:
+            clickstream_list (list): List of clickstreams to score.
+
+        Returns:
+            np.ndarray: Array of the log-likelihood of each clickstream.
+            Clickstreams containing a transition with zero probability, or a
+            page not in the model, have a log-likelihood of ``-inf``. Pages
+            not in the model are scored as ``OTHER_PAGE``, if it is present.
+        """
+        page_index = {page: i for i, page in enumerate(self.pages)}
+        from_pages, to_pages, stream_index = encode_transitions(
+            clickstream_list, page_index,
+            default=page_index.get(OTHER_PAGE, -1)
+        )
+        known = (from_pages >= 0) & (to_pages >= 0)
+        probs = np.zeros(len(from_pages))
+        probs[known] = self.prob_matrix[from_pages[known], to_pages[known]]
+        with np.errstate(divide='ignore'):
+            log_probs = np.log(probs)
+        return np.bincount(stream_index, weights=log_probs,
+                           minlength=len(clickstream_list))
+
+    def _cache_get(self, key):
+        """
+        Returns a value from the multi-step cache, marking it as most
+        recently used, or None if it is not cached.
+        """
+        value = self._k_step_cache.get(key)
+        if value is not None:
+            self._k_step_cache.move_to_end(key)
+        return value
+
+    def _cache_put(self, key, value):
+        """
+        Adds a value to the multi-step cache, evicting the least recently
+        used value if the cache is full.
+        """
+        self._k_step_cache[key] = value
+        self._k_step_cache.move_to_end(key)
+        while len(self._k_step_cache) > self.k_step_cache_size:
+            self._k_step_cache.popitem(last=False)
+
+    def _matrix_power(self, k: int) -> np.ndarray:
+        """
+        Returns the ``k``-th power of the probability matrix, building on
+        the highest cached power below it.
+        """
+        power = self._cache_get(('power', k))
+        if power is None:
+            cached = [key[1] for key in self._k_step_cache
+                      if key[0] == 'power' and key[1] < k]
+            if cached:
+                j = max(cached)
+                power = self._k_step_cache[('power', j)].dot(
+                    np.linalg.matrix_power(self.prob_matrix, k - j)
+                )
+            else:
+                power = np.linalg.matrix_power(self.prob_matrix, k)
+            self._cache_put(('power', k), power)
+        return power
+
+    def _propagated_distribution(self, page: int, k: int) -> np.ndarray:
+        """
+        Returns the distribution over pages ``k`` clicks after a page, by
+        propagating the page's cached distributions forward.
+        """
+        distributions = self._cache_get(('page', page))
+        if distributions is None:
+            distributions = [self.prob_matrix[page]]
+        while len(distributions) < k:
+            distributions.append(distributions[-1].dot(self.prob_matrix))
+        self._cache_put(('page', page), distributions)
+        return distributions[k - 1]
+
+    def calc_k_step_probs(self, from_pages: list, to_pages: list = None,
+                          k: int = 1) -> np.ndarray:
+        """
+        Calculates the probability of being on each of ``to_pages`` exactly
+        ``k`` clicks after being on each of ``from_pages``, summed over every
+        route between them.
+
+        Results are built from a least recently used cache, which is cleared
+        whenever ``compute_prob_matrix()`` is called, so that repeated
+        queries are answered by array lookups. For models with up to
+        ``k_step_max_dense_pages`` pages, whole powers of the probability
+        matrix are cached. For larger models, the distributions reached from
+        each queried page are cached instead, to bound memory.
+
+        Args:
+            from_pages (list): Pages to start from.
+            to_pages (list, optional): Defaults to None. Pages to end on. If
+                None, all pages are used.
+            k (int, optional): Defaults to 1. Number of clicks.
+
+        Returns:
+            np.ndarray: Matrix of probabilities, with a row for each of
+            ``from_pages`` and a column for each of ``to_pages``.
+        """
+        if k < 0:
+            raise ValueError('Argument `k` must not be negative.')
+        page_index = {page: i for i, page in enumerate(self.pages)}
+        rows = np.array([page_index[page] for page in from_pages],
+                        dtype=np.int64)
+        if to_pages is None:
+            cols = np.arange(len(self.pages))
+        else:
+            cols = np.array([page_index[page] for page in to_pages],
+                            dtype=np.int64)
+
+        if k == 0:
+            return (rows[:, None] == cols[None, :]).astype(float)
+        if len(self.pages) <= self.k_step_max_dense_pages:
+            return self._matrix_power(k)[np.ix_(rows, cols)]
+        return np.array([
+            self._propagated_distribution(row, k)[cols] for row in rows
+        ]).reshape(len(rows), len(cols))
+
     @staticmethod
     def permutations(iterable, r=None):
         """
@@ -204,6 +583,69 @@ class MarkovClickstream:
 
         return potential_routes, potential_routes_prob
 
+    def calc_conversion_probs(self, target_pages: list,
+                              landing_pages: list = None) -> np.ndarray:
+        """
+        Calculates the probability that a session on each landing page goes
+        on to reach (convert on) each target page, in any number of clicks,
+        before the session ends.
+
+        Rather than enumerating routes as ``calc_prob_all_routes_to()`` does,
+        the target page is treated as an absorbing state and the absorption
+        probabilities from every page are found with one linear solve per
+        target page. The model should be built with ``start_exit=True``, so
+        that sessions ending are counted as transitions to ``EXIT_PAGE``.
+        Otherwise, only pages without any outgoing transitions end sessions.
+
+        Args:
+            target_pages (list): Pages for which to calculate the probability
+                of converting on.
+            landing_pages (list, optional): Defaults to None. Pages from which
+                sessions start. ``START_PAGE`` may be included to give the
+                probability of converting across all sessions. If None, all
+                pages other than the pseudo-states are used.
+
+        Returns:
+            np.ndarray: Matrix of probabilities, with a row for each landing
+            page and a column for each target page.
+        """
+        if landing_pages is None:
+            landing_pages = [
+                page for page in self.pages
+                if page not in (START_PAGE, EXIT_PAGE)
+            ]
+        page_index = {page: i for i, page in enumerate(self.pages)}
+        sources = np.array([page_index[page] for page in landing_pages],
+                           dtype=np.int64)
+        prob = self.prob_matrix.astype(np.float64, copy=False)
+        adjacency = prob > 0
+        n_pages = len(self.pages)
+
+        conversion = np.zeros((len(sources), len(target_pages)))
+        for j, target_page in enumerate(target_pages):
+            target = page_index[target_page]
+            # Pages from which the target page can be reached. Absorption
+            # probabilities from all other pages are zero, and leaving them
+            # out keeps the linear system non-singular.
+            reachable = np.zeros(n_pages, dtype=bool)
+            reachable[target] = True
+            frontier = reachable.copy()
+            while frontier.any():
+                frontier = adjacency[:, frontier].any(axis=1) & ~reachable
+                reachable |= frontier
+            reachable[target] = False
+            transient = np.flatnonzero(reachable)
+
+            absorption = np.zeros(n_pages)
+            absorption[target] = 1
+            absorption[transient] = np.linalg.solve(
+                np.eye(len(transient)) - prob[np.ix_(transient, transient)],
+                prob[transient, target]
+            )
+            conversion[:, j] = absorption[sources]
+
+        return conversion
+
     def calculate_pagerank(
         self, max_nodes: int=2, pr_kwargs: dict={}
     ) -> Tuple[nx.DiGraph, dict]:
@@ -4,9 +4,208 @@ Functions for preprocessing clickstream datasets
 
 from uuid import uuid4
 from multiprocessing import Process, Queue
-from datetime import timedelta
 import numpy as np
 import pandas as pd
+from markovclick.profiling import profile_stage
+
+
+class SessionRule:
+    """
+    Base class for rules which split clickstream data into sessions.
+
+    Each rule is evaluated over the whole clickstream dataset at once,
+    returning a boolean mask marking the clicks at which a new session should
+    begin. Masks from multiple rules are combined, so that a new session
+    begins wherever any rule marks a boundary. A new session always begins
+    when the unique identifier changes, so rules only need to compare each
+    click with the one before it.
+
+    Rules which set ``depends_on_sessions`` to True are evaluated after all
+    other rules, and receive the session boundaries found so far.
+    """
+    depends_on_sessions = False
+
+    def mask(self, columns, datetime_col: str,
+             new_session: np.ndarray = None) -> np.ndarray:
+        """
+        Evaluates the rule over the clickstream dataset.
+
+        Args:
+            columns: Mapping of column name to ``numpy`` array of the column's
+                values, with timestamps as UTC ``datetime64[ns]`` values. Its
+                ``timezone(name)`` method gives the timezone of a timezone
+                aware column, or None.
+            datetime_col (str): Column name of timestamp column.
+            new_session (np.ndarray, optional): Defaults to None. Boolean
+                mask of the session boundaries found so far, only provided
+                to rules which depend on sessions.
+
+        Returns:
+            np.ndarray: Boolean mask, True where a new session begins.
+        """
+        raise NotImplementedError
+
+
+class InactivityTimeout(SessionRule):
+    """
+    Splits sessions when the time since the previous click exceeds a timeout.
+
+    Args:
+        minutes (float): Maximum time in minutes between clicks in a session.
+    """
+
+    def __init__(self, minutes: float = 30) -> None:
+        self.minutes = minutes
+
+    def mask(self, columns, datetime_col, new_session=None):
+        times = columns[datetime_col]
+        boundaries = np.zeros(len(times), dtype=bool)
+        boundaries[1:] = np.diff(times) > np.timedelta64(
+            int(self.minutes * 60 * 10 ** 9), 'ns'
+        )
+        return boundaries
+
+
+class MidnightSplit(SessionRule):
+    """
+    Splits sessions at midnight. Timestamps without a timezone are taken to
+    be in UTC when converting to another timezone.
+
+    Args:
+        timezone (str, optional): Defaults to None. Timezone in which to
+            split at midnight, e.g. ``Europe/London``. If None, midnight in
+            the timezone of the timestamps is used.
+        timezone_col (str, optional): Defaults to None. Column name of a
+            column holding the timezone of each click, e.g. the user's
+            timezone. Overrides ``timezone``.
+    """
+
+    def __init__(self, timezone: str = None, timezone_col: str = None) -> None:
+        self.timezone = timezone
+        self.timezone_col = timezone_col
+
+    @staticmethod
+    def _local_dates(times: np.ndarray, timezone: str) -> np.ndarray:
+        """
+        Converts timestamps in UTC to dates in the provided timezone.
+        """
+        if timezone is None:
+            return times.astype('datetime64[D]')
+        local = pd.DatetimeIndex(times).tz_localize('UTC').tz_convert(
+            timezone
+        ).tz_localize(None)
+        return local.values.astype('datetime64[D]')
+
+    def mask(self, columns, datetime_col, new_session=None):
+        times = columns[datetime_col]
+        if self.timezone_col is None:
+            timezone = self.timezone
+            if timezone is None:
+                timezone = columns.timezone(datetime_col)
+            dates = self._local_dates(times, timezone)
+        else:
+            timezones = columns[self.timezone_col]
+            dates = np.empty(len(times), dtype='datetime64[D]')
+            for timezone in pd.unique(timezones):
+                rows = timezones == timezone
+                dates[rows] = self._local_dates(times[rows], timezone)
+        boundaries = np.zeros(len(times), dtype=bool)
+        boundaries[1:] = dates[1:] != dates[:-1]
+        return boundaries
+
+
+class MaxDuration(SessionRule):
+    """
+    Splits sessions which last longer than a maximum duration. Each session
+    found by the other rules is split at the first click at least the
+    maximum duration after its first click, and each new session is split
+    again in the same way, measured from the click which began it.
+
+    Args:
+        minutes (float): Maximum duration of a session in minutes.
+    """
+    depends_on_sessions = True
+
+    def __init__(self, minutes: float) -> None:
+        if minutes <= 0:
+            raise ValueError('Argument `minutes` must be positive.')
+        self.minutes = minutes
+
+    def mask(self, columns, datetime_col, new_session=None):
+        times = columns[datetime_col].astype(np.int64)
+        duration = int(self.minutes * 60 * 10 ** 9)
+        boundaries = np.zeros(len(times), dtype=bool)
+        starts = np.flatnonzero(new_session)
+        ends = np.append(starts[1:], len(times))
+        # Only sessions lasting longer than the maximum duration are split,
+        # by jumping from the click beginning each new session to the first
+        # click at least the maximum duration after it
+        too_long = times[ends - 1] - times[starts] >= duration
+        for start, end in zip(starts[too_long], ends[too_long]):
+            session_times = times[start:end]
+            anchor = 0
+            while True:
+                anchor = np.searchsorted(session_times,
+                                         session_times[anchor] + duration)
+                if anchor >= len(session_times):
+                    break
+                boundaries[start + anchor] = True
+        return boundaries
+
+
+class ColumnChange(SessionRule):
+    """
+    Splits sessions when the value of a column changes between clicks, e.g. a
+    campaign or referrer column. Missing values are treated as equal to each
+    other.
+
+    Args:
+        column (str): Column name of the column to compare.
+    """
+
+    def __init__(self, column: str) -> None:
+        self.column = column
+
+    def mask(self, columns, datetime_col, new_session=None):
+        codes = pd.factorize(columns[self.column])[0]
+        boundaries = np.zeros(len(codes), dtype=bool)
+        boundaries[1:] = codes[1:] != codes[:-1]
+        return boundaries
+
+
+class _ColumnArrays:
+    """
+    Mapping of column name to the ``numpy`` array of a DataFrame column,
+    with timezone aware timestamps converted to UTC ``datetime64[ns]``.
+    Arrays are taken in the order given by ``order``, if provided, and cached
+    so that each column is only reordered once.
+    """
+
+    def __init__(self, df, order: np.ndarray = None) -> None:
+        self._df = df
+        self._order = order
+        self._cache = {}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._cache:
+            column = self._df[name]
+            if isinstance(column.dtype, pd.DatetimeTZDtype):
+                values = column.dt.tz_convert('UTC').dt.tz_localize(
+                    None
+                ).to_numpy()
+            else:
+                values = column.to_numpy()
+            if self._order is not None:
+                values = values[self._order]
+            self._cache[name] = values
+        return self._cache[name]
+
+    def timezone(self, name: str):
+        """
+        Returns the timezone of a timezone aware column, or None.
+        """
+        dtype = self._df[name].dtype
+        return dtype.tz if isinstance(dtype, pd.DatetimeTZDtype) else None
 
 
 class Sessionise:
@@ -16,7 +215,8 @@ class Sessionise:
     """
 
     def __init__(self, df, unique_id_col: str, datetime_col: str,
-                 session_timeout: int = 30) -> None:
+                 session_timeout: int = 30, rules: list = None,
+                 presorted: bool = False, profiler=None) -> None:
         """
         Instantiates object of ``Sessionise`` class.
         
@@ -31,13 +231,28 @@ class Sessionise:
             datetime_col (str): Column name of timestamp column.
             session_timeout (int, optional): Defaults to 30. Maximum time in
                 minutes after which a session is broken.
+            rules (list, optional): Defaults to None. List of
+                ``SessionRule`` objects, such as ``InactivityTimeout``,
+                ``MidnightSplit``, ``MaxDuration`` and ``ColumnChange``, which
+                are combined to split sessions. If None, only
+                ``InactivityTimeout(session_timeout)`` is used.
+            presorted (bool, optional): Defaults to False. Declares that the
+                DataFrame is already sorted by unique identifier and
+                timestamp, so that sorting can be skipped.
+            profiler (Profiler, optional): Defaults to None.
+                ``markovclick.profiling.Profiler`` on which to record the
+                time, number of rows and peak memory of each stage of
+                ``assign_sessions()``.
         """
         self._df = df
+        self.profiler = profiler
         self.unique_id_col = unique_id_col
         self.datetime_col = datetime_col
         self._session_timeout = session_timeout
-        self.curr_uniq_id = str(uuid4())
-        self.columns = [self.unique_id_col, 'prev_uniq_id', 'session_boundary']
+        if rules is None:
+            rules = [InactivityTimeout(session_timeout)]
+        self.rules = rules
+        self.presorted = presorted
 
     @property
     def df(self):
@@ -77,9 +292,8 @@ class Sessionise:
         """
         Sets value for ``datetime_col`` attribute
         """
-        if isinstance(name, str) and np.issubdtype(
-                self.df[name], np.datetime64
-        ):
+        if isinstance(name, str) and \
+                pd.api.types.is_datetime64_any_dtype(self.df[name]):
             self.__datetime_col = name
         else:
             raise TypeError("Datetime column name should be string referring\
@@ -92,44 +306,124 @@ class Sessionise:
         """
         return self._session_timeout
 
-    def _add_session_boundaries(self):
+    def _sort_order(self, uniq_id_codes: np.ndarray) -> np.ndarray:
         """
-        Adds a column to denote the session boundaries in clickstream data
+        Computes the order which sorts the clickstream data by unique
+        identifier and timestamp, using a stable sort so that clicks with
+        identical timestamps keep their original order.
+
+        Args:
+            uniq_id_codes (np.ndarray): Integer codes of the unique
+                identifiers, in the same order as their values.
+
+        Returns:
+            np.ndarray: Array of row positions in sorted order, or None if
+            the data is declared as presorted.
         """
-        self._df.sort_values(by=[self.unique_id_col, self.datetime_col])
-        self._df['prev_uniq_id'] = self._df.shift(1)[self.unique_id_col]
-        self._df['time_diff'] = self._df[self.datetime_col].diff(1)
-        self._df['time_diff'] = self._df['time_diff'].fillna(timedelta(0))
+        if self.presorted:
+            return None
+        times = _ColumnArrays(self._df)[self.datetime_col].view(np.int64)
+        return np.lexsort((times, uniq_id_codes))
 
-        self._df['session_boundary'] = self._df['time_diff'] - timedelta(
-            minutes=self.session_timeout
-        )
-        self._df.loc[:, 'session_boundary'] = self._df[
-            'session_boundary'
-        ].apply(
-            lambda row: True if row > timedelta(0) else False
-        )
+    def _add_session_boundaries(self) -> tuple:
+        """
+        Finds the session boundaries in the clickstream data, combining the
+        boolean masks of each of the session rules with changes in unique
+        identifier. The DataFrame is not modified.
+
+        Returns:
+            tuple: Boolean mask marking the clicks which begin a new session,
+            in sorted order, and the array of row positions in sorted order
+            (None if the data is declared as presorted).
+        """
+        n_rows = len(self._df)
+        with profile_stage(self.profiler, 'sort', n_items=n_rows):
+            uniq_id_codes = pd.factorize(
+                self._df[self.unique_id_col], sort=True
+            )[0]
+            order = self._sort_order(uniq_id_codes)
+            if order is not None:
+                uniq_id_codes = uniq_id_codes[order]
+
+        with profile_stage(self.profiler, '_add_session_boundaries',
+                           n_items=n_rows):
+            new_session = np.ones(n_rows, dtype=bool)
+            new_session[1:] = uniq_id_codes[1:] != uniq_id_codes[:-1]
+            # Missing unique IDs are all coded as -1, but clicks without a
+            # unique ID cannot be attributed to the same user, so each one
+            # begins its own session
+            new_session |= uniq_id_codes == -1
+            del uniq_id_codes
+
+            columns = _ColumnArrays(self._df, order)
+            for rule in self.rules:
+                if not rule.depends_on_sessions:
+                    new_session |= rule.mask(columns, self.datetime_col)
+            for rule in self.rules:
+                if rule.depends_on_sessions:
+                    new_session |= rule.mask(columns, self.datetime_col,
+                                             new_session.copy())
+        return new_session, order
+
+    def sorted_sessions(self) -> tuple:
+        """
+        Finds the session of every click with the clicks sorted by unique
+        identifier and timestamp, without modifying the DataFrame. This
+        avoids reordering the session IDs back into the original order of
+        the rows, for callers which need the clicks in sorted order anyway.
+
+        Returns:
+            tuple: Array of row positions in sorted order, and the ``int64``
+            session ID of each row in that order, numbering sessions from 0
+            as ``assign_sessions(session_id='int')`` does.
+        """
+        new_session, order = self._add_session_boundaries()
+        with profile_stage(self.profiler, 'assign_session_ids',
+                           n_items=len(self._df)):
+            session_index = np.cumsum(new_session, dtype=np.int64) - 1
+        if order is None:
+            order = np.arange(len(self._df))
+        return order, session_index
 
-    def _get_or_create_uuid(self, row) -> str:
+    def _session_ids(self, session_id: str) -> np.ndarray:
         """
-        Provides a new or returns previous session UUID depending on criteria
-        for setting a new session boundary.
+        Computes the session ID of every click, in the original order of the
+        rows, without iterating over rows.
 
         Args:
-            row: Row in DataFrame of clickstream dataset
+            session_id (str): One of ``uuid``, ``int`` or ``hash``. See
+                ``assign_sessions()``.
 
         Returns:
-            str: Unique session UUID
+            np.ndarray: Array of session IDs.
         """
-        curr_uniq_id = row[self.unique_id_col]
-        prev_anon_id = row['prev_uniq_id']
-        boundary = row['session_boundary']
+        new_session, order = self._add_session_boundaries()
+        with profile_stage(self.profiler, 'assign_session_ids',
+                           n_items=len(self._df)):
+            session_index = np.cumsum(new_session, dtype=np.int64) - 1
+            if session_id == 'uuid':
+                session_uuids = np.array(
+                    [str(uuid4()) for _ in range(int(new_session.sum()))],
+                    dtype=object
+                )
+                sorted_ids = session_uuids[session_index]
+            elif session_id == 'int':
+                sorted_ids = session_index
+            else:
+                columns = _ColumnArrays(self._df, order)
+                start_times = columns[self.datetime_col][new_session]
+                hashed = pd.util.hash_pandas_object(pd.DataFrame({
+                    'unique_id': columns[self.unique_id_col],
+                    'session_start': start_times[session_index],
+                }), index=False)
+                sorted_ids = hashed.to_numpy().view(np.int64)
+            del session_index, new_session
 
-        if boundary is True or curr_uniq_id != prev_anon_id:
-            self.curr_uniq_id = str(uuid4())
-            return self.curr_uniq_id
-        else:
-            return self.curr_uniq_id
+            if order is None:
+                return sorted_ids
+            session_ids = np.empty_like(sorted_ids)
+            session_ids[order] = sorted_ids
+        return session_ids
 
     def _create_partitions(self, partitions: int) -> list:
         """
@@ -150,69 +444,82 @@ class Sessionise:
 
     def _assign_sessions_parallel(self, df, partition: list, queue):
         """
-        Assigns sessions to partition of DataFrame, created using list of
+        Assigns session UUIDs to partition of DataFrame, created using list of
         unique IDs provided in partition argument.
 
         Args:
             df (pd.DataFrame): DataFrame containing clickstream data
             partition (list): List of unique IDs to subset DataFrame
-            queue: multiprocessing.Queue object to add results to
+            queue: multiprocessing.Queue object to add the row positions of
+                the partition and their session UUIDs to
         """
-        _df = df.loc[df[self.unique_id_col].isin(partition), :]
-        curr_session_uuid = str(uuid4())
-
-        def get_or_create_uuid(row) -> str:
-            nonlocal curr_session_uuid
-            curr_uniq_id = row[self.unique_id_col]
-            prev_anon_id = row['prev_uniq_id']
-            boundary = row['session_boundary']
-
-            if boundary is True or curr_uniq_id != prev_anon_id:
-                curr_session_uuid = str(uuid4())
-                return curr_session_uuid
-            else:
-                return curr_session_uuid
-
-        _df.loc[:, 'session_uuid'] = _df.apply(
-            lambda row: get_or_create_uuid(row), axis=1
+        positions = np.flatnonzero(df[self.unique_id_col].isin(partition))
+        sessionise = Sessionise(
+            df.iloc[positions], self.unique_id_col, self.datetime_col,
+            self.session_timeout, rules=self.rules, presorted=self.presorted
         )
-        queue.put(_df)
+        queue.put((positions, sessionise._session_ids('uuid')))
 
-    def assign_sessions(self, n_jobs: int = 1):
+    def assign_sessions(self, n_jobs: int = 1, session_id: str = 'uuid',
+                        session_col: str = 'session_uuid'):
         """
         Assigns unique session IDs to individual clicks that form the
         sessions. Supports parallel processing through setting ``n_jobs`` to
         higher than 1.
 
+        The data is sorted by unique identifier and timestamp to find the
+        sessions, unless declared as presorted, but only the session ID
+        column is added to the DataFrame, which keeps its original order.
+
         Args:
             n_jobs (int, optional): Defaults to 1. If 2 or higher, enables
-                parallel processing.
+                parallel processing. Only used when ``session_id`` is
+                ``uuid``, as the other types of ID must be computed over the
+                whole dataset to be consistent.
+            session_id (str, optional): Defaults to 'uuid'. Type of session
+                ID to assign. One of ``uuid`` for random UUID strings,
+                ``int`` for ``int64`` IDs numbering sessions from 0 in order
+                of unique identifier and start time, or ``hash`` for
+                ``int64`` IDs hashed from the unique ID and start time of
+                each session. ``int`` and ``hash`` IDs are identical across
+                reruns, and ``hash`` IDs are also identical across partitions
+                of the same data.
+            session_col (str, optional): Defaults to 'session_uuid'. Name of
+                the column to store the session IDs in.
 
         Returns:
             pd.DataFrame: Returns sessionised DataFrame, with session IDs 
-            stored in ``session_UUID`` column.
+            stored in ``session_col`` column.
         """
-        self._add_session_boundaries()
-        if n_jobs == 1:
-            self._df.loc[:, 'session_uuid'] = self.df[self.columns].apply(
-                lambda row: self._get_or_create_uuid(row), axis=1
+        if session_id not in ('uuid', 'int', 'hash'):
+            raise ValueError(
+                "Argument `session_id` must be one of 'uuid', 'int' or "
+                "'hash'."
             )
+        if n_jobs == 1 or session_id != 'uuid':
+            self._df[session_col] = self._session_ids(session_id)
             return self.df
         if n_jobs > 1:
-            partitions = self._create_partitions(n_jobs)
-            queue = Queue()
-            processes = []
-            for partition in partitions:
-                processes.append(Process(
-                    target=self._assign_sessions_parallel,
-                    args=(self.df, partition, queue)
-                ))
-            for process in processes:
-                process.start()
-            results = [queue.get() for process in processes]
-            for process in processes:
-                process.join()
-
-            self._df = pd.concat(results, axis=0)
-            self._df = self._df.sort_index()
+            with profile_stage(self.profiler, '_create_partitions',
+                               n_items=len(self._df)):
+                partitions = self._create_partitions(n_jobs)
+            with profile_stage(self.profiler, 'assign_session_ids',
+                               n_items=len(self._df)):
+                queue = Queue()
+                processes = []
+                for partition in partitions:
+                    processes.append(Process(
+                        target=self._assign_sessions_parallel,
+                        args=(self.df, partition, queue)
+                    ))
+                for process in processes:
+                    process.start()
+                results = [queue.get() for process in processes]
+                for process in processes:
+                    process.join()
+
+                session_ids = np.empty(len(self._df), dtype=object)
+                for positions, partition_ids in results:
+                    session_ids[positions] = partition_ids
+                self._df[session_col] = session_ids
             return self.df
@@ -0,0 +1,253 @@
+"""
+Opt-in instrumentation for the stages of model fitting and sessionising.
+"""
+
+import time
+import tracemalloc
+
+
+# Stages tracking memory which are currently running, outermost first.
+# ``tracemalloc`` has a single, process wide peak, so each stage folds the
+# peak so far into the stages enclosing it before resetting it.
+_ACTIVE_STAGES = []
+
+class StageStats:
+    """
+    Record of a single profiled stage.
+
+    Args:
+        name (str): Name of the stage, e.g. ``populate_count_matrix``
+        wall_time (float): Wall clock time taken by the stage, in seconds.
+        n_items (int): Number of rows or clicks processed by the stage.
+        peak_memory (int): Peak memory in bytes allocated by the stage, over
+            and above what was allocated when the stage started. ``None`` if
+            memory was not tracked.
+    """
+
+    def __init__(self, name: str, wall_time: float = 0.0,
+                 n_items: int = None, peak_memory: int = None) -> None:
+        self.name = name
+        self.wall_time = wall_time
+        self.n_items = n_items
+        self.peak_memory = peak_memory
+
+    def as_dict(self) -> dict:
+        """
+        Returns the stage statistics as a dictionary.
+
+        Returns:
+            dict: Dictionary with keys ``name``, ``wall_time``, ``n_items``
+            and ``peak_memory``.
+        """
+        return {
+            'name': self.name,
+            'wall_time': self.wall_time,
+            'n_items': self.n_items,
+            'peak_memory': self.peak_memory,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f'StageStats(name={self.name!r}, wall_time={self.wall_time:.6f}, '
+            f'n_items={self.n_items}, peak_memory={self.peak_memory})'
+        )
+
+
+class _Stage:
+    """
+    Context manager timing a single stage for a ``Profiler``.
+    """
+
+    def __init__(self, profiler, name: str, n_items: int = None) -> None:
+        self._profiler = profiler
+        self._stats = StageStats(name, n_items=n_items)
+        self._start = None
+        self._mem_start = None
+        self._mem_peak = None
+        self._started_tracing = False
+
+    @property
+    def n_items(self):
+        """
+        Number of rows or clicks processed by the stage
+        """
+        return self._stats.n_items
+
+    @n_items.setter
+    def n_items(self, value: int):
+        """
+        Sets the number of rows or clicks processed by the stage
+        """
+        self._stats.n_items = value
+
+    def __enter__(self):
+        if self._profiler.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            else:
+                peak = tracemalloc.get_traced_memory()[1]
+                for stage in _ACTIVE_STAGES:
+                    stage._mem_peak = max(stage._mem_peak, peak)
+                # Before Python 3.9, the peak cannot be reset, so stages
+                # started while memory is already traced may overstate
+                # their peak
+                if hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+            self._mem_start = tracemalloc.get_traced_memory()[0]
+            self._mem_peak = self._mem_start
+            _ACTIVE_STAGES.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._stats.wall_time = time.perf_counter() - self._start
+        if self._profiler.track_memory:
+            _ACTIVE_STAGES.remove(self)
+            peak = max(self._mem_peak, tracemalloc.get_traced_memory()[1])
+            self._stats.peak_memory = max(peak - self._mem_start, 0)
+            if self._started_tracing:
+                tracemalloc.stop()
+        self._profiler.record(self._stats)
+        return False
+
+
+class _NullStage:
+    """
+    No-op stand in for ``_Stage``, used when profiling is disabled.
+    """
+    n_items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """
+    Collects wall time, number of items processed and peak memory for each
+    stage of ``MarkovClickstream`` construction and
+    ``Sessionise.assign_sessions``.
+
+    Pass an instance through the ``profiler`` argument of either class to
+    enable instrumentation. When no profiler is given, stages are run through
+    a shared no-op context manager.
+
+    Args:
+        track_memory (bool, optional): Defaults to True. Whether to record
+            peak memory for each stage using ``tracemalloc``. Tracing memory
+            slows down allocation heavy stages, so disable it when only
+            timings are needed.
+        callbacks (list, optional): Defaults to None. Callables invoked with
+            the ``StageStats`` object of each stage as it completes.
+        logger (logging.Logger, optional): Defaults to None. Logger to which a
+            line is written at ``INFO`` level as each stage completes.
+    """
+
+    def __init__(self, track_memory: bool = True, callbacks: list = None,
+                 logger=None) -> None:
+        self.track_memory = track_memory
+        self.callbacks = list(callbacks) if callbacks else []
+        self.logger = logger
+        self._stages = []
+
+    @property
+    def stages(self) -> list:
+        """
+        Provides access to the list of ``StageStats`` recorded so far
+        """
+        return self._stages
+
+    @property
+    def total_time(self) -> float:
+        """
+        Total wall time across all recorded stages, in seconds
+        """
+        return sum(stage.wall_time for stage in self._stages)
+
+    def stage(self, name: str, n_items: int = None) -> _Stage:
+        """
+        Returns a context manager which profiles the code run inside it as a
+        stage. The number of items processed can be set on the returned
+        object inside the ``with`` block, if it is not known beforehand.
+
+        Args:
+            name (str): Name of the stage.
+            n_items (int, optional): Defaults to None. Number of rows or
+                clicks processed by the stage.
+
+        Returns:
+            Context manager for the stage.
+        """
+        return _Stage(self, name, n_items)
+
+    def record(self, stats: StageStats):
+        """
+        Records the statistics of a completed stage, and notifies the
+        callbacks and logger.
+
+        Args:
+            stats (StageStats): Statistics of the completed stage.
+        """
+        self._stages.append(stats)
+        for callback in self.callbacks:
+            callback(stats)
+        if self.logger is not None:
+            self.logger.info(
+                'markovclick stage %s: %.4fs, %s items, peak memory %s bytes',
+                stats.name, stats.wall_time, stats.n_items,
+                stats.peak_memory
+            )
+
+    def as_dict(self) -> dict:
+        """
+        Returns the recorded statistics as a dictionary keyed by stage name.
+        Stages which ran more than once have their wall time and number of
+        items summed, and the largest peak memory kept.
+
+        Returns:
+            dict: Dictionary of stage name to statistics dictionary.
+        """
+        summary = {}
+        for stage in self._stages:
+            if stage.name not in summary:
+                summary[stage.name] = stage.as_dict()
+                continue
+            entry = summary[stage.name]
+            entry['wall_time'] += stage.wall_time
+            if stage.n_items is not None:
+                entry['n_items'] = (entry['n_items'] or 0) + stage.n_items
+            if stage.peak_memory is not None:
+                entry['peak_memory'] = max(entry['peak_memory'] or 0,
+                                           stage.peak_memory)
+        return summary
+
+    def reset(self):
+        """
+        Clears all recorded stages.
+        """
+        self._stages = []
+
+
+def profile_stage(profiler, name: str, n_items: int = None):
+    """
+    Returns a context manager profiling a stage on ``profiler``, or a no-op
+    context manager if ``profiler`` is None.
+
+    Args:
+        profiler (Profiler): Profiler to record the stage on, or None.
+        name (str): Name of the stage.
+        n_items (int, optional): Defaults to None. Number of rows or clicks
+            processed by the stage.
+    """
+    if profiler is None:
+        return _NULL_STAGE
+    return profiler.stage(name, n_items)
@@ -0,0 +1,325 @@
+"""
+Segmented models, which hold a Markov chain for each segment of a
+sessionised clickstream dataset over a shared list of pages.
+"""
+
+import numpy as np
+import pandas as pd
+from markovclick.metrics import _align_matrices, _row_metric
+from markovclick.models import MarkovClickstream
+from markovclick.profiling import profile_stage
+from markovclick.utils.helpers import encode_transitions
+
+
+def _scipy_sparse():
+    """
+    Imports ``scipy.sparse``, which is only required for sparse models.
+    """
+    try:
+        import scipy.sparse as sparse
+    except ImportError as err:
+        raise ImportError(
+            'Sparse segmented models require scipy, which can be installed '
+            'with `pip install scipy`.'
+        ) from err
+    return sparse
+
+
+class SegmentedMarkovClickstream:
+    """
+    Builds a Markov chain for every segment (e.g. country x device x
+    campaign) of a sessionised clickstream DataFrame, in a single pass over
+    the DataFrame. All segments share one list of pages, so that the rows
+    and columns of every segment's matrices line up.
+
+    The counts are held as a stacked tensor of shape
+    ``(segments, pages, pages)``. When ``sparse`` is True, this is instead a
+    ``scipy.sparse`` CSR matrix of shape ``(segments * pages, pages)``, with
+    the rows of each segment stacked one after the other.
+
+    Args:
+        df (pd.DataFrame): Sessionised DataFrame with a row for each click,
+            such as that returned by ``Sessionise.assign_sessions()``.
+        segment_cols (list): Column names which together define a segment.
+        session_col (str, optional): Defaults to 'session_uuid'. Column name
+            of session ID column.
+        page_col (str, optional): Defaults to 'page'. Column name of page
+            column.
+        datetime_col (str, optional): Defaults to None. Column name of
+            timestamp column, used to order the clicks within each session.
+            If None, clicks are taken to be in order within each session.
+        sparse (bool, optional): Defaults to False. Whether to hold the
+            counts and probabilities as sparse matrices.
+        profiler (Profiler, optional): Defaults to None.
+            ``markovclick.profiling.Profiler`` on which to record each stage.
+    """
+
+    def __init__(self, df, segment_cols: list,
+                 session_col: str = 'session_uuid', page_col: str = 'page',
+                 datetime_col: str = None, sparse: bool = False,
+                 profiler=None) -> None:
+        self.segment_cols = list(segment_cols)
+        self.sparse = sparse
+        self.profiler = profiler
+        self.pages = []
+        self.segments = []
+        self._segment_index = {}
+        self._count_tensor = None
+        self._prob_tensor = None
+        self.populate_count_tensor(df, session_col, page_col, datetime_col)
+        self.compute_prob_tensor()
+
+    @property
+    def count_tensor(self):
+        """
+        Provides access to the stacked count matrices of the segments
+        """
+        return self._count_tensor
+
+    @property
+    def prob_tensor(self):
+        """
+        Provides access to the stacked probability matrices of the segments
+        """
+        return self._prob_tensor
+
+    def segment_index(self, segment) -> int:
+        """
+        Returns the position of a segment in ``segments``.
+
+        Args:
+            segment: Value of the segment column, or tuple of values of the
+                segment columns if there is more than one.
+
+        Returns:
+            int: Position of the segment.
+        """
+        try:
+            return self._segment_index[segment]
+        except KeyError:
+            raise KeyError(f'Segment {segment} not in model.') from None
+
+    def populate_count_tensor(self, df, session_col: str, page_col: str,
+                              datetime_col: str = None):
+        """
+        Assembles the stacked matrices of counts of transitions for every
+        segment, in a single pass over the DataFrame.
+
+        Args:
+            df (pd.DataFrame): Sessionised DataFrame.
+            session_col (str): Column name of session ID column.
+            page_col (str): Column name of page column.
+            datetime_col (str, optional): Defaults to None. Column name of
+                timestamp column.
+        """
+        # Clicks without a page, segment or session cannot be counted, and
+        # are dropped as if they had not been logged
+        df = df[df[[page_col, session_col] + self.segment_cols]
+                .notna().all(axis=1)]
+        with profile_stage(self.profiler, 'get_unique_pages',
+                           n_items=len(df)):
+            page_codes, pages = pd.factorize(df[page_col], sort=True)
+            self.pages = list(pages)
+            if len(self.segment_cols) == 1:
+                segment_codes, segments = pd.factorize(
+                    df[self.segment_cols[0]], sort=True
+                )
+            else:
+                segment_codes, segments = pd.factorize(
+                    pd.MultiIndex.from_frame(df[self.segment_cols]),
+                    sort=True
+                )
+            self.segments = list(segments)
+            self._segment_index = {
+                segment: i for i, segment in enumerate(self.segments)
+            }
+
+        with profile_stage(self.profiler, 'populate_count_matrix',
+                           n_items=len(df)):
+            session_codes = pd.factorize(df[session_col])[0]
+            if datetime_col is None:
+                order = np.argsort(session_codes, kind='stable')
+            else:
+                order = np.lexsort((
+                    df[datetime_col].to_numpy().view(np.int64), session_codes
+                ))
+            session_codes = session_codes[order]
+            page_codes = page_codes[order]
+            segment_codes = segment_codes[order]
+            same_session = session_codes[1:] == session_codes[:-1]
+
+            n_pages = len(self.pages)
+            rows = segment_codes[:-1][same_session] * n_pages + \
+                page_codes[:-1][same_session]
+            cols = page_codes[1:][same_session]
+            shape = (len(self.segments) * n_pages, n_pages)
+            if self.sparse:
+                sparse = _scipy_sparse()
+                self._count_tensor = sparse.csr_matrix(
+                    (np.ones(len(rows)), (rows, cols)), shape=shape
+                )
+            else:
+                self._count_tensor = np.bincount(
+                    rows * n_pages + cols, minlength=shape[0] * shape[1]
+                ).reshape(
+                    len(self.segments), n_pages, n_pages
+                ).astype(float)
+        return self._count_tensor
+
+    def compute_prob_tensor(self):
+        """
+        Computes the stacked probability matrices for every segment, by
+        normalising each row of counts to sum to 1.
+        """
+        with profile_stage(self.profiler, 'compute_prob_matrix',
+                           n_items=len(self.segments) * len(self.pages)):
+            if self.sparse:
+                sparse = _scipy_sparse()
+                row_sums = np.asarray(
+                    self._count_tensor.sum(axis=1)
+                ).ravel()
+                inverse = np.divide(
+                    1.0, row_sums, out=np.zeros_like(row_sums),
+                    where=row_sums > 0
+                )
+                self._prob_tensor = sparse.diags(inverse).dot(
+                    self._count_tensor
+                ).tocsr()
+            else:
+                row_sums = self._count_tensor.sum(axis=2, keepdims=True)
+                self._prob_tensor = np.divide(
+                    self._count_tensor, row_sums,
+                    out=np.zeros_like(self._count_tensor),
+                    where=row_sums > 0
+                )
+
+    def _segment_rows(self, tensor, segment):
+        """
+        Returns the dense matrix of a segment from a stacked tensor.
+        """
+        i = self.segment_index(segment)
+        if self.sparse:
+            n_pages = len(self.pages)
+            return tensor[i * n_pages:(i + 1) * n_pages].toarray()
+        return tensor[i]
+
+    def segment_count_matrix(self, segment) -> np.ndarray:
+        """
+        Returns the matrix of transition counts for a segment.
+
+        Args:
+            segment: Value(s) of the segment column(s).
+
+        Returns:
+            np.ndarray: Dense matrix of transition counts.
+        """
+        return self._segment_rows(self._count_tensor, segment)
+
+    def segment_prob_matrix(self, segment) -> np.ndarray:
+        """
+        Returns the matrix of transition probabilities for a segment.
+
+        Args:
+            segment: Value(s) of the segment column(s).
+
+        Returns:
+            np.ndarray: Dense matrix of transition probabilities.
+        """
+        return self._segment_rows(self._prob_tensor, segment)
+
+    def model(self, segment) -> MarkovClickstream:
+        """
+        Returns a ``MarkovClickstream`` for a single segment, over the shared
+        list of pages.
+
+        Args:
+            segment: Value(s) of the segment column(s).
+
+        Returns:
+            MarkovClickstream: Markov chain of the segment.
+        """
+        return MarkovClickstream.from_counts(
+            self.segment_count_matrix(segment), self.pages
+        )
+
+    def calc_log_likelihoods(self, clickstream_list: list,
+                             segments: list = None) -> np.ndarray:
+        """
+        Calculates the log-likelihood of each of a list of clickstreams under
+        the Markov chain of each segment, in a single batch.
+
+        Args:
+            clickstream_list (list): List of clickstreams to score.
+            segments (list, optional): Defaults to None. Segments to score
+                against. If None, all segments are used.
+
+        Returns:
+            np.ndarray: Matrix of log-likelihoods, with a row for each
+            clickstream and a column for each segment. Clickstreams
+            containing a transition with zero probability, or a page not in
+            the model, have a log-likelihood of ``-inf``.
+        """
+        if segments is None:
+            segments = self.segments
+        page_index = {page: i for i, page in enumerate(self.pages)}
+        from_pages, to_pages, stream_index = encode_transitions(
+            clickstream_list, page_index, default=-1
+        )
+        known = (from_pages >= 0) & (to_pages >= 0)
+        n_pages = len(self.pages)
+
+        log_likelihoods = np.zeros((len(clickstream_list), len(segments)))
+        for j, segment in enumerate(segments):
+            probs = np.zeros(len(from_pages))
+            rows = self.segment_index(segment) * n_pages + from_pages[known]
+            if self.sparse:
+                probs[known] = np.asarray(
+                    self._prob_tensor[rows, to_pages[known]]
+                ).ravel()
+            else:
+                probs[known] = self._prob_tensor.reshape(-1, n_pages)[
+                    rows, to_pages[known]
+                ]
+            with np.errstate(divide='ignore'):
+                log_probs = np.log(probs)
+            log_likelihoods[:, j] = np.bincount(
+                stream_index, weights=log_probs,
+                minlength=len(clickstream_list)
+            )
+        return log_likelihoods
+
+    def compare(self, segment_a, segment_b,
+                metric: str = 'total_variation',
+                epsilon: float = 0.0) -> np.ndarray:
+        """
+        Compares the Markov chains of two segments, by calculating a distance
+        or divergence between the transition probabilities out of each page.
+
+        Args:
+            segment_a: Value(s) of the segment column(s) of the first segment.
+            segment_b: Value(s) of the segment column(s) of the second
+                segment.
+            metric (str, optional): Defaults to 'total_variation'. One of
+                ``total_variation``, ``kl`` (Kullback-Leibler divergence of
+                ``segment_a`` from ``segment_b``) or ``js`` (Jensen-Shannon
+                divergence). See ``markovclick.metrics``.
+            epsilon (float, optional): Defaults to 0. Smoothing applied when
+                calculating the Kullback-Leibler divergence.
+
+        Returns:
+            np.ndarray: Array of the distance or divergence for each page.
+            NaN for pages without any transitions in either segment.
+        """
+        n_pages = len(self.pages)
+        i = self.segment_index(segment_a)
+        j = self.segment_index(segment_b)
+        if self.sparse:
+            prob_a = self._prob_tensor[i * n_pages:(i + 1) * n_pages]
+            prob_b = self._prob_tensor[j * n_pages:(j + 1) * n_pages]
+        else:
+            prob_a = self._prob_tensor[i]
+            prob_b = self._prob_tensor[j]
+        rows, _, aligned_a, aligned_b = _align_matrices(prob_a, prob_b,
+                                                        n_pages)
+        return _row_metric(metric, rows, aligned_a, aligned_b, n_pages,
+                           epsilon)
@@ -0,0 +1,251 @@
+"""
+Publishing of fitted Markov chains as memory-mapped files, which many
+processes can attach to read-only without each holding a copy.
+"""
+
+import os
+import shutil
+import time
+from uuid import uuid4
+import numpy as np
+from markovclick.models import MarkovClickstream
+
+
+CURRENT_FILE = 'CURRENT'
+VERSIONS_DIR = 'versions'
+
+
+def _top_k(prob_matrix: np.ndarray, k: int,
+           block_size: int = 1024) -> tuple:
+    """
+    Finds the ``k`` most probable next pages from each page, in blocks of
+    rows to bound the memory used for sorting. Ties are broken by page order.
+    """
+    n_pages = prob_matrix.shape[0]
+    k = min(k, n_pages)
+    top_pages = np.empty((n_pages, k), dtype=np.int32)
+    top_probs = np.empty((n_pages, k), dtype=prob_matrix.dtype)
+    for start in range(0, n_pages, block_size):
+        block = np.asarray(prob_matrix[start:start + block_size])
+        order = np.argsort(-block, axis=1, kind='stable')[:, :k]
+        top_pages[start:start + block_size] = order
+        top_probs[start:start + block_size] = np.take_along_axis(
+            block, order, axis=1
+        )
+    return top_pages, top_probs
+
+
+def publish_model(model: MarkovClickstream, directory: str, top_k: int = 10,
+                  keep: int = 2) -> str:
+    """
+    Publishes a fitted Markov chain to a directory, as a new version which
+    ``SharedModel`` attaches to.
+
+    The pages, sorted so that they can be looked up with a binary search,
+    the count and probability matrices in the order of the sorted pages, and
+    the ``top_k`` most probable next pages from each page are written as
+    ``.npy`` files to a new version directory. The ``CURRENT`` file is then
+    replaced atomically to point to it, so readers never see a partly
+    written version.
+
+    Args:
+        model (MarkovClickstream): Fitted Markov chain to publish.
+        directory (str): Directory to publish to, created if it does not
+            exist.
+        top_k (int, optional): Defaults to 10. Number of most probable next
+            pages to cache for each page.
+        keep (int, optional): Defaults to 2. Number of most recent versions
+            to keep. Older versions are deleted, which is safe for processes
+            still attached to them on POSIX systems, as their mappings stay
+            valid until closed.
+
+    Returns:
+        str: Name of the version published.
+    """
+    if keep < 1:
+        raise ValueError('Argument `keep` must be at least 1.')
+    pages = np.array(model.pages, dtype=str)
+    order = np.argsort(pages, kind='stable')
+    if len(order) > 1 and (pages[order][1:] == pages[order][:-1]).any():
+        raise ValueError('Pages of the model must be unique.')
+    prob_matrix = model.prob_matrix[np.ix_(order, order)]
+    top_pages, top_probs = _top_k(prob_matrix, top_k)
+
+    versions = os.path.join(directory, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    version = f'{int(time.time() * 10 ** 6):016d}-{uuid4().hex[:8]}'
+    temporary = os.path.join(versions, f'.{version}.{os.getpid()}.tmp')
+    os.makedirs(temporary)
+    for name, array in [('pages', pages[order]),
+                        ('count_matrix',
+                         model.count_matrix[np.ix_(order, order)]),
+                        ('prob_matrix', prob_matrix),
+                        ('top_k_pages', top_pages),
+                        ('top_k_probs', top_probs)]:
+        np.save(os.path.join(temporary, f'{name}.npy'), array)
+    os.replace(temporary, os.path.join(versions, version))
+
+    current = os.path.join(directory, CURRENT_FILE)
+    with open(f'{current}.{os.getpid()}.tmp', 'w') as file:
+        file.write(version)
+    os.replace(f'{current}.{os.getpid()}.tmp', current)
+
+    # Versions sort by the time they were published. The version just
+    # published is always kept, even if the clock has gone backwards.
+    older = sorted(name for name in os.listdir(versions)
+                   if not name.startswith('.') and name != version)
+    for name in older[:max(len(older) - keep + 1, 0)]:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+    return version
+
+
+class SharedModel:
+    """
+    Attaches read-only to the current version of a Markov chain published
+    with ``publish_model()``.
+
+    The pages, matrices and top-k cache are memory-mapped rather than read
+    into memory, so processes attached to the same version share a single
+    copy in the operating system's page cache. ``refresh()`` attaches to a
+    newer version once one is published.
+
+    Args:
+        directory (str): Directory the model was published to.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.version = None
+        self._model = None
+        if not self.refresh():
+            raise FileNotFoundError(
+                f'No model has been published to {directory}.'
+            )
+
+    def _current_version(self) -> str:
+        """
+        Returns the version the ``CURRENT`` file points to, or None if no
+        model has been published.
+        """
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> bool:
+        """
+        Attaches to the current version, if it differs from the version
+        attached to.
+
+        A version may be deleted by ``publish_model()`` between reading the
+        ``CURRENT`` file and attaching to it, if newer versions are published
+        in the meantime. The ``CURRENT`` file is then read again, until a
+        version is attached to or it stops changing.
+
+        Returns:
+            bool: True if a different version was attached to.
+        """
+        version = self._current_version()
+        while True:
+            if version is None or version == self.version:
+                return False
+            try:
+                arrays = self._load(version)
+                break
+            except FileNotFoundError:
+                latest = self._current_version()
+                if latest == version:
+                    raise
+                version = latest
+        self.pages = arrays['pages']
+        self.count_matrix = arrays['count_matrix']
+        self.prob_matrix = arrays['prob_matrix']
+        self.top_k_pages = arrays['top_k_pages']
+        self.top_k_probs = arrays['top_k_probs']
+        self.version = version
+        self._model = None
+        return True
+
+    def _load(self, version: str) -> dict:
+        """
+        Memory-maps the arrays of a version read-only.
+        """
+        path = os.path.join(self.directory, VERSIONS_DIR, version)
+        return {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in ['pages', 'count_matrix', 'prob_matrix',
+                         'top_k_pages', 'top_k_probs']
+        }
+
+    def page_index(self, pages) -> np.ndarray:
+        """
+        Looks up the row of each of an array of pages by binary search.
+
+        Args:
+            pages: Array or list of pages.
+
+        Returns:
+            np.ndarray: Row of each page, or -1 if it is not in the model.
+        """
+        pages = np.asarray(pages, dtype=str)
+        index = np.searchsorted(self.pages, pages)
+        index[index == len(self.pages)] = 0
+        found = self.pages[index] == pages if len(self.pages) else \
+            np.zeros(len(pages), dtype=bool)
+        return np.where(found, index, -1)
+
+    def calc_transition_probs(self, from_pages, to_pages) -> np.ndarray:
+        """
+        Looks up the probability of each of an array of transitions.
+
+        Args:
+            from_pages: Array or list of pages transitioned from.
+            to_pages: Array or list of pages transitioned to.
+
+        Returns:
+            np.ndarray: Probability of each transition, which is 0 if
+            either page is not in the model.
+        """
+        rows = self.page_index(from_pages)
+        columns = self.page_index(to_pages)
+        known = (rows >= 0) & (columns >= 0)
+        probs = np.zeros(len(rows))
+        probs[known] = self.prob_matrix[rows[known], columns[known]]
+        return probs
+
+    def top_next_pages(self, page: str, k: int = None) -> list:
+        """
+        Returns the most probable next pages from a page, from the top-k
+        cache.
+
+        Args:
+            page (str): Page transitioned from.
+            k (int, optional): Defaults to None. Number of pages to return,
+                at most the ``top_k`` the model was published with. If None,
+                all cached pages are returned.
+
+        Returns:
+            list: List of ``(page, probability)`` tuples with non-zero
+            probability, in descending order of probability.
+        """
+        row = self.page_index([page])[0]
+        if row < 0:
+            raise ValueError(f'Page {page} is not in the model.')
+        top_pages = self.top_k_pages[row, :k]
+        top_probs = self.top_k_probs[row, :k]
+        return [(str(self.pages[column]), float(prob))
+                for column, prob in zip(top_pages, top_probs) if prob > 0]
+
+    @property
+    def model(self) -> MarkovClickstream:
+        """
+        ``MarkovClickstream`` over the memory-mapped matrices of the version
+        attached to, without copying them
+        """
+        if self._model is None:
+            self._model = MarkovClickstream._from_matrices(
+                self.count_matrix, self.prob_matrix, self.pages.tolist(),
+                self.count_matrix.dtype, self.prob_matrix.dtype
+            )
+        return self._model
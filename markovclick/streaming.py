@@ -0,0 +1,360 @@
+"""
+Incremental scoring of live sessions against a fitted Markov chain, one
+click at a time.
+"""
+
+import numpy as np
+import pandas as pd
+from markovclick.models import START_PAGE, OTHER_PAGE
+
+
+class IncrementalSessionScorer:
+    """
+    Keeps the running log-likelihood and last page of every active session,
+    so that each click is scored in constant time, rather than rescoring the
+    whole clickstream as ``MarkovClickstream.calc_prob_to_page()`` does.
+
+    The surprise of a click is the negative log-probability of the
+    transition to it from the session's previous page. The first click of a
+    session is scored against ``START_PAGE`` if the model has start and exit
+    pseudo-states, and has a surprise of 0 otherwise. Pages not in the model
+    are scored as ``OTHER_PAGE`` if the model has it, and otherwise as
+    transitions with zero probability.
+
+    The state of the sessions is held in compact arrays indexed by slot,
+    which are reused once a session is evicted. A click more than
+    ``session_timeout`` minutes after the previous click of its session
+    starts a new session, as in ``Sessionise``, and ``evict()`` frees the
+    slots of idle sessions. The final scores of sessions which end, whether
+    by being evicted, by a click after the timeout restarting them, or by
+    being evicted to make room for new sessions, are buffered until they are
+    returned by the next call to ``evict()``.
+
+    Args:
+        model (MarkovClickstream): Fitted Markov chain to score against.
+        session_timeout (int, optional): Defaults to 30. Maximum time in
+            minutes after which a session is broken.
+        min_prob (float, optional): Defaults to 0. Probabilities are clipped
+            to be at least this value, so that transitions never seen in
+            training have a finite surprise.
+        capacity (int, optional): Defaults to 1024. Number of sessions the
+            arrays initially have room for. They grow as needed.
+    """
+
+    def __init__(self, model, session_timeout: int = 30,
+                 min_prob: float = 0.0, capacity: int = 1024) -> None:
+        self.model = model
+        self.session_timeout = session_timeout
+        self.min_prob = min_prob
+        self._prob_matrix = model.prob_matrix
+        self._page_index = {page: i for i, page in enumerate(model.pages)}
+        self._unknown = self._page_index.get(OTHER_PAGE, -1)
+        self._start = self._page_index.get(START_PAGE, -1) \
+            if model.start_exit else -1
+        self._timeout = session_timeout * 60
+        self._latest = -np.inf
+        self._ended = []
+
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._session_ids = np.empty(capacity, dtype=object)
+        self._last_page = np.full(capacity, -1, dtype=np.int32)
+        self._last_seen = np.zeros(capacity)
+        self._log_likelihood = np.zeros(capacity)
+        self._n_clicks = np.zeros(capacity, dtype=np.int32)
+        self._n_scored = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def capacity(self) -> int:
+        """
+        Number of sessions the arrays have room for
+        """
+        return len(self._last_page)
+
+    def _grow(self):
+        """
+        Doubles the size of the arrays of session state.
+        """
+        capacity = self.capacity
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+        for name, fill in [('_session_ids', None), ('_last_page', -1),
+                           ('_last_seen', 0), ('_log_likelihood', 0),
+                           ('_n_clicks', 0), ('_n_scored', 0)]:
+            array = getattr(self, name)
+            grown = np.empty(2 * capacity, dtype=array.dtype)
+            grown[:capacity] = array
+            grown[capacity:] = fill
+            setattr(self, name, grown)
+
+    def _reserve(self, session_ids, now: float):
+        """
+        Ensures there is a free slot for each of the given sessions which is
+        not active, evicting the sessions idle at ``now`` before growing the
+        arrays.
+
+        Finding the idle sessions scans every active session, so if fewer
+        than a quarter of the slots are free after evicting them, the arrays
+        are grown as well. At least a quarter of the capacity is then
+        allocated before the next scan, keeping the cost per new session
+        constant on average.
+        """
+        n_slots = sum(session_id not in self._slots
+                      for session_id in session_ids)
+        if len(self._free) >= n_slots:
+            return
+        # Sessions in ``session_ids`` may be evicted, and need a slot again
+        self._evict_idle(now)
+        n_slots = sum(session_id not in self._slots
+                      for session_id in session_ids)
+        if len(self._free) < self.capacity // 4:
+            self._grow()
+        while len(self._free) < n_slots:
+            self._grow()
+
+    def _slot(self, session_id) -> int:
+        """
+        Returns the slot of a session, allocating a free slot if the session
+        is not active.
+        """
+        slot = self._slots.get(session_id)
+        if slot is None:
+            slot = self._free.pop()
+            self._slots[session_id] = slot
+            self._session_ids[slot] = session_id
+            self._n_clicks[slot] = 0
+        return slot
+
+    def _log_prob(self, from_page: int, to_page: int) -> float:
+        """
+        Returns the log-probability of a transition, where either page may
+        be -1 if it is not in the model.
+        """
+        if from_page < 0 or to_page < 0:
+            prob = 0.0
+        else:
+            prob = self._prob_matrix[from_page, to_page]
+        prob = max(prob, self.min_prob)
+        return np.log(prob) if prob > 0 else -np.inf
+
+    def update(self, session_id, page, timestamp: float) -> float:
+        """
+        Scores a click, and updates the state of its session.
+
+        Args:
+            session_id: Identifier of the session, e.g. a cookie ID.
+            page: Page clicked.
+            timestamp (float): Time of the click in seconds, e.g. from
+                ``time.time()``.
+
+        Returns:
+            float: Surprise of the click, i.e. the negative log-probability
+            of the transition to it.
+        """
+        self._latest = max(self._latest, timestamp)
+        code = self._page_index.get(page, self._unknown)
+        if session_id not in self._slots:
+            self._reserve([session_id], self._latest)
+        slot = self._slot(session_id)
+        new_session = self._n_clicks[slot] == 0 or \
+            timestamp - self._last_seen[slot] > self._timeout
+        if new_session:
+            if self._n_clicks[slot] > 0:
+                self._ended.append(self._scores(np.array([slot])))
+            self._log_likelihood[slot] = 0
+            self._n_clicks[slot] = 0
+            self._n_scored[slot] = 0
+            if self._start < 0:
+                log_prob = 0.0
+            else:
+                log_prob = self._log_prob(self._start, code)
+                self._n_scored[slot] += 1
+        else:
+            log_prob = self._log_prob(self._last_page[slot], code)
+            self._n_scored[slot] += 1
+        self._log_likelihood[slot] += log_prob
+        self._n_clicks[slot] += 1
+        self._last_page[slot] = code
+        self._last_seen[slot] = timestamp
+        return -log_prob
+
+    def update_batch(self, session_ids, pages, timestamps) -> np.ndarray:
+        """
+        Scores a batch of clicks, in the order given, and updates the state
+        of their sessions. Gives the same results as calling ``update()`` on
+        each click in turn, but with the scoring vectorised.
+
+        Args:
+            session_ids: Array of session identifiers.
+            pages: Array of pages clicked.
+            timestamps: Array of times of the clicks in seconds.
+
+        Returns:
+            np.ndarray: Surprise of each click.
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        if len(timestamps) == 0:
+            return np.zeros(0)
+        codes = np.fromiter(
+            (self._page_index.get(page, self._unknown) for page in pages),
+            dtype=np.int64, count=len(timestamps)
+        )
+        session_codes, uniques = pd.factorize(
+            np.asarray(session_ids, dtype=object)
+        )
+        # Evicting before looking up any slots keeps the slots of this
+        # batch from being freed part way through. Sessions are only evicted
+        # if idle at the earliest click of the batch, as they would be by
+        # calling ``update()`` on each click in turn.
+        self._reserve(uniques, max(self._latest, timestamps.min()))
+        self._latest = max(self._latest, timestamps.max())
+        slots = np.array([self._slot(session_id) for session_id in uniques],
+                         dtype=np.int64)[session_codes]
+
+        # Clicks of each session in arrival order, preceded by the stored
+        # state of the session
+        order = np.argsort(session_codes, kind='stable')
+        slots, codes, timestamps = slots[order], codes[order], \
+            timestamps[order]
+        first = np.ones(len(slots), dtype=bool)
+        first[1:] = slots[1:] != slots[:-1]
+        last = np.ones(len(slots), dtype=bool)
+        last[:-1] = first[1:]
+        previous_page = np.empty(len(slots), dtype=np.int64)
+        previous_page[1:] = codes[:-1]
+        previous_page[first] = self._last_page[slots[first]]
+        previous_time = np.empty(len(slots))
+        previous_time[1:] = timestamps[:-1]
+        previous_time[first] = self._last_seen[slots[first]]
+        has_previous = ~first | (self._n_clicks[slots] > 0)
+        new_session = ~has_previous | \
+            (timestamps - previous_time > self._timeout)
+
+        from_pages = np.where(new_session, self._start, previous_page)
+        scored = ~new_session | (self._start >= 0)
+        known = scored & (from_pages >= 0) & (codes >= 0)
+        probs = np.zeros(len(slots))
+        probs[known] = self._prob_matrix[from_pages[known], codes[known]]
+        probs = np.maximum(probs, self.min_prob)
+        with np.errstate(divide='ignore'):
+            log_probs = np.where(scored, np.log(probs), 0.0)
+
+        # Sum over each run of clicks within a single session, and carry
+        # the stored state forward unless the run starts a new session
+        run_start = first | new_session
+        runs = np.cumsum(run_start) - 1
+        run_log_likelihood = np.bincount(runs, weights=log_probs)
+        run_clicks = np.bincount(runs)
+        run_scored = np.bincount(runs, weights=scored)
+        run_starts = np.flatnonzero(run_start)
+        run_ends = np.append(run_starts[1:], len(slots)) - 1
+        run_slots = slots[run_starts]
+        resets = new_session[run_starts]
+        first_runs = first[run_starts]
+        carried = first_runs & ~resets
+        run_log_likelihood += np.where(
+            carried, self._log_likelihood[run_slots], 0
+        )
+        run_clicks += np.where(carried, self._n_clicks[run_slots], 0)
+        run_scored += np.where(carried, self._n_scored[run_slots], 0)
+
+        # Sessions restarted by a click after the timeout end, whether they
+        # were stored before the batch or are earlier runs within it
+        restarted = np.flatnonzero(resets & has_previous[run_starts])
+        stored = restarted[first_runs[restarted]]
+        if len(stored):
+            self._ended.append(self._scores(run_slots[stored]))
+        earlier = restarted[~first_runs[restarted]] - 1
+        if len(earlier):
+            self._ended.append(self._frame(
+                self._session_ids[run_slots[earlier]], run_clicks[earlier],
+                run_log_likelihood[earlier], run_scored[earlier],
+                timestamps[run_ends[earlier]]
+            ))
+
+        final_runs = runs[last]
+        final_slots = slots[last]
+        self._log_likelihood[final_slots] = run_log_likelihood[final_runs]
+        self._n_clicks[final_slots] = run_clicks[final_runs]
+        self._n_scored[final_slots] = run_scored[final_runs]
+        self._last_page[final_slots] = codes[last]
+        self._last_seen[final_slots] = timestamps[last]
+
+        surprise = np.empty(len(slots))
+        surprise[order] = -log_probs
+        return surprise
+
+    def _evict_idle(self, now: float):
+        """
+        Frees the slots of the sessions idle at ``now``, buffering their
+        final scores.
+        """
+        active = np.fromiter(self._slots.values(), dtype=np.int64,
+                             count=len(self._slots))
+        idle = active[self._last_seen[active] < now - self._timeout]
+        if len(idle):
+            self._ended.append(self._scores(idle))
+        for slot in idle:
+            del self._slots[self._session_ids[slot]]
+            self._session_ids[slot] = None
+        self._free.extend(idle.tolist())
+
+    def evict(self, now: float) -> pd.DataFrame:
+        """
+        Ends the sessions with no clicks in the ``session_timeout`` minutes
+        before ``now``, and frees their slots.
+
+        Args:
+            now (float): Current time in seconds.
+
+        Returns:
+            pd.DataFrame: Final scores of every session which has ended
+            since the previous call, in the order they ended. As well as the
+            sessions evicted by this call, these include sessions restarted
+            by a click after the timeout, and sessions evicted to make room
+            for new sessions. See ``scores()``.
+        """
+        self._evict_idle(now)
+        ended = pd.concat([self._frame([], [], [], [], [])] + self._ended)
+        self._ended = []
+        return ended
+
+    @staticmethod
+    def _frame(session_ids, n_clicks, log_likelihood, n_scored,
+               last_seen) -> pd.DataFrame:
+        """
+        Returns a DataFrame of the scores of sessions.
+        """
+        n_scored = np.asarray(n_scored, dtype=np.int32)
+        log_likelihood = np.asarray(log_likelihood, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_surprise = -log_likelihood / n_scored
+        return pd.DataFrame({
+            'n_clicks': np.asarray(n_clicks, dtype=np.int32),
+            'log_likelihood': log_likelihood,
+            'mean_surprise': np.where(n_scored > 0, mean_surprise, np.nan),
+            'last_seen': np.asarray(last_seen, dtype=float),
+        }, index=pd.Index(list(session_ids), name='session_id'))
+
+    def _scores(self, slots: np.ndarray) -> pd.DataFrame:
+        """
+        Returns the scores of the sessions in the given slots.
+        """
+        return self._frame(self._session_ids[slots].tolist(),
+                           self._n_clicks[slots],
+                           self._log_likelihood[slots],
+                           self._n_scored[slots], self._last_seen[slots])
+
+    def scores(self) -> pd.DataFrame:
+        """
+        Returns the scores of all active sessions.
+
+        Returns:
+            pd.DataFrame: DataFrame indexed by session ID, with the number
+            of clicks, the log-likelihood of the session so far, the mean
+            surprise per scored click and the time of the last click.
+        """
+        return self._scores(np.fromiter(self._slots.values(), dtype=np.int64,
+                                        count=len(self._slots)))
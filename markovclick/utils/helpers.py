@@ -2,6 +2,14 @@
 Helper utility functions
 """
 
+from multiprocessing import Pool
+import numpy as np
+
+
+# Data shared with the worker processes of a pool, set once per process by
+# ``init_worker`` rather than sent with every task.
+WORKER_DATA = {}
+
 
 def flatten_list(nested_list: [list]) -> list:
     """
@@ -14,3 +22,162 @@ def flatten_list(nested_list: [list]) -> list:
         list: Flattened list
     """
     return [item for sublist in nested_list for item in sublist]
+
+
+def encode_clickstreams(clickstream_list: list, page_index: dict,
+                        default: int = None) -> tuple:
+    """
+    Function to encode a list of clickstreams as a flat array of integer
+    page codes
+
+    Args:
+        clickstream_list (list): List of clickstreams
+        page_index (dict): Dictionary mapping each page to its code
+        default (int, optional): Defaults to None. Code to use for pages not
+            in ``page_index``. If None, unknown pages raise a ``KeyError``.
+
+    Returns:
+        tuple: Flat array of page codes, and array of the length of each
+        clickstream
+    """
+    lengths = np.fromiter(
+        (len(stream) for stream in clickstream_list), dtype=np.int64,
+        count=len(clickstream_list)
+    )
+    if default is None:
+        pages = (page_index[page] for stream in clickstream_list
+                 for page in stream)
+    else:
+        pages = (page_index.get(page, default) for stream in clickstream_list
+                 for page in stream)
+    codes = np.fromiter(pages, dtype=np.int64, count=int(lengths.sum()))
+    return codes, lengths
+
+
+def encode_transitions(clickstream_list: list, page_index: dict,
+                       default: int = None) -> tuple:
+    """
+    Function to encode the transitions within a list of clickstreams as
+    arrays of integer page codes
+
+    Args:
+        clickstream_list (list): List of clickstreams
+        page_index (dict): Dictionary mapping each page to its code
+        default (int, optional): Defaults to None. Code to use for pages not
+            in ``page_index``. If None, unknown pages raise a ``KeyError``.
+
+    Returns:
+        tuple: Arrays of the code of the page transitioned from, the code of
+        the page transitioned to, and the index of the clickstream, for each
+        transition
+    """
+    codes, lengths = encode_clickstreams(clickstream_list, page_index,
+                                         default)
+    stream_index = np.repeat(np.arange(len(lengths)), lengths)
+    same_stream = stream_index[1:] == stream_index[:-1]
+    return (
+        codes[:-1][same_stream], codes[1:][same_stream],
+        stream_index[1:][same_stream]
+    )
+
+
+def unique_pages(clickstream_list: list) -> list:
+    """
+    Function to find the sorted list of unique pages in a list of
+    clickstreams
+
+    Args:
+        clickstream_list (list): List of clickstreams
+
+    Returns:
+        list: Sorted list of unique pages
+    """
+    return sorted(set(
+        page for stream in clickstream_list for page in stream
+    ))
+
+
+def encode_session_transitions(codes: np.ndarray, lengths: np.ndarray,
+                               n_pages: int) -> tuple:
+    """
+    Function to encode each of a list of clickstreams as a sparse vector of
+    the counts of its transitions, from the page codes returned by
+    ``encode_clickstreams``. Each transition is coded as
+    ``from_page * n_pages + to_page``. Transitions to or from pages coded as
+    -1 are dropped.
+
+    Args:
+        codes (np.ndarray): Flat array of page codes
+        lengths (np.ndarray): Array of the length of each clickstream
+        n_pages (int): Number of pages
+
+    Returns:
+        tuple: Arrays of the index of the clickstream, the transition code
+        and the count of each non-zero count, sorted by clickstream and then
+        by transition
+    """
+    stream_index = np.repeat(np.arange(len(lengths)), lengths)
+    same_stream = stream_index[1:] == stream_index[:-1]
+    from_pages = codes[:-1][same_stream]
+    to_pages = codes[1:][same_stream]
+    known = (from_pages >= 0) & (to_pages >= 0)
+    n_transitions = max(n_pages * n_pages, 1)
+    keys, counts = np.unique(
+        stream_index[1:][same_stream][known] * n_transitions
+        + from_pages[known] * n_pages + to_pages[known],
+        return_counts=True
+    )
+    return keys // n_transitions, keys % n_transitions, counts
+
+
+def init_worker(data: dict):
+    """
+    Function to store the data shared by every task in a worker process, in
+    ``WORKER_DATA``
+
+    Args:
+        data (dict): Dictionary of shared data
+    """
+    WORKER_DATA.clear()
+    WORKER_DATA.update(data)
+
+
+def worker_pool(n_jobs: int, data: dict = None) -> Pool:
+    """
+    Function to start a pool of worker processes, each with a copy of the
+    shared data in ``WORKER_DATA``
+
+    Args:
+        n_jobs (int): Number of processes
+        data (dict, optional): Defaults to None. Dictionary of shared data
+
+    Returns:
+        Pool: Pool of worker processes
+    """
+    return Pool(n_jobs, initializer=init_worker, initargs=(data or {},))
+
+
+def map_tasks(func, tasks: list, n_jobs: int = 1, data: dict = None) -> list:
+    """
+    Function to map a function over a list of tasks, across a pool of worker
+    processes if ``n_jobs`` is 2 or higher, and otherwise in this process.
+    Either way, the shared data is available to the function in
+    ``WORKER_DATA``.
+
+    Args:
+        func: Function called with each task, defined at module level
+        tasks (list): List of tasks
+        n_jobs (int, optional): Defaults to 1. Number of processes
+        data (dict, optional): Defaults to None. Dictionary of shared data
+
+    Returns:
+        list: Result of each task
+    """
+    if n_jobs > 1 and len(tasks) > 1:
+        with worker_pool(n_jobs, data) as pool:
+            return pool.map(func, tasks)
+    init_worker(data or {})
+    try:
+        return [func(task) for task in tasks]
+    finally:
+        WORKER_DATA.clear()
@@ -0,0 +1,172 @@
+"""
+Approximate counting of page frequencies in bounded memory, for finding the
+most frequent pages of a stream of clicks with a long tail of rare pages.
+"""
+
+from itertools import chain, islice
+import numpy as np
+import pandas as pd
+
+
+class CountMinSketch:
+    """
+    Count-min sketch, which estimates the number of times each item has been
+    seen using a fixed ``depth x width`` table of counters, however many
+    distinct items there are. Estimates never undercount, and overcount by
+    at most ``e / width`` of the total count with probability
+    ``1 - exp(-depth)``.
+
+    Args:
+        width (int, optional): Defaults to 2 ** 20. Number of counters in
+            each row.
+        depth (int, optional): Defaults to 4. Number of rows, each with its
+            own hash function.
+    """
+
+    def __init__(self, width: int = 2 ** 20, depth: int = 4) -> None:
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._table = np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, items: np.ndarray) -> np.ndarray:
+        """
+        Hashes items to a column in each row, by double hashing the two
+        halves of a 64-bit hash.
+        """
+        hashes = pd.util.hash_array(np.asarray(items, dtype=object))
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((low + rows * high) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, items):
+        """
+        Adds one to the count of each item, in a single batch.
+
+        Args:
+            items: Array or list of items, which may contain repeats.
+        """
+        items = np.asarray(items, dtype=object)
+        if len(items) == 0:
+            return
+        columns = self._columns(items)
+        for row in range(self.depth):
+            self._table[row] += np.bincount(columns[row],
+                                            minlength=self.width)
+        self.total += len(items)
+
+    def estimate(self, items) -> np.ndarray:
+        """
+        Estimates the count of each of a batch of items.
+
+        Args:
+            items: Array or list of items.
+
+        Returns:
+            np.ndarray: Estimated count of each item.
+        """
+        items = np.asarray(items, dtype=object)
+        if len(items) == 0:
+            return np.zeros(0, dtype=np.int64)
+        columns = self._columns(items)
+        return self._table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+
+def heavy_hitters(items, max_items: int = None, min_count: int = 1,
+                  chunk_size: int = 1_000_000, width: int = 2 ** 20,
+                  depth: int = 4) -> pd.Series:
+    """
+    Finds the most frequent items in a stream, in a single pass and in memory
+    bounded by the sketch and ``max_items``, rather than by the number of
+    distinct items.
+
+    Items are read in chunks. Each chunk is added to a ``CountMinSketch``,
+    and the distinct items of the chunk compete with the candidates kept so
+    far on their estimated counts. At most ``2 * max_items`` candidates are
+    kept between chunks.
+
+    Args:
+        items: Iterable of items.
+        max_items (int, optional): Defaults to None. Maximum number of items
+            to return. If None, all items estimated to occur at least
+            ``min_count`` times are returned.
+        min_count (int, optional): Defaults to 1. Minimum estimated count of
+            an item to be returned.
+        chunk_size (int, optional): Defaults to 1,000,000. Number of items
+            read at a time.
+        width (int, optional): Defaults to 2 ** 20. Width of the sketch.
+        depth (int, optional): Defaults to 4. Depth of the sketch.
+
+    Returns:
+        pd.Series: Estimated count of each item found, indexed by item and
+        sorted by descending count, then by item.
+    """
+    sketch = CountMinSketch(width=width, depth=depth)
+    candidates = np.array([], dtype=object)
+    capacity = None if max_items is None else 2 * max_items
+    iterator = iter(items)
+    while True:
+        chunk = np.fromiter(islice(iterator, chunk_size), dtype=object)
+        if len(chunk) == 0:
+            break
+        sketch.update(chunk)
+        candidates = pd.unique(
+            np.concatenate([candidates, pd.unique(chunk)])
+        ).astype(object)
+        counts = sketch.estimate(candidates)
+        candidates = candidates[counts >= min_count]
+        if capacity is not None and len(candidates) > capacity:
+            counts = counts[counts >= min_count]
+            candidates = candidates[
+                np.argpartition(-counts, capacity - 1)[:capacity]
+            ]
+
+    counts = _sort_counts(pd.Series(sketch.estimate(candidates),
+                                    index=candidates, dtype=np.int64))
+    return counts if max_items is None else counts.iloc[:max_items]
+
+
+def _sort_counts(counts: pd.Series) -> pd.Series:
+    """
+    Sorts counts by descending count, then by item.
+    """
+    return counts.iloc[np.lexsort((counts.index.to_numpy(dtype=str),
+                                   -counts.to_numpy()))]
+
+
+def page_counts(clickstream_list: list) -> pd.Series:
+    """
+    Counts the clicks on each page of a list of clickstreams exactly.
+
+    Args:
+        clickstream_list (list): List of clickstreams.
+
+    Returns:
+        pd.Series: Count of each page, indexed by page and sorted by
+        descending count, then by page.
+    """
+    counts = pd.Series(
+        np.fromiter(chain.from_iterable(clickstream_list), dtype=object)
+    ).value_counts(sort=False)
+    return _sort_counts(counts)
+
+
+def select_pages(counts: pd.Series, max_pages: int = None,
+                 min_count: int = 1) -> list:
+    """
+    Selects the most clicked pages from the counts of clicks on each page.
+
+    Args:
+        counts (pd.Series): Count of clicks on each page, indexed by page.
+        max_pages (int, optional): Defaults to None. Maximum number of pages
+            to select. If None, all pages with at least ``min_count`` clicks
+            are selected.
+        min_count (int, optional): Defaults to 1. Minimum number of clicks
+            for a page to be selected.
+
+    Returns:
+        list: Sorted list of the pages selected.
+    """
+    counts = _sort_counts(counts[counts >= min_count])
+    return sorted(counts.index[:max_pages])
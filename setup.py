@@ -26,5 +26,8 @@ setup(
     long_description_content_type="text/markdown",
     packages=find_packages(exclude=['docs', 'tests*']),
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['markovclick = markovclick.cli:main'],
+    },
     author='Ismail Uddin'
 )
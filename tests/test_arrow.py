@@ -0,0 +1,123 @@
+"""
+Module to test markovclick.arrow functions
+"""
+
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+from markovclick.models import MarkovClickstream
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from markovclick import arrow
+except ImportError:
+    pa = None
+
+
+@unittest.skipIf(pa is None, 'pyarrow is not installed')
+class TestArrow(unittest.TestCase):
+    """
+    Class to test functions in markovclick.arrow
+    """
+
+    def setUp(self):
+        self.table = pa.table({
+            'date': pa.array([
+                datetime(2018, 1, 1, 10, 25),
+                datetime(2018, 1, 1, 10, 10),
+                datetime(2018, 1, 1, 10, 15),
+                datetime(2018, 1, 1, 10, 57),
+                datetime(2018, 1, 1, 11, 2),
+                datetime(2018, 1, 1, 11, 15),
+                datetime(2018, 1, 2, 11, 55),
+            ], type=pa.timestamp('us')),
+            'unique_id': ['id1', 'id1', 'id1', 'id1', 'id2', 'id2', 'id3'],
+            'page': ['P3', 'P1', 'P2', 'P1', 'P2', 'P2', 'P1'],
+            'unused': [0, 1, 2, 3, 4, 5, 6],
+        })
+
+    def test_read_clicks(self):
+        """
+        Tests `read_clicks` reads only the required columns, within the
+        requested time window.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'clicks.parquet')
+            pq.write_table(self.table, path)
+            table = arrow.read_clicks(
+                path, 'unique_id', 'date', 'page',
+                start=datetime(2018, 1, 1), end=datetime(2018, 1, 2)
+            )
+        self.assertEqual(table.column_names, ['unique_id', 'date', 'page'])
+        self.assertEqual(table.num_rows, 6)
+
+    def test_sessionise_table(self):
+        """
+        Tests `sessionise_table` sorts the clicks, and splits sessions on the
+        timeout and on changes of unique ID.
+        """
+        table = arrow.sessionise_table(self.table, 'unique_id', 'date')
+        self.assertEqual(table['page'].to_pylist()[:3], ['P1', 'P2', 'P3'])
+        self.assertEqual(table['session_id'].type, pa.int64())
+        self.assertEqual(table['session_id'].to_pylist(),
+                         [0, 0, 0, 1, 2, 2, 3])
+        with self.assertRaises(TypeError):
+            arrow.sessionise_table(self.table, 'unique_id', 'unique_id')
+        with self.assertRaises(ValueError):
+            arrow.sessionise_table(self.table, 'incorrect', 'date')
+
+    def test_fit_markov_clickstream(self):
+        """
+        Tests the model fitted from an Arrow table matches one fitted from
+        the equivalent list of clickstreams.
+        """
+        model = arrow.fit_markov_clickstream(
+            self.table, 'unique_id', 'date', 'page'
+        )
+        expected = MarkovClickstream([
+            ['P1', 'P2', 'P3'], ['P1'], ['P2', 'P2'], ['P1']
+        ])
+        self.assertEqual(model.pages, expected.pages)
+        self.assertTrue(np.array_equal(model.count_matrix,
+                                       expected.count_matrix))
+        self.assertTrue(np.allclose(model.prob_matrix, expected.prob_matrix))
+
+    def test_count_transitions_null_pages(self):
+        """
+        Tests clicks without a page are ignored when counting transitions.
+        """
+        pages = self.table['page'].to_pylist()
+        pages[2] = None
+        table = arrow.sessionise_table(
+            self.table.set_column(2, 'page', pa.array(pages)),
+            'unique_id', 'date'
+        )
+        count_matrix, pages = arrow.count_transitions(table, 'page')
+        expected = MarkovClickstream([
+            ['P1', 'P3'], ['P1'], ['P2', 'P2'], ['P1']
+        ])
+        self.assertEqual(pages, expected.pages)
+        self.assertTrue(np.array_equal(count_matrix, expected.count_matrix))
+
+    def test_sessionise_table_null_ids(self):
+        """
+        Tests clicks with a null unique ID or timestamp are dropped, rather
+        than joining the session of the previous user.
+        """
+        table = pa.table({
+            'date': pa.array([
+                datetime(2018, 1, 1, 10, 0), datetime(2018, 1, 1, 10, 1),
+                datetime(2018, 1, 1, 10, 2), datetime(2018, 1, 1, 10, 3),
+                None,
+            ], type=pa.timestamp('us')),
+            'unique_id': ['a', None, 'a', 'b', 'b'],
+            'page': ['x', 'y', 'w', 'z', 'v'],
+        })
+        table = arrow.sessionise_table(table, 'unique_id', 'date')
+        self.assertEqual(table['page'].to_pylist(), ['x', 'w', 'z'])
+        self.assertEqual(table['session_id'].to_pylist(), [0, 0, 1])
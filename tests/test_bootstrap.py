@@ -0,0 +1,79 @@
+"""
+Module to test markovclick/bootstrap.py functions
+"""
+
+
+import unittest
+
+import numpy as np
+from markovclick.bootstrap import SessionBootstrap
+from markovclick.dummy import gen_random_clickstream
+from markovclick.models import MarkovClickstream
+
+
+class TestSessionBootstrap(unittest.TestCase):
+    """
+    Class to test bootstrap.SessionBootstrap class
+    """
+
+    def setUp(self):
+        self.clickstream = gen_random_clickstream(n_of_streams=200,
+                                                  n_of_pages=6)
+        self.model = MarkovClickstream(self.clickstream)
+
+    def test_transition_intervals(self):
+        """
+        Tests the intervals contain the fitted probabilities, and that the
+        replicates do not depend on the number of processes.
+        """
+        bootstrap = SessionBootstrap(self.clickstream, n_replicates=100,
+                                     random_state=0)
+        intervals = bootstrap.transition_intervals(confidence=0.9)
+        rows = [self.model.pages.index(page) for page in
+                intervals['from_page']]
+        cols = [self.model.pages.index(page) for page in
+                intervals['to_page']]
+        self.assertTrue(np.allclose(intervals['prob'],
+                                    self.model.prob_matrix[rows, cols]))
+        self.assertTrue((intervals['lower'] <= intervals['prob']).all())
+        self.assertTrue((intervals['upper'] >= intervals['prob']).all())
+        self.assertTrue((intervals['upper'] > intervals['lower']).all())
+
+        parallel = SessionBootstrap(self.clickstream, n_replicates=100,
+                                    n_jobs=2, random_state=0)
+        self.assertTrue(np.array_equal(bootstrap.replicate_probs,
+                                       parallel.replicate_probs))
+        with self.assertRaises(ValueError):
+            bootstrap.transition_intervals(confidence=1.5)
+
+    def test_route_intervals(self):
+        """
+        Tests route probabilities match `calc_prob_to_page`.
+        """
+        bootstrap = SessionBootstrap(self.clickstream, n_replicates=50,
+                                     random_state=0)
+        routes = [stream[:3] for stream in self.clickstream[:5]]
+        intervals = bootstrap.route_intervals(routes)
+        expected = [self.model.calc_prob_to_page(route, verbose=False)
+                    for route in routes]
+        self.assertTrue(np.allclose(intervals['prob'], expected))
+        self.assertTrue((intervals['lower'] <= intervals['upper']).all())
+
+    def test_pagerank_intervals(self):
+        """
+        Tests PageRank scores match `calculate_pagerank`.
+        """
+        bootstrap = SessionBootstrap(self.clickstream, n_replicates=20,
+                                     random_state=0)
+        intervals = bootstrap.pagerank_intervals()
+        pagerank = self.model.calculate_pagerank()[1]
+        self.assertEqual(list(intervals.index), self.model.pages)
+        self.assertTrue(np.allclose(
+            intervals['pagerank'],
+            [pagerank[page] for page in self.model.pages]
+        ))
+        self.assertTrue((intervals['lower'] <= intervals['upper']).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Module to test markovclick/cli.py functions
+"""
+
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from markovclick.cli import main
+from markovclick.models import MarkovClickstream, OTHER_PAGE
+
+
+class TestCli(unittest.TestCase):
+    """
+    Class to test cli.py
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.inputs = []
+        # Two partitions, each with one user whose sessions are split by a
+        # gap of over 30 minutes
+        for day, pages in enumerate([['P1', 'P2', 'P3', 'P1', 'P2'],
+                                     ['P2', 'P3', 'P3', 'P4', 'P1']]):
+            df = pd.DataFrame({
+                'cookie_id': ['a'] * 5,
+                'timestamp': pd.Timestamp(f'2018-01-0{day + 1}')
+                + pd.to_timedelta([0, 1, 2, 60, 61], unit='min'),
+                'page': pages,
+            })
+            path = os.path.join(self.directory.name, f'day{day}.csv')
+            df.to_csv(path, index=False)
+            self.inputs.append(path)
+        self.output = os.path.join(self.directory.name, 'model.npz')
+        self.checkpoint_dir = os.path.join(self.directory.name, 'checkpoints')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_cli(self, *options) -> str:
+        """
+        Runs the fit command, returning what it printed to stderr.
+        """
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            main(['fit', *self.inputs, '-o', self.output,
+                  '--checkpoint-dir', self.checkpoint_dir, *options])
+        return stderr.getvalue()
+
+    def test_fit(self):
+        """
+        Tests the saved model counts the transitions within sessions, and
+        that a rerun resumes from the checkpoints.
+        """
+        self.run_cli('--chunk-size', '2', '--profile')
+        model = MarkovClickstream.load(self.output)
+        expected = MarkovClickstream([
+            ['P1', 'P2', 'P3'], ['P1', 'P2'], ['P2', 'P3', 'P3'],
+            ['P4', 'P1'],
+        ])
+        self.assertEqual(model.pages, expected.pages)
+        self.assertTrue((model.count_matrix == expected.count_matrix).all())
+        self.assertEqual(len(os.listdir(self.checkpoint_dir)), 2)
+
+        self.assertIn('Resuming: 2 of 2', self.run_cli())
+
+    def test_fit_options(self):
+        """
+        Tests the time window, vocabulary caps and dtypes.
+        """
+        self.run_cli('--end', '2018-01-02', '--max-pages', '2',
+                     '--count-dtype', 'uint32', '--prob-dtype', 'float32')
+        model = MarkovClickstream.load(self.output)
+        self.assertEqual(model.pages, ['P1', 'P2', OTHER_PAGE])
+        self.assertEqual(model.count_matrix.dtype, np.uint32)
+        self.assertEqual(model.prob_matrix.dtype, np.float32)
+        self.assertEqual(model.count_matrix.sum(), 3)
+
+    def test_fit_missing_pages_and_offsets(self):
+        """
+        Tests clicks without a page are dropped, and timestamps with UTC
+        offsets are windowed in their own timezone.
+        """
+        path = os.path.join(self.directory.name, 'offsets.csv')
+        with open(path, 'w') as file:
+            file.write(
+                'cookie_id,timestamp,page\n'
+                'a,2017-12-31T23:59:00+01:00,P4\n'
+                'a,2018-01-01T00:00:00+01:00,P1\n'
+                'a,2018-01-01T00:01:00+01:00,\n'
+                'a,2018-01-01T00:02:00+01:00,P2\n'
+            )
+        self.inputs = [path]
+        self.run_cli('--start', '2018-01-01')
+        model = MarkovClickstream.load(self.output)
+        self.assertEqual(model.pages, ['P1', 'P2'])
+        self.assertEqual(model.count_matrix.tolist(), [[0, 1], [0, 0]])
+
+        with self.assertRaises(SystemExit):
+            with contextlib.redirect_stderr(io.StringIO()):
+                main([])
+
+
+if __name__ == '__main__':
+    unittest.main()
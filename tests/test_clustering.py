@@ -0,0 +1,76 @@
+"""
+Module to test markovclick.clustering functions
+"""
+
+
+import random
+import unittest
+
+import numpy as np
+from markovclick.clustering import MarkovMixture
+from markovclick.models import MarkovClickstream
+
+
+class TestMarkovMixture(unittest.TestCase):
+    """
+    Class to test clustering.MarkovMixture class
+    """
+
+    def setUp(self):
+        random.seed(0)
+        self.clickstream = []
+        for i in range(200):
+            pages = ['P1', 'P2', 'P3'] if i % 2 else ['P4', 'P5', 'P6']
+            length = random.randrange(3, 8)
+            self.clickstream.append(
+                [pages[j % 3] for j in range(length)]
+            )
+
+    def test_fit(self):
+        """
+        Tests the mixture separates two groups of clickstreams with no pages
+        in common.
+        """
+        mixture = MarkovMixture(n_components=2, random_state=0)
+        mixture.fit(self.clickstream)
+        self.assertEqual(mixture.pages,
+                         ['P1', 'P2', 'P3', 'P4', 'P5', 'P6'])
+        self.assertTrue(np.allclose(mixture.weights, [0.5, 0.5]))
+        labels = mixture.predict(self.clickstream)
+        self.assertTrue((labels[::2] == labels[0]).all())
+        self.assertTrue((labels[1::2] == labels[1]).all())
+        self.assertNotEqual(labels[0], labels[1])
+
+        model = mixture.component_model(labels[1])
+        self.assertIsInstance(model, MarkovClickstream)
+        self.assertAlmostEqual(
+            model.prob_matrix[0, 1], 1, places=3
+        )
+
+    def test_predict_proba(self):
+        """
+        Tests `predict_proba` returns a probability distribution for each
+        clickstream, including ones with unseen pages.
+        """
+        mixture = MarkovMixture(n_components=3, random_state=0)
+        mixture.fit(self.clickstream)
+        proba = mixture.predict_proba(
+            [['P1', 'P2'], ['P3', 'P9', 'P1'], ['P9'], []]
+        )
+        self.assertEqual(proba.shape, (4, 3))
+        self.assertTrue(np.allclose(proba.sum(axis=1), 1))
+        self.assertTrue(np.allclose(proba[2], mixture.weights))
+        with self.assertRaises(ValueError):
+            MarkovMixture().predict(self.clickstream)
+
+    def test_fit_parallel(self):
+        """
+        Tests the E-step gives the same result in parallel.
+        """
+        serial = MarkovMixture(random_state=1).fit(self.clickstream)
+        parallel = MarkovMixture(random_state=1, n_jobs=2).fit(
+            self.clickstream
+        )
+        self.assertEqual(serial.n_iter, parallel.n_iter)
+        self.assertAlmostEqual(serial.log_likelihood,
+                               parallel.log_likelihood)
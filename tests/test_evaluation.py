@@ -0,0 +1,135 @@
+"""
+Module to test markovclick.evaluation functions
+"""
+
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from markovclick.dummy import gen_random_clickstream
+from markovclick.evaluation import (
+    NGramClickstream, clickstreams_from_df, cross_validate, perplexity,
+    top_k_hit_rate, train_test_split
+)
+from markovclick.models import MarkovClickstream
+
+
+class TestEvaluation(unittest.TestCase):
+    """
+    Class to test evaluation.py
+    """
+
+    def setUp(self):
+        self.train = [
+            ['P1', 'P2', 'P3'],
+            ['P1', 'P2', 'P2'],
+            ['P1', 'P3'],
+        ]
+
+    def test_train_test_split(self):
+        """
+        Tests sessions are split wholly into either set.
+        """
+        clickstream = gen_random_clickstream(n_of_streams=100, n_of_pages=5)
+        train, test = train_test_split(clickstream, test_size=0.25,
+                                       random_state=0)
+        self.assertEqual((len(train), len(test)), (75, 25))
+
+        df = pd.DataFrame({
+            'session_uuid': ['a', 'a', 'b', 'c', 'c', 'c', 'd', 'e'],
+            'page': ['P1', 'P2', 'P1', 'P3', 'P1', 'P2', 'P2', 'P3'],
+        })
+        train, test = train_test_split(df, test_size=0.4, random_state=0)
+        self.assertEqual(len(train) + len(test), len(df))
+        self.assertEqual(test['session_uuid'].nunique(), 2)
+        self.assertFalse(
+            set(train['session_uuid']) & set(test['session_uuid'])
+        )
+
+    def test_clickstreams_from_df(self):
+        """
+        Tests clicks are grouped by session and ordered by time.
+        """
+        df = pd.DataFrame({
+            'session_uuid': ['b', 'a', 'b', 'a'],
+            'page': ['P3', 'P2', 'P1', 'P1'],
+            'timestamp': pd.to_datetime([
+                '2018-01-01 00:02', '2018-01-01 00:01', '2018-01-01 00:01',
+                '2018-01-01 00:00',
+            ]),
+        })
+        self.assertEqual(
+            clickstreams_from_df(df, datetime_col='timestamp'),
+            [['P1', 'P3'], ['P1', 'P2']]
+        )
+
+    def test_perplexity(self):
+        """
+        Tests perplexity with and without smoothing, for first and second
+        order models.
+        """
+        test = [['P1', 'P2']]
+        model = MarkovClickstream(self.train)
+        self.assertAlmostEqual(perplexity(model, test), 1.5)
+        ngram = NGramClickstream().fit(self.train)
+        self.assertAlmostEqual(perplexity(ngram, test), 1.5)
+
+        # Three pages plus one for unseen pages
+        ngram.alpha = 1
+        self.assertAlmostEqual(perplexity(ngram, test), 7 / 3)
+        self.assertAlmostEqual(perplexity(ngram, [['P4', 'P1']]), 4)
+        ngram.alpha = 0
+        self.assertEqual(perplexity(ngram, [['P4', 'P1']]), np.inf)
+
+        ngram = NGramClickstream(order=2).fit(self.train)
+        self.assertAlmostEqual(perplexity(ngram, [['P1', 'P2', 'P3']]), 2)
+
+    def test_score_from(self):
+        """
+        Tests models of different orders can be scored on the same
+        transitions.
+        """
+        test = [['P1', 'P2', 'P3'], ['P1', 'P3']]
+        first = NGramClickstream(score_from=2).fit(self.train)
+        second = NGramClickstream(order=2).fit(self.train)
+        self.assertEqual(first.first_scored, 2)
+        self.assertEqual(len(first.next_page_ranks(test)),
+                         len(second.next_page_ranks(test)))
+        # Only the transition from P2 to P3 is scored
+        self.assertAlmostEqual(perplexity(first, test), 2)
+        self.assertAlmostEqual(perplexity(second, test), 2)
+
+    def test_top_k_hit_rate(self):
+        """
+        Tests the rank of the next page and the top-k hit rate.
+        """
+        test = [['P1', 'P3'], ['P1', 'P2', 'P2'], ['P2', 'P3', 'P1']]
+        ngram = NGramClickstream().fit(self.train)
+        self.assertEqual(list(ngram.next_page_ranks(test)),
+                         [1, 0, 0, 0, np.inf])
+        self.assertAlmostEqual(top_k_hit_rate(ngram, test, k=1), 0.6)
+        self.assertAlmostEqual(top_k_hit_rate(ngram, test, k=2), 0.8)
+        model = MarkovClickstream(self.train)
+        self.assertAlmostEqual(top_k_hit_rate(model, test, k=1), 0.6)
+
+    def test_cross_validate(self):
+        """
+        Tests cross-validation gives the same results in parallel.
+        """
+        clickstream = gen_random_clickstream(n_of_streams=200, n_of_pages=8)
+        results = cross_validate(clickstream, orders=[1, 2],
+                                 alphas=[0.0, 1.0], n_folds=3,
+                                 random_state=0)
+        self.assertEqual(list(results.index),
+                         [(1, 0.0), (1, 1.0), (2, 0.0), (2, 1.0)])
+        self.assertTrue((results['top_k_hit_rate'] <= 1).all())
+        self.assertTrue(np.isfinite(results.loc[(1, 1.0), 'perplexity']))
+        parallel = cross_validate(clickstream, orders=[1, 2],
+                                  alphas=[0.0, 1.0], n_folds=3, n_jobs=2,
+                                  random_state=0)
+        pd.testing.assert_frame_equal(results, parallel)
+
+
+if __name__ == '__main__':
+    unittest.main()
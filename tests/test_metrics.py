@@ -0,0 +1,114 @@
+"""
+Module to test markovclick.metrics functions
+"""
+
+
+import unittest
+
+import numpy as np
+from markovclick import metrics
+from markovclick.models import MarkovClickstream
+
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+
+class _SparseModel:
+    """
+    Model holding its probability matrix as a sparse matrix
+    """
+
+    def __init__(self, model):
+        self.pages = model.pages
+        self.prob_matrix = sparse.csr_matrix(model.prob_matrix)
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Class to test functions in markovclick.metrics
+    """
+
+    def setUp(self):
+        self.model_a = MarkovClickstream([
+            ['P1', 'P2', 'P1', 'P3'], ['P2', 'P2']
+        ])
+        self.model_b = MarkovClickstream([
+            ['P1', 'P2', 'P4', 'P1', 'P2'], ['P2', 'P1']
+        ])
+
+    def test_align_models(self):
+        """
+        Tests `align_models` aligns the probabilities over the union of pages
+        """
+        pages, rows, cols, prob_a, prob_b = metrics.align_models(
+            self.model_a, self.model_b
+        )
+        self.assertEqual(pages, ['P1', 'P2', 'P3', 'P4'])
+        for row, col, p_a, p_b in zip(rows, cols, prob_a, prob_b):
+            self.assertEqual(
+                p_a, self.model_a.prob_matrix[row, col]
+                if row < 3 and col < 3 else 0
+            )
+            b_index = [self.model_b.pages.index(page)
+                       if page in self.model_b.pages else None
+                       for page in pages]
+            expected_b = 0 if None in (b_index[row], b_index[col]) else \
+                self.model_b.prob_matrix[b_index[row], b_index[col]]
+            self.assertEqual(p_b, expected_b)
+
+    def test_divergences(self):
+        """
+        Tests the per-page divergences against known values
+        """
+        total_variation = metrics.total_variation(self.model_a, self.model_b)
+        # P1 goes to P2 or P3 in model_a, and always to P2 in model_b
+        self.assertAlmostEqual(total_variation['P1'], 0.5)
+        # P3 has no transitions out of it in either model
+        self.assertTrue(np.isnan(total_variation['P3']))
+        self.assertTrue(np.isnan(total_variation['P4']))
+
+        kl = metrics.kl_divergence(self.model_a, self.model_b)
+        self.assertTrue(np.isinf(kl['P1']))
+        kl_b = metrics.kl_divergence(self.model_b, self.model_a)
+        self.assertAlmostEqual(kl_b['P1'], np.log(2))
+        smoothed = metrics.kl_divergence(self.model_a, self.model_b,
+                                         epsilon=1e-3)
+        self.assertTrue(np.isfinite(smoothed['P1']))
+
+        js = metrics.js_divergence(self.model_a, self.model_b)
+        self.assertTrue(((js.dropna() >= 0) &
+                         (js.dropna() <= np.log(2))).all())
+        same = metrics.drift_report(self.model_a, self.model_a)
+        self.assertTrue(np.allclose(same.dropna(), 0))
+        self.assertEqual(list(same.columns), ['total_variation', 'kl', 'js'])
+
+    def test_largest_changes(self):
+        """
+        Tests `largest_changes` returns the transitions with the largest
+        absolute change first
+        """
+        changes = metrics.largest_changes(self.model_a, self.model_b, n=2)
+        self.assertEqual(len(changes), 2)
+        self.assertTrue((np.abs(changes['change']).diff().dropna() <= 0)
+                        .all())
+        # P4 is only in model_b, where it always goes to P1
+        first = changes.iloc[0]
+        self.assertEqual((first['from_page'], first['to_page']),
+                         ('P4', 'P1'))
+        self.assertEqual(first['change'], 1)
+        self.assertEqual(abs(changes.iloc[1]['change']), 0.5)
+        self.assertEqual(len(metrics.largest_changes(
+            self.model_a, self.model_b, n=0
+        )), 0)
+
+    @unittest.skipIf(sparse is None, 'scipy is not installed')
+    def test_sparse(self):
+        """
+        Tests sparse models give the same results as dense models
+        """
+        dense = metrics.drift_report(self.model_a, self.model_b)
+        mixed = metrics.drift_report(_SparseModel(self.model_a),
+                                     self.model_b)
+        self.assertTrue(dense.equals(mixed))
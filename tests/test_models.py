@@ -3,9 +3,13 @@ Module to run tests for the markovclick/models.py file
 """
 
 
+import os
+import tempfile
 import unittest
 import numpy as np
-from markovclick.models import MarkovClickstream
+from markovclick.models import (
+    MarkovClickstream, START_PAGE, EXIT_PAGE, OTHER_PAGE
+)
 import networkx as nx
 import random
 from markovclick.dummy import gen_random_clickstream
@@ -125,3 +129,190 @@ class TestModels(unittest.TestCase):
             len(pagerank_scores.values()),
             n_pages
         )
+
+    def test_from_counts(self):
+        """
+        Tests the `from_counts` constructor
+        """
+        clickstream = gen_random_clickstream(n_of_streams=100, n_of_pages=12)
+        markov_clickstream = MarkovClickstream(clickstream)
+        from_counts = MarkovClickstream.from_counts(
+            markov_clickstream.count_matrix, markov_clickstream.pages
+        )
+        self.assertEqual(from_counts.pages, markov_clickstream.pages)
+        self.assertTrue(np.allclose(from_counts.prob_matrix,
+                                    markov_clickstream.prob_matrix))
+        with self.assertRaises(ValueError):
+            MarkovClickstream.from_counts(np.zeros((2, 2)), ['P1'])
+
+    def test_start_exit(self):
+        """
+        Tests counting of transitions from the start and to the exit
+        pseudo-states
+        """
+        clickstream = [['P1', 'P2'], ['P2'], []]
+        markov_clickstream = MarkovClickstream(clickstream, start_exit=True)
+        self.assertEqual(markov_clickstream.pages,
+                         ['P1', 'P2', START_PAGE, EXIT_PAGE])
+        expected_count_matrix = np.array([
+            [0., 1., 0., 0.],
+            [0., 0., 0., 2.],
+            [1., 1., 0., 0.],
+            [0., 0., 0., 0.],
+        ])
+        self.assertTrue(
+            (expected_count_matrix == markov_clickstream.count_matrix).all()
+        )
+
+    def test_vocabulary_caps(self):
+        """
+        Tests rare pages are mapped to the other page, with exact and
+        approximate counting
+        """
+        clickstream = [['P1', 'P2', 'P1', 'P9'], ['P2', 'P1', 'P3'],
+                       ['P8', 'P1']]
+        expected_count_matrix = np.array([
+            [0., 1., 2.],
+            [2., 0., 0.],
+            [1., 0., 0.],
+        ])
+        for approximate in [False, True]:
+            markov_clickstream = MarkovClickstream(
+                clickstream, max_pages=2, approximate=approximate
+            )
+            self.assertEqual(markov_clickstream.pages,
+                             ['P1', 'P2', OTHER_PAGE])
+            self.assertTrue((expected_count_matrix ==
+                             markov_clickstream.count_matrix).all())
+
+        markov_clickstream = MarkovClickstream(clickstream, min_count=3,
+                                               start_exit=True)
+        self.assertEqual(markov_clickstream.pages,
+                         ['P1', OTHER_PAGE, START_PAGE, EXIT_PAGE])
+        # Unseen pages are scored as the other page
+        self.assertAlmostEqual(
+            markov_clickstream.calc_log_likelihoods([['P1', 'P7']])[0],
+            np.log(3 / 4)
+        )
+
+    def test_calc_k_step_probs(self):
+        """
+        Tests `calc_k_step_probs` against matrix powers, with both caching
+        strategies
+        """
+        clickstream = gen_random_clickstream(n_of_streams=100, n_of_pages=12)
+        markov_clickstream = MarkovClickstream(clickstream)
+        pages = markov_clickstream.pages
+        expected = np.linalg.matrix_power(markov_clickstream.prob_matrix, 4)
+        k_step_probs = markov_clickstream.calc_k_step_probs(
+            pages[:3], pages[2:5], k=4
+        )
+        self.assertTrue(np.allclose(k_step_probs, expected[:3, 2:5]))
+        self.assertTrue(np.allclose(
+            markov_clickstream.calc_k_step_probs(pages, k=0),
+            np.eye(len(pages))
+        ))
+
+        markov_clickstream.k_step_max_dense_pages = 0
+        k_step_probs = markov_clickstream.calc_k_step_probs(pages[:3], k=4)
+        self.assertTrue(np.allclose(k_step_probs, expected[:3]))
+
+        # Recomputing the probabilities clears the cache
+        markov_clickstream.count_matrix[0] = 0
+        markov_clickstream.count_matrix[0, 0] = 1
+        markov_clickstream.compute_prob_matrix()
+        k_step_probs = markov_clickstream.calc_k_step_probs(pages[:1], k=4)
+        self.assertTrue(np.allclose(k_step_probs, np.eye(len(pages))[:1]))
+
+    def test_dtypes(self):
+        """
+        Tests count and probability dtypes, and overflow checks
+        """
+        clickstream = gen_random_clickstream(n_of_streams=100, n_of_pages=12)
+        markov_clickstream = MarkovClickstream(clickstream)
+        compact = MarkovClickstream(clickstream, count_dtype=np.uint32,
+                                    prob_dtype=np.float32)
+        self.assertEqual(compact.count_matrix.dtype, np.uint32)
+        self.assertEqual(compact.prob_matrix.dtype, np.float32)
+        self.assertEqual(compact.nbytes * 2, markov_clickstream.nbytes)
+        self.assertTrue(np.allclose(compact.prob_matrix,
+                                    markov_clickstream.prob_matrix))
+        self.assertTrue(np.allclose(
+            compact.calc_log_likelihoods(clickstream),
+            markov_clickstream.calc_log_likelihoods(clickstream)
+        ))
+
+        with self.assertRaises(OverflowError):
+            MarkovClickstream([['P1', 'P2']] * 256, count_dtype=np.uint8)
+        with self.assertRaises(OverflowError):
+            MarkovClickstream.from_counts([[2 ** 25]], ['P1'],
+                                          count_dtype=np.float32)
+        with self.assertRaises(TypeError):
+            MarkovClickstream(clickstream, prob_dtype=np.int64)
+
+    def test_save_load(self):
+        """
+        Tests a saved model is loaded with the same pages, matrices and
+        dtypes
+        """
+        clickstream = gen_random_clickstream(n_of_streams=100, n_of_pages=12)
+        markov_clickstream = MarkovClickstream(
+            clickstream, start_exit=True, count_dtype=np.uint32,
+            prob_dtype=np.float32
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npz')
+            markov_clickstream.save(path)
+            loaded = MarkovClickstream.load(path)
+        self.assertEqual(loaded.pages, markov_clickstream.pages)
+        self.assertTrue(loaded.start_exit)
+        for name in ['count_matrix', 'prob_matrix']:
+            expected = getattr(markov_clickstream, name)
+            self.assertEqual(getattr(loaded, name).dtype, expected.dtype)
+            self.assertTrue((getattr(loaded, name) == expected).all())
+
+        # Paths without a .npz suffix are saved as given
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.bin')
+            markov_clickstream.save(path)
+            self.assertEqual(os.listdir(directory), ['model.bin'])
+            loaded = MarkovClickstream.load(path)
+        self.assertEqual(loaded.pages, markov_clickstream.pages)
+
+    def test_calc_conversion_probs(self):
+        """
+        Tests `calc_conversion_probs` function with known cases.
+        """
+        clickstream = [['A', 'B', 'C'], ['A', 'C'], ['A', 'B'], ['B', 'B']]
+        markov_clickstream = MarkovClickstream(clickstream, start_exit=True)
+        conversion = markov_clickstream.calc_conversion_probs(
+            ['C'], landing_pages=['A', 'B', 'C', START_PAGE]
+        )
+        # From B: C with 1/4, B with 1/4, exit with 1/2, so reaching C has
+        # probability p = 1/4 + p/4, i.e. 1/3.
+        p_b = 1 / 3
+        p_a = 1 / 3 + 2 / 3 * p_b
+        p_start = 3 / 4 * p_a + 1 / 4 * p_b
+        self.assertTrue(np.allclose(conversion[:, 0],
+                                    [p_a, p_b, 1, p_start]))
+        all_pages = markov_clickstream.calc_conversion_probs(['A', 'C'])
+        self.assertEqual(all_pages.shape, (3, 2))
+        self.assertTrue(np.allclose(all_pages[:, 1], [p_a, p_b, 1]))
+        self.assertTrue(np.allclose(all_pages[:, 0], [1, 0, 0]))
+
+    def test_calc_log_likelihoods(self):
+        """
+        Tests `calc_log_likelihoods` matches `calc_prob_to_page`
+        """
+        clickstream = gen_random_clickstream(n_of_streams=100, n_of_pages=12)
+        markov_clickstream = MarkovClickstream(clickstream)
+        log_likelihoods = markov_clickstream.calc_log_likelihoods(
+            clickstream[:10] + [['P1', 'unknown']]
+        )
+        for stream, log_likelihood in zip(clickstream[:10], log_likelihoods):
+            self.assertAlmostEqual(
+                log_likelihood,
+                np.log(markov_clickstream.calc_prob_to_page(stream,
+                                                            verbose=False))
+            )
+        self.assertTrue(np.isneginf(log_likelihoods[-1]))
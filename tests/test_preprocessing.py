@@ -57,39 +57,78 @@ class TestSessionise(unittest.TestCase):
         Tests the `add_session_boundaries` function.
         """
         sessionise = preprocessing.Sessionise(self._df, 'unique_id', 'date')
-        df = sessionise.df
-        sessionise._add_session_boundaries()  # pylint: disable=W0212
-        columns = sessionise.df.columns
-        self.assertTrue('prev_uniq_id' in columns)
-        self.assertTrue('session_boundary' in columns)
-        self.assertTrue('time_diff' in columns)
+        columns = list(sessionise.df.columns)
+        new_session, order = sessionise._add_session_boundaries()  # pylint: disable=W0212
+        self.assertEqual(list(sessionise.df.columns), columns)
+        self.assertEqual(list(order), list(range(len(self._df))))
         self.assertEqual(
-            df[df['session_boundary'] == True].sum()['session_boundary'],
-            2
+            list(new_session),
+            [True, False, False, True, True, False, True]
         )
 
-    def test__get_or_create_uuid(self):
+    def test__session_ids(self):
         """
-        Tests `_get_or_create_uuid` function with known cases.
+        Tests `_session_ids` function with known cases.
         """
         sessionise = preprocessing.Sessionise(self._df, 'unique_id', 'date')
-        sessionise._add_session_boundaries()
-        df = sessionise.df
-        df.loc[:, 'session_uuid'] = df.apply(
-            lambda row: sessionise._get_or_create_uuid(row), axis=1
-        )
-        self.assertEqual(df.loc[0, 'session_uuid'], df.loc[1, 'session_uuid'])
-        self.assertNotEqual(
-            df.loc[2, 'session_uuid'], df.loc[3, 'session_uuid']
+        session_ids = sessionise._session_ids('uuid')  # pylint: disable=W0212
+        self.assertEqual(session_ids[0], session_ids[1])
+        self.assertNotEqual(session_ids[2], session_ids[3])
+        self.assertNotEqual(session_ids[3], session_ids[4])
+        self.assertEqual(session_ids[4], session_ids[5])
+        self.assertNotEqual(session_ids[5], session_ids[6])
+
+    def test_assign_sessions_unsorted(self):
+        """
+        Tests `assign_sessions` sorts data which is not presorted, and only
+        adds the session ID column to the DataFrame.
+        """
+        shuffled = self._df.sample(frac=1, random_state=3)
+        df = preprocessing.Sessionise(
+            shuffled.copy(), 'unique_id', 'date'
+        ).assign_sessions(session_id='int')
+        self.assertEqual(list(df.index), list(shuffled.index))
+        self.assertEqual(
+            list(df.columns), ['date', 'unique_id', 'session_uuid']
         )
-        self.assertNotEqual(
-            df.loc[3, 'session_uuid'], df.loc[4, 'session_uuid']
+        self.assertEqual(
+            list(df.sort_index()['session_uuid']), [0, 0, 0, 1, 2, 2, 3]
         )
-        self.assertEqual(df.loc[4, 'session_uuid'], df.loc[5, 'session_uuid'])
-        self.assertNotEqual(
-            df.loc[5, 'session_uuid'], df.loc[6, 'session_uuid']
+        df_presorted = preprocessing.Sessionise(
+            self._df.copy(), 'unique_id', 'date', presorted=True
+        ).assign_sessions(session_id='int')
+        self.assertEqual(
+            list(df_presorted['session_uuid']), [0, 0, 0, 1, 2, 2, 3]
         )
 
+    def test_sorted_sessions(self):
+        """
+        Tests `sorted_sessions` gives the sorted order of the rows, and the
+        int session IDs in that order.
+        """
+        shuffled = self._df.sample(frac=1, random_state=3)
+        order, session_ids = preprocessing.Sessionise(
+            shuffled, 'unique_id', 'date'
+        ).sorted_sessions()
+        self.assertEqual(list(shuffled.index[order]),
+                         list(range(len(self._df))))
+        self.assertEqual(list(session_ids), [0, 0, 0, 1, 2, 2, 3])
+
+    def test_assign_sessions_null_ids(self):
+        """
+        Tests each click without a unique ID begins its own session.
+        """
+        df = pd.DataFrame({
+            'date': pd.Timestamp('2018-01-01') + pd.to_timedelta(
+                range(4), unit='m'
+            ),
+            'unique_id': ['a', None, None, 'b'],
+        })
+        session_ids = preprocessing.Sessionise(
+            df, 'unique_id', 'date'
+        ).assign_sessions(session_id='int')['session_uuid']
+        self.assertEqual(session_ids.nunique(), 4)
+
     def test__create_partitions(self):
         """
         Tests the `_create_partitions` function
@@ -113,3 +152,132 @@ class TestSessionise(unittest.TestCase):
             df_single['session_uuid'].nunique(),
             df_parallel['session_uuid'].nunique()
         )
+
+    def test_assign_sessions_deterministic(self):
+        """
+        Test for `assign_sessions` function with integer and hashed session
+        IDs.
+        """
+        for session_id in ['int', 'hash']:
+            df_first = preprocessing.Sessionise(
+                self._df.copy(), 'unique_id', 'date'
+            ).assign_sessions(session_id=session_id)
+            df_second = preprocessing.Sessionise(
+                self._df.copy(), 'unique_id', 'date'
+            ).assign_sessions(session_id=session_id)
+            self.assertEqual(df_first['session_uuid'].dtype, 'int64')
+            self.assertTrue(
+                (df_first['session_uuid'] == df_second['session_uuid']).all()
+            )
+            self.assertEqual(df_first['session_uuid'].nunique(), 4)
+        df_int = preprocessing.Sessionise(
+            self._df.copy(), 'unique_id', 'date'
+        ).assign_sessions(session_id='int')
+        self.assertEqual(list(df_int['session_uuid']), [0, 0, 0, 1, 2, 2, 3])
+        # Hashed IDs do not depend on the rest of the data
+        df_hash = preprocessing.Sessionise(
+            self._df.copy(), 'unique_id', 'date'
+        ).assign_sessions(session_id='hash')
+        df_part = preprocessing.Sessionise(
+            self._df.iloc[4:].copy(), 'unique_id', 'date'
+        ).assign_sessions(session_id='hash')
+        self.assertEqual(list(df_hash['session_uuid'].iloc[4:]),
+                         list(df_part['session_uuid']))
+        with self.assertRaises(ValueError):
+            preprocessing.Sessionise(
+                self._df.copy(), 'unique_id', 'date'
+            ).assign_sessions(session_id='incorrect')
+
+
+class TestSessionRules(unittest.TestCase):
+    """
+    Class to test the session rules in preprocessing
+    """
+    def setUp(self):
+        data = {
+            'date': [
+                datetime(2018, 1, 1, 22, 10),
+                datetime(2018, 1, 1, 22, 35),
+                datetime(2018, 1, 1, 23, 0),
+                datetime(2018, 1, 1, 23, 25),
+                datetime(2018, 1, 2, 0, 5),
+                datetime(2018, 1, 2, 0, 10),
+            ],
+            'unique_id': ['id1', 'id1', 'id1', 'id1', 'id1', 'id1'],
+            'campaign': ['a', 'a', 'b', 'b', 'b', None],
+        }
+        self._df = pd.DataFrame(data)
+
+    def _n_sessions(self, rules):
+        sessionise = preprocessing.Sessionise(
+            self._df.copy(), 'unique_id', 'date', rules=rules
+        )
+        df = sessionise.assign_sessions(session_id='int')
+        return list(df['session_uuid'])
+
+    def test_inactivity_timeout(self):
+        """
+        Tests the `InactivityTimeout` rule
+        """
+        rules = [preprocessing.InactivityTimeout(30)]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 0, 0, 1, 1])
+
+    def test_midnight_split(self):
+        """
+        Tests the `MidnightSplit` rule, with and without a timezone
+        """
+        rules = [preprocessing.MidnightSplit()]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 0, 0, 1, 1])
+        rules = [preprocessing.MidnightSplit(timezone='Asia/Kolkata')]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 0, 0, 0, 0])
+        rules = [preprocessing.MidnightSplit(timezone='Europe/Paris')]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 1, 1, 1, 1])
+        self._df['tz'] = ['UTC', 'UTC', 'UTC', 'UTC', 'Asia/Kolkata',
+                          'Asia/Kolkata']
+        rules = [preprocessing.MidnightSplit(timezone_col='tz')]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 0, 0, 1, 1])
+
+    def test_midnight_split_timezone_aware(self):
+        """
+        Tests the `MidnightSplit` rule splits timezone aware timestamps at
+        midnight in their own timezone by default
+        """
+        self._df['date'] = self._df['date'].dt.tz_localize(
+            'UTC'
+        ).dt.tz_convert('Europe/Paris')
+        rules = [preprocessing.MidnightSplit()]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 1, 1, 1, 1])
+        rules = [preprocessing.MidnightSplit(timezone='UTC')]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 0, 0, 1, 1])
+
+    def test_max_duration(self):
+        """
+        Tests the `MaxDuration` rule, combined with other rules
+        """
+        rules = [preprocessing.MaxDuration(60)]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 0, 1, 1, 1])
+        rules = [preprocessing.InactivityTimeout(30),
+                 preprocessing.MaxDuration(60)]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 0, 1, 2, 2])
+
+    def test_max_duration_reanchors(self):
+        """
+        Tests the `MaxDuration` rule measures each new session from the click
+        which began it, rather than from the first click
+        """
+        self._df = self._df.iloc[:5].assign(
+            date=datetime(2018, 1, 1) + pd.to_timedelta(
+                [0, 45, 70, 100, 125], unit='min'
+            )
+        )
+        rules = [preprocessing.MaxDuration(60)]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 1, 1, 1])
+        with self.assertRaises(ValueError):
+            preprocessing.MaxDuration(0)
+
+    def test_column_change(self):
+        """
+        Tests the `ColumnChange` rule
+        """
+        rules = [preprocessing.ColumnChange('campaign')]
+        self.assertEqual(self._n_sessions(rules), [0, 0, 1, 1, 1, 2])
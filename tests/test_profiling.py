@@ -0,0 +1,105 @@
+"""
+Module to test markovclick.profiling functions
+"""
+
+
+import unittest
+from datetime import datetime
+
+import pandas as pd
+from markovclick.dummy import gen_random_clickstream
+from markovclick.models import MarkovClickstream
+from markovclick.preprocessing import Sessionise
+from markovclick.profiling import Profiler, StageStats, profile_stage
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Class to test profiling.Profiler class
+    """
+
+    def test_profile_stage_disabled(self):
+        """
+        Tests that `profile_stage` is a no-op when no profiler is provided.
+        """
+        with profile_stage(None, 'stage') as stage:
+            stage.n_items = 10
+        self.assertIsNone(stage.n_items)
+
+    def test_stage(self):
+        """
+        Tests a stage is recorded with its statistics, and that callbacks
+        are notified.
+        """
+        recorded = []
+        profiler = Profiler(callbacks=[recorded.append])
+        with profiler.stage('allocate') as stage:
+            data = list(range(10000))
+            stage.n_items = len(data)
+        self.assertEqual(len(profiler.stages), 1)
+        stats = profiler.stages[0]
+        self.assertIsInstance(stats, StageStats)
+        self.assertEqual(stats.name, 'allocate')
+        self.assertEqual(stats.n_items, 10000)
+        self.assertGreater(stats.peak_memory, 0)
+        self.assertGreaterEqual(stats.wall_time, 0)
+        self.assertEqual(recorded, [stats])
+
+    def test_nested_stages(self):
+        """
+        Tests a nested stage does not reset the peak memory of the stage
+        enclosing it.
+        """
+        profiler = Profiler()
+        with profiler.stage('outer'):
+            data = bytearray(10 ** 7)
+            del data
+            with profiler.stage('inner'):
+                data = bytearray(10 ** 5)
+                del data
+        inner, outer = profiler.stages
+        self.assertEqual((inner.name, outer.name), ('inner', 'outer'))
+        self.assertGreaterEqual(outer.peak_memory, 10 ** 7)
+        self.assertLess(inner.peak_memory, 10 ** 7)
+
+    def test_no_memory_tracking(self):
+        """
+        Tests peak memory is not recorded when `track_memory` is False.
+        """
+        profiler = Profiler(track_memory=False)
+        with profiler.stage('stage', n_items=5):
+            pass
+        self.assertIsNone(profiler.stages[0].peak_memory)
+        self.assertEqual(profiler.stages[0].n_items, 5)
+
+    def test_markov_clickstream(self):
+        """
+        Tests each stage of `MarkovClickstream` construction is recorded.
+        """
+        clickstream = gen_random_clickstream(n_of_streams=20, n_of_pages=6)
+        n_clicks = sum(len(stream) for stream in clickstream)
+        profiler = Profiler()
+        MarkovClickstream(clickstream, profiler=profiler)
+        summary = profiler.as_dict()
+        for name in ['get_unique_pages', 'populate_count_matrix',
+                     'compute_prob_matrix']:
+            self.assertIn(name, summary)
+        self.assertEqual(summary['get_unique_pages']['n_items'], n_clicks)
+        self.assertEqual(summary['compute_prob_matrix']['n_items'], 6)
+
+    def test_sessionise(self):
+        """
+        Tests the stages of `Sessionise.assign_sessions` are recorded.
+        """
+        df = pd.DataFrame({
+            'date': [datetime(2018, 1, 1, 10, 10),
+                     datetime(2018, 1, 1, 10, 15),
+                     datetime(2018, 1, 1, 11, 55)],
+            'unique_id': ['id1', 'id1', 'id2'],
+        })
+        profiler = Profiler(track_memory=False)
+        Sessionise(df, 'unique_id', 'date',
+                   profiler=profiler).assign_sessions()
+        summary = profiler.as_dict()
+        self.assertEqual(summary['_add_session_boundaries']['n_items'], 3)
+        self.assertEqual(summary['assign_session_ids']['n_items'], 3)
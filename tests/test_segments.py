@@ -0,0 +1,151 @@
+"""
+Module to test markovclick.segments functions
+"""
+
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from markovclick.models import MarkovClickstream
+from markovclick.segments import SegmentedMarkovClickstream
+
+try:
+    import scipy
+except ImportError:
+    scipy = None
+
+
+class TestSegmentedMarkovClickstream(unittest.TestCase):
+    """
+    Class to test segments.SegmentedMarkovClickstream class
+    """
+
+    def setUp(self):
+        self.sessions = {
+            ('uk', 'mobile'): [['P1', 'P2', 'P3'], ['P1', 'P1']],
+            ('uk', 'desktop'): [['P2', 'P3', 'P2']],
+            ('us', 'mobile'): [['P4', 'P1', 'P2'], ['P3']],
+        }
+        rows = []
+        session_id = 0
+        for (country, device), streams in self.sessions.items():
+            for stream in streams:
+                for page in stream:
+                    rows.append((country, device, session_id, page))
+                session_id += 1
+        df = pd.DataFrame(
+            rows, columns=['country', 'device', 'session_uuid', 'page']
+        )
+        df['date'] = pd.Timestamp('2018-01-01') + pd.to_timedelta(
+            df.index, unit='m'
+        )
+        # Shuffle the clicks, so that they must be ordered by timestamp
+        self._df = df.sample(frac=1, random_state=1)
+
+    def _check_model(self, segmented):
+        self.assertEqual(segmented.pages, ['P1', 'P2', 'P3', 'P4'])
+        self.assertEqual(len(segmented.segments), 3)
+        for segment, streams in self.sessions.items():
+            expected = MarkovClickstream(streams)
+            count_matrix = segmented.segment_count_matrix(segment)
+            index = [segmented.pages.index(page) for page in expected.pages]
+            self.assertTrue(np.array_equal(
+                count_matrix[np.ix_(index, index)], expected.count_matrix
+            ))
+            self.assertEqual(count_matrix.sum(),
+                             expected.count_matrix.sum())
+            self.assertTrue(np.allclose(
+                segmented.segment_prob_matrix(segment)[np.ix_(index, index)],
+                expected.prob_matrix
+            ))
+
+    def test_dense(self):
+        """
+        Tests the dense count and probability tensors match a model fitted to
+        each segment separately.
+        """
+        segmented = SegmentedMarkovClickstream(
+            self._df, ['country', 'device'], datetime_col='date'
+        )
+        self.assertEqual(segmented.count_tensor.shape, (3, 4, 4))
+        self._check_model(segmented)
+
+    def test_null_values(self):
+        """
+        Tests clicks without a page, segment or session are dropped.
+        """
+        start = pd.Timestamp('2018-01-02')
+        nulls = pd.DataFrame({
+            'country': ['uk', 'uk', None, None, 'us'],
+            'device': ['mobile', 'mobile', 'mobile', 'mobile', 'mobile'],
+            'session_uuid': [100, 100, 101, 101, None],
+            'page': ['P1', None, 'P2', 'P3', 'P4'],
+            'date': start + pd.to_timedelta(range(5), unit='m'),
+        })
+        df = pd.concat([self._df, nulls])
+        for sparse in ([False, True] if scipy else [False]):
+            segmented = SegmentedMarkovClickstream(
+                df, ['country', 'device'], datetime_col='date', sparse=sparse
+            )
+            self._check_model(segmented)
+
+    @unittest.skipIf(scipy is None, 'scipy is not installed')
+    def test_sparse(self):
+        """
+        Tests the sparse count and probability tensors match a model fitted
+        to each segment separately.
+        """
+        segmented = SegmentedMarkovClickstream(
+            self._df, ['country', 'device'], datetime_col='date', sparse=True
+        )
+        self.assertEqual(segmented.count_tensor.shape, (12, 4))
+        self._check_model(segmented)
+
+    def test_calc_log_likelihoods(self):
+        """
+        Tests `calc_log_likelihoods` matches the probabilities of each
+        segment's model.
+        """
+        clickstreams = [['P1', 'P2'], ['P2', 'P3', 'P2'], ['P5', 'P1']]
+        for sparse in ([False, True] if scipy else [False]):
+            segmented = SegmentedMarkovClickstream(
+                self._df, ['country', 'device'], datetime_col='date',
+                sparse=sparse
+            )
+            log_likelihoods = segmented.calc_log_likelihoods(clickstreams)
+            self.assertEqual(log_likelihoods.shape, (3, 3))
+            for j, segment in enumerate(segmented.segments):
+                model = segmented.model(segment)
+                self.assertTrue(np.array_equal(
+                    log_likelihoods[:, j],
+                    model.calc_log_likelihoods(clickstreams)
+                ))
+            self.assertTrue(np.isneginf(log_likelihoods[2]).all())
+
+    def test_compare(self):
+        """
+        Tests the `compare` function
+        """
+        segmented = SegmentedMarkovClickstream(
+            self._df, ['country'], datetime_col='date'
+        )
+        self.assertEqual(segmented.segments, ['uk', 'us'])
+        same = segmented.compare('uk', 'uk')
+        self.assertTrue(np.allclose(same[:3], 0))
+        # P4 has no transitions out of it in the uk segment
+        self.assertTrue(np.isnan(same[3]))
+        distance = segmented.compare('uk', 'us')
+        self.assertEqual(distance.shape, (4,))
+        # Only P1 has transitions out of it in both segments
+        self.assertTrue(np.isnan(distance[1:]).all())
+        self.assertAlmostEqual(distance[0], 0.5)
+        divergence = segmented.compare('uk', 'us', metric='js')
+        # P1 goes to P1 or P2 in the uk segment, and only to P2 in the us
+        expected = 0.5 * (
+            0.5 * np.log(0.5 / 0.25) + 0.5 * np.log(0.5 / 0.75) +
+            np.log(1 / 0.75)
+        )
+        self.assertAlmostEqual(divergence[0], expected)
+        with self.assertRaises(KeyError):
+            segmented.compare('uk', 'fr')
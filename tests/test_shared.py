@@ -0,0 +1,106 @@
+"""
+Module to test markovclick.shared functions
+"""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from markovclick.models import MarkovClickstream
+from markovclick.shared import SharedModel, publish_model
+
+
+class TestShared(unittest.TestCase):
+    """
+    Class to test shared.py
+    """
+
+    def setUp(self):
+        self.model = MarkovClickstream([
+            ['P3', 'P2', 'P1'],
+            ['P3', 'P2', 'P2'],
+            ['P3', 'P1'],
+        ], start_exit=True)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_publish_model(self):
+        """
+        Tests a published model is attached to with the same probabilities,
+        memory-mapped read-only.
+        """
+        publish_model(self.model, self.directory, top_k=2)
+        shared = SharedModel(self.directory)
+        self.assertIsInstance(shared.prob_matrix, np.memmap)
+        self.assertFalse(shared.prob_matrix.flags.writeable)
+        self.assertEqual(list(shared.pages), sorted(self.model.pages))
+        self.assertEqual(list(shared.page_index(['P2', 'P4', '(exit)'])),
+                         [shared.pages.tolist().index('P2'), -1,
+                          shared.pages.tolist().index('(exit)')])
+        np.testing.assert_allclose(
+            shared.calc_transition_probs(['P3', 'P2', 'P4'],
+                                         ['P2', 'P1', 'P1']),
+            [2 / 3, 1 / 3, 0]
+        )
+        self.assertEqual(shared.top_next_pages('P3'),
+                         [('P2', 2 / 3), ('P1', 1 / 3)])
+        self.assertEqual(shared.top_next_pages('P3', k=1), [('P2', 2 / 3)])
+        self.assertEqual(
+            shared.model.calc_prob_to_page(['P3', 'P2', 'P1']),
+            self.model.calc_prob_to_page(['P3', 'P2', 'P1'])
+        )
+
+    def test_refresh(self):
+        """
+        Tests readers attach to a new version once published, and old
+        versions are deleted.
+        """
+        with self.assertRaises(FileNotFoundError):
+            SharedModel(self.directory)
+        first = publish_model(self.model, self.directory)
+        shared = SharedModel(self.directory)
+        self.assertFalse(shared.refresh())
+
+        model = MarkovClickstream([['P1', 'P4']])
+        for _ in range(3):
+            version = publish_model(model, self.directory, keep=2)
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.directory, 'versions'))), 2
+        )
+        self.assertEqual(shared.version, first)
+        self.assertTrue(shared.refresh())
+        self.assertEqual(shared.version, version)
+        self.assertEqual(shared.top_next_pages('P1'), [('P4', 1.0)])
+
+    def test_refresh_deleted_version(self):
+        """
+        Tests a reader retries when the version it read from ``CURRENT`` is
+        deleted by newer versions being published before it attaches.
+        """
+        model = MarkovClickstream([['P1', 'P4']])
+        directory = self.directory
+
+        class RacingModel(SharedModel):
+            published = []
+
+            def _load(self, version):
+                if not self.published:
+                    for _ in range(2):
+                        self.published.append(
+                            publish_model(model, directory, keep=1)
+                        )
+                return super()._load(version)
+
+        publish_model(self.model, self.directory)
+        shared = RacingModel(self.directory)
+        self.assertEqual(shared.version, RacingModel.published[-1])
+        self.assertEqual(shared.top_next_pages('P1'), [('P4', 1.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
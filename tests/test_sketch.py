@@ -0,0 +1,63 @@
+"""
+Module to test markovclick/utils/sketch.py functions
+"""
+
+
+import unittest
+
+import numpy as np
+from markovclick.utils.sketch import CountMinSketch, heavy_hitters, page_counts
+
+
+class TestSketch(unittest.TestCase):
+    """
+    Class to test utils/sketch.py
+    """
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        # Ten frequent pages, and a long tail of pages seen about once
+        frequent = random_state.randint(0, 10, 20000)
+        rare = random_state.randint(0, 10 ** 6, 20000)
+        self.items = np.array(
+            [f'F{i}' for i in frequent] + [f'R{i}' for i in rare],
+            dtype=object
+        )
+        random_state.shuffle(self.items)
+
+    def test_count_min_sketch(self):
+        """
+        Tests estimates never undercount, and overcount by little.
+        """
+        sketch = CountMinSketch(width=2 ** 12, depth=4)
+        sketch.update(self.items[:20000])
+        sketch.update(self.items[20000:])
+        self.assertEqual(sketch.total, len(self.items))
+        counts = page_counts([self.items])
+        estimates = sketch.estimate(counts.index.to_numpy())
+        self.assertTrue((estimates >= counts.to_numpy()).all())
+        self.assertLess((estimates - counts.to_numpy()).max(),
+                        np.e * len(self.items) / 2 ** 12)
+
+    def test_heavy_hitters(self):
+        """
+        Tests the frequent items are found when reading in chunks.
+        """
+        counts = heavy_hitters(self.items, max_items=10, chunk_size=5000)
+        self.assertEqual(sorted(counts.index),
+                         [f'F{i}' for i in range(10)])
+        self.assertTrue((np.diff(counts.to_numpy()) <= 0).all())
+        counts = heavy_hitters(self.items, min_count=100, chunk_size=5000)
+        self.assertEqual(len(counts), 10)
+
+    def test_page_counts(self):
+        """
+        Tests exact counts are sorted by count, then by page.
+        """
+        counts = page_counts([['P2', 'P1'], ['P3', 'P1', 'P2'], ['P4']])
+        self.assertEqual(list(counts.index), ['P1', 'P2', 'P3', 'P4'])
+        self.assertEqual(list(counts), [2, 2, 1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
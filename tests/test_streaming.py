@@ -0,0 +1,179 @@
+"""
+Module to test markovclick.streaming functions
+"""
+
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from markovclick.dummy import gen_random_clickstream
+from markovclick.models import MarkovClickstream
+from markovclick.streaming import IncrementalSessionScorer
+
+
+class TestStreaming(unittest.TestCase):
+    """
+    Class to test streaming.py
+    """
+
+    def setUp(self):
+        self.model = MarkovClickstream([
+            ['P1', 'P2', 'P3'],
+            ['P1', 'P2', 'P2'],
+            ['P1', 'P3'],
+        ])
+
+    def test_update(self):
+        """
+        Tests each click is scored against the previous page of its session,
+        and sessions are broken after the timeout.
+        """
+        scorer = IncrementalSessionScorer(self.model, session_timeout=1)
+        self.assertEqual(scorer.update('a', 'P1', 0), 0)
+        self.assertAlmostEqual(scorer.update('b', 'P1', 1), 0)
+        self.assertAlmostEqual(scorer.update('a', 'P2', 2), -np.log(2 / 3))
+        self.assertAlmostEqual(scorer.update('a', 'P3', 3), -np.log(1 / 2))
+        self.assertEqual(scorer.update('b', 'P4', 4), np.inf)
+
+        scores = scorer.scores()
+        self.assertEqual(scores.loc['a', 'n_clicks'], 3)
+        self.assertAlmostEqual(scores.loc['a', 'log_likelihood'],
+                               np.log(1 / 3))
+        self.assertAlmostEqual(scores.loc['a', 'mean_surprise'],
+                               -np.log(1 / 3) / 2)
+
+        # More than a minute later, 'a' starts a new session
+        self.assertEqual(scorer.update('a', 'P3', 64), 0)
+        self.assertEqual(scorer.scores().loc['a', 'n_clicks'], 1)
+        # The restarted session of 'a' ends, as well as the idle 'b'
+        ended = scorer.evict(100)
+        self.assertEqual(list(ended.index), ['a', 'b'])
+        self.assertEqual(list(ended['n_clicks']), [3, 2])
+        self.assertAlmostEqual(ended.loc['a', 'log_likelihood'],
+                               np.log(1 / 3))
+        self.assertEqual(len(scorer), 1)
+        self.assertEqual(len(scorer.evict(100)), 0)
+
+        start_exit = MarkovClickstream(
+            [['P1', 'P2'], ['P1', 'P3']], start_exit=True
+        )
+        scorer = IncrementalSessionScorer(start_exit, min_prob=1e-3)
+        self.assertAlmostEqual(scorer.update('a', 'P1', 0), 0)
+        self.assertAlmostEqual(scorer.update('b', 'P2', 0), -np.log(1e-3))
+
+    def test_update_batch(self):
+        """
+        Tests scoring in batches gives the same results as scoring one click
+        at a time, as the arrays grow and slots are reused.
+        """
+        random_state = np.random.RandomState(0)
+        model = MarkovClickstream(gen_random_clickstream(50, 6),
+                                  start_exit=True)
+        n_clicks = 2000
+        session_ids = random_state.randint(0, 100, n_clicks)
+        pages = np.array(model.pages[:6] + ['P99'])[
+            random_state.randint(0, 7, n_clicks)
+        ]
+        timestamps = np.cumsum(random_state.exponential(20, n_clicks))
+
+        single = IncrementalSessionScorer(model, session_timeout=10,
+                                          min_prob=1e-4, capacity=4)
+        batch = IncrementalSessionScorer(model, session_timeout=10,
+                                         min_prob=1e-4, capacity=4)
+        expected = [single.update(*click)
+                    for click in zip(session_ids, pages, timestamps)]
+        surprise = np.concatenate([
+            batch.update_batch(session_ids[i:i + 300], pages[i:i + 300],
+                               timestamps[i:i + 300])
+            for i in range(0, n_clicks, 300)
+        ])
+        np.testing.assert_allclose(surprise, expected)
+
+        # Each session ends once, although the order sessions end in may
+        # differ between the two
+        ended = [
+            pd.concat([scorer.evict(timestamps[-1]), scorer.scores()])
+            .reset_index().sort_values(['session_id', 'last_seen'])
+            .reset_index(drop=True)
+            for scorer in [single, batch]
+        ]
+        pd.testing.assert_frame_equal(*ended)
+        self.assertEqual(ended[0]['n_clicks'].sum(), n_clicks)
+
+    def test_update_batch_evicts_batch_sessions(self):
+        """
+        Tests sessions of a batch evicted to make room get a slot again.
+        """
+        scorer = IncrementalSessionScorer(self.model, session_timeout=1,
+                                          capacity=2)
+        scorer.update_batch(['x', 'y'], ['P1', 'P2'], [0, 0])
+        surprise = scorer.update_batch(['x', 'y', 'z'], ['P2', 'P1', 'P1'],
+                                       [1000] * 3)
+        np.testing.assert_allclose(surprise, [0, 0, 0])
+        self.assertEqual(len(scorer), 3)
+        self.assertEqual(list(scorer.evict(1000).index), ['x', 'y'])
+
+    def test_update_batch_interleaved(self):
+        """
+        Tests scoring in batches matches scoring one click at a time on
+        interleaved streams which repeatedly fill a small capacity, with
+        idle sessions evicted and later returning.
+        """
+        random_state = np.random.RandomState(1)
+        model = MarkovClickstream(gen_random_clickstream(50, 5))
+        n_clicks = 3000
+        session_ids = random_state.randint(0, 40, n_clicks)
+        pages = np.array(model.pages)[
+            random_state.randint(0, len(model.pages), n_clicks)
+        ]
+        # Bursts of clicks separated by gaps longer than the timeout
+        gaps = np.where(random_state.rand(n_clicks) < 0.02, 200, 1)
+        timestamps = np.cumsum(gaps).astype(float)
+
+        single = IncrementalSessionScorer(model, session_timeout=1,
+                                          min_prob=1e-4, capacity=2)
+        batch = IncrementalSessionScorer(model, session_timeout=1,
+                                         min_prob=1e-4, capacity=2)
+        expected = [single.update(*click)
+                    for click in zip(session_ids, pages, timestamps)]
+        surprise = []
+        start = 0
+        while start < n_clicks:
+            end = start + random_state.randint(1, 50)
+            surprise.extend(batch.update_batch(
+                session_ids[start:end], pages[start:end],
+                timestamps[start:end]
+            ))
+            start = end
+        np.testing.assert_allclose(surprise, expected)
+        self.assertLessEqual(batch.capacity, 128)
+
+        ended = [
+            scorer.evict(timestamps[-1] + 100).reset_index().sort_values(['session_id', 'last_seen'])
+            .reset_index(drop=True)
+            for scorer in [single, batch]
+        ]
+        pd.testing.assert_frame_equal(*ended)
+        self.assertEqual(ended[0]['n_clicks'].sum(), n_clicks)
+
+    def test_update_batch_capacity(self):
+        """
+        Tests sessions still live at their own clicks in a batch are not
+        evicted to make room for sessions with later clicks.
+        """
+        single = IncrementalSessionScorer(self.model, capacity=1)
+        batch = IncrementalSessionScorer(self.model, capacity=1)
+        single.update('a', 'P1', 0)
+        batch.update('a', 'P1', 0)
+        expected = [single.update('a', 'P2', 60),
+                    single.update('b', 'P1', 2000)]
+        np.testing.assert_allclose(
+            batch.update_batch(['a', 'b'], ['P2', 'P1'], [60, 2000]),
+            expected
+        )
+        self.assertAlmostEqual(expected[0], -np.log(2 / 3))
+
+
+if __name__ == '__main__':
+    unittest.main()